@@ -1,7 +1,7 @@
 // src/lib/api.ts
 import { get } from 'svelte/store';
 import { accessToken } from './auth';
-import { videoStatus, statusHistory, resetStores } from './stores';
+import { videoStatus, statusHistory, partialOutput, resetStores } from './stores';
 
 async function getHeaders() {
     const token = typeof window !== 'undefined' ? localStorage.getItem('accessToken') : null;
@@ -60,6 +60,15 @@ export function listenForUpdates(videoId: string) {
     }
   };
 
+  es.addEventListener('partial', (e) => {
+    try {
+      const data = JSON.parse((e as MessageEvent).data);
+      partialOutput.update(current => ({ ...current, [data.field]: data.text }));
+    } catch (err) {
+      console.error('Failed to parse partial output', err);
+    }
+  });
+
   es.addEventListener('error', (e) => {
     // This listener handles custom 'error' events from the server, not connection errors.
     console.error('Received error from server:', e);
@@ -100,6 +109,37 @@ export async function retriggerStage(videoId: string, stage: string): Promise<vo
   }
 }
 
+export async function resolveDuplicate(videoId: string, action: 'reuse' | 'process'): Promise<void> {
+  const res = await fetch(`/api/video/${videoId}/duplicate`, {
+    method: 'POST',
+    headers: await getHeaders(),
+    body: JSON.stringify({ action })
+  });
+
+  const responseBody = await res.json().catch(() => ({}));
+  if (!res.ok) {
+    throw new Error(responseBody.detail || `Failed to resolve the duplicate. (Status: ${res.status})`);
+  }
+}
+
+export async function regenerateFields(
+  videoId: string,
+  target: 'structured_data' | 'marketing_copy',
+  fields: string[]
+): Promise<Record<string, any>> {
+  const res = await fetch(`/api/video/${videoId}/regenerate-fields`, {
+    method: 'POST',
+    headers: await getHeaders(),
+    body: JSON.stringify({ target, fields })
+  });
+
+  const responseBody = await res.json().catch(() => ({}));
+  if (!res.ok) {
+    throw new Error(responseBody.detail || `Failed to regenerate ${fields.join(', ')}. (Status: ${res.status})`);
+  }
+  return responseBody.updated;
+}
+
 export async function checkYouTubeConnection(): Promise<{ isConnected: boolean; email?: string }> {
     const token = localStorage.getItem('accessToken');
     if (!token) throw new Error("Not authenticated");
@@ -197,17 +237,141 @@ export async function generateNewPrompts(videoId: string, context: string): Prom
     return data.prompts || [];
 }
 
-export async function generateOnDemandImage(videoId: string, prompt: string, modelName: string | null): Promise<any> {
-    const res = await fetch(`/api/video/${videoId}/generate-image`, {
+/**
+ * Follows a background job (see /api/jobs) until it finishes and resolves
+ * with its result. Progress updates are passed to `onProgress`. Falls back to
+ * polling if the event stream drops.
+ */
+export function waitForJob(jobId: string, onProgress?: (progress: number, message: string) => void): Promise<any> {
+    return new Promise((resolve, reject) => {
+        const token = get(accessToken);
+        let job: any = {};
+
+        const finish = (latest: any): boolean => {
+            job = { ...job, ...latest };
+            if (onProgress && job.progress !== undefined) {
+                onProgress(job.progress, job.message);
+            }
+            if (job.status === 'succeeded') {
+                resolve(job.result);
+                return true;
+            }
+            if (job.status === 'failed') {
+                reject(new Error(job.error?.detail || 'The job failed.'));
+                return true;
+            }
+            return false;
+        };
+
+        const poll = async () => {
+            try {
+                const res = await fetch(`/api/jobs/${jobId}`, { headers: await getHeaders() });
+                if (!res.ok) {
+                    const err = await res.json().catch(() => ({}));
+                    throw new Error(err.detail || `Failed to fetch job status. (Status: ${res.status})`);
+                }
+                if (!finish(await res.json())) {
+                    setTimeout(poll, 2000);
+                }
+            } catch (err) {
+                reject(err);
+            }
+        };
+
+        const query = token ? `?token=${encodeURIComponent(token)}` : '';
+        const es = new EventSource(`/api/jobs/${jobId}/events${query}`);
+        es.onmessage = (e) => {
+            try {
+                if (finish(JSON.parse(e.data))) {
+                    es.close();
+                }
+            } catch (err) {
+                console.error('Failed to parse job update', err);
+            }
+        };
+        es.addEventListener('error', (e) => {
+            // Either an error event from the server or a dropped connection.
+            es.close();
+            const data = (e as MessageEvent).data;
+            if (data) {
+                try {
+                    reject(new Error(JSON.parse(data).message));
+                    return;
+                } catch (err) {
+                    // Not a server message; fall through to polling.
+                }
+            }
+            if (job.status !== 'succeeded' && job.status !== 'failed') {
+                poll();
+            }
+        });
+    });
+}
+
+async function submitJob(url: string, body: any, fallbackError: string, onProgress?: (progress: number, message: string) => void): Promise<any> {
+    const res = await fetch(url, {
+        method: 'POST',
+        headers: await getHeaders(),
+        body: JSON.stringify(body)
+    });
+
+    if (!res.ok) {
+        const err = await res.json().catch(() => ({}));
+        throw new Error(err.detail || err.message || fallbackError);
+    }
+    const job = await res.json();
+    return await waitForJob(job.job_id, onProgress);
+}
+
+export async function generateOnDemandImage(videoId: string, prompt: string, modelName: string | null, newVariation: boolean = false, onProgress?: (progress: number, message: string) => void): Promise<any> {
+    return await submitJob(
+        `/api/video/${videoId}/generate-image`,
+        { prompt, model_name: modelName, new_variation: newVariation },
+        'Failed to generate image',
+        onProgress
+    );
+}
+
+export async function createClip(videoId: string, startTime: number, endTime: number, shortIndex: number, onProgress?: (progress: number, message: string) => void): Promise<string> {
+    const result = await submitJob(
+        `/api/video/${videoId}/create-clip`,
+        { start_time: startTime, end_time: endTime, short_index: shortIndex },
+        'Failed to generate clip',
+        onProgress
+    );
+    return result.clip_url;
+}
+
+export async function getThumbnailTemplates(): Promise<any> {
+    const res = await fetch('/api/thumbnail-templates', {
+        headers: await getHeaders()
+    });
+    if (!res.ok) {
+        throw new Error(`Failed to fetch thumbnail templates: ${res.statusText}`);
+    }
+    return await res.json();
+}
+
+export async function compositeThumbnail(videoId: string, sourceGcsUri: string, template: string | null, title: string | null = null): Promise<any> {
+    const res = await fetch(`/api/video/${videoId}/composite-thumbnail`, {
         method: 'POST',
         headers: await getHeaders(),
-        body: JSON.stringify({ prompt, model_name: modelName })
+        body: JSON.stringify({ source_gcs_uri: sourceGcsUri, template, title })
     });
 
     if (!res.ok) {
-        const err = await res.json().catch(() => ({ detail: 'Failed to generate image' }));
+        const err = await res.json().catch(() => ({ detail: 'Failed to composite thumbnail' }));
         throw new Error(err.detail);
     }
     return await res.json();
 }
 
+export async function getQuota(): Promise<any> {
+    const res = await fetch('/api/quota', {
+        headers: await getHeaders()
+    });
+    if (!res.ok) {
+        throw new Error(`Failed to fetch quota: ${res.statusText}`);
+    }
+    return await res.json();
+}
@@ -13,6 +13,12 @@ export const videoStatus = writable<any>(null);
  */
 export const statusHistory = writable<any[]>([]);
 
+/**
+ * Stores partial LLM output streamed for the active video, keyed by field
+ * (e.g. "summary", "email_newsletter"). Each value is the full text so far.
+ */
+export const partialOutput = writable<Record<string, string>>({});
+
 export const user = writable<any>(null);
 
 /**
@@ -22,5 +28,6 @@ export const user = writable<any>(null);
 export function resetStores() {
     videoStatus.set(null);
     statusHistory.set([]);
+    partialOutput.set({});
     user.set(null);
 } 
\ No newline at end of file
@@ -5,6 +5,30 @@ from google.cloud import storage
 from ..event_bus import event_bus
 from ..events import TranscriptReady, ContentAnalysisComplete
 from ..database import db
+from ..llm.generation import generate_content
+from ..llm.routing import model_router, estimate_tokens
+from ..llm.structured import parse_structured
+from ..transcript_index import TranscriptIndex
+from ..models.content import StructuredData, STRUCTURED_DATA_SCHEMA, field_subset, schema_subset
+
+# What the model is asked to produce for each `structured_data` field. The full
+# analysis uses all of them; field-level regeneration uses only the requested ones.
+ANALYSIS_FIELD_SPECS = {
+    "key_themes": ["A list of 3-5 main topics or ideas discussed in the video."],
+    "summary": "A concise, one-paragraph summary of the video's content.",
+    "bullet_summary": ["A detailed summary of the video's content, presented as a list of strings (bullet points)."],
+    "meaningful_quotes": ["A list of 2-4 impactful, shareable quotes from the transcript."],
+    "call_to_action": "Identify the primary call to action or the main takeaway message for the audience.",
+    "shorts_candidates": [
+        {
+            "suggested_title": "The Single Biggest Mistake Programmers Make",
+            "start_time": 45.3,
+            "end_time": 92.1,
+            "reason": "This segment has a very strong, controversial hook and presents a clear, common problem that will resonate with the target audience.",
+            "transcript_snippet": "The biggest mistake that I see programmers make is..."
+        }
+    ],
+}
 
 class AnalysisAgent:
     """
@@ -14,7 +38,7 @@ class AnalysisAgent:
 
     def __init__(self, api_key: str, bucket_name: str, model_name: str):
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel(model_name=model_name)
+        self.model_name = model_name
         self.storage_client = storage.Client()
         self.bucket_name = bucket_name
         event_bus.subscribe(TranscriptReady, self.handle_transcript_ready)
@@ -55,43 +79,28 @@ class AnalysisAgent:
                 return
 
             # 1. Get transcript from GCS
-            transcript_gcs_uri = video_data.get("transcript_gcs_uri")
-            
-            if not transcript_gcs_uri:
-                raise ValueError("Transcript GCS URI not found in Firestore document.")
-            
             await self._update_status(video_doc_ref, "analyzing", f"Downloading transcript from GCS...")
-            
-            print(f"   Downloading transcript from: {transcript_gcs_uri}")
-            bucket = self.storage_client.bucket(self.bucket_name)
-            blob = bucket.blob(transcript_gcs_uri.replace(f"gs://{self.bucket_name}/", ""))
-            
-            # The transcript is now a JSON object
-            transcript_json_string = await asyncio.to_thread(blob.download_as_text)
-            transcript_data = json.loads(transcript_json_string)
-
-            # 2. Analyze with Gemini
-            await self._update_status(video_doc_ref, "analyzing", "Generating insights with Gemini...")
-            print("   Analyzing transcript with Gemini 1.5 Pro for shorts candidates...")
-            prompt = self._build_prompt(transcript_data)
-            response = await self.model.generate_content_async(
-                prompt,
-                generation_config=genai.types.GenerationConfig(response_mime_type="application/json")
+            transcript_data = await self._download_transcript(video_data)
+
+            # 2. Analyze with Gemini. Backfilled videos wait for the next batch job.
+            batch = video_data.get("execution_mode") == "batch"
+            await self._update_status(
+                video_doc_ref, "analyzing",
+                "Queued for batch analysis with Gemini..." if batch else "Generating insights with Gemini..."
+            )
+            analysis_results = await self._generate(
+                event.video_id, transcript_data, list(ANALYSIS_FIELD_SPECS),
+                batch=batch, highlight_windows=video_data.get("highlight_windows"),
             )
-            analysis_results = json.loads(response.text)
             print("   Analysis complete.")
 
             # 3. Save analysis to GCS
-            analysis_filename = f"{event.video_id}_analysis.json"
-            analysis_path_gcs = f"analyses/{analysis_filename}"
-            analysis_blob = bucket.blob(analysis_path_gcs)
-            await asyncio.to_thread(analysis_blob.upload_from_string, json.dumps(analysis_results, indent=2), 'application/json')
-            print(f"   Analysis saved to GCS: gs://{self.bucket_name}/{analysis_path_gcs}")
+            analysis_gcs_uri = await self._save_analysis_to_gcs(event.video_id, analysis_results)
 
             # 4. Save GCS URI and structured data to Firestore
             # The entire analysis result, including shorts_candidates, is saved.
             await video_doc_ref.update({
-                "analysis_gcs_uri": f"gs://{self.bucket_name}/{analysis_path_gcs}",
+                "analysis_gcs_uri": analysis_gcs_uri,
                 "structured_data": analysis_results,
                 "status": "analyzed",
                 "status_message": "Analysis complete. Content insights created."
@@ -110,11 +119,116 @@ class AnalysisAgent:
             print(f"❌ AnalysisAgent Error: {e}")
             await self._update_status(video_doc_ref, "analyzing_failed", "Failed to analyze content.", {"error": str(e)})
 
-    def _build_prompt(self, transcript_data: dict) -> str:
+    async def regenerate_fields(self, video_id: str, fields: list[str]) -> dict:
+        """
+        Regenerates only the given `structured_data` fields and merges them into
+        the existing analysis with field-path updates. Returns the new values.
+        """
+        if unknown := [name for name in fields if name not in ANALYSIS_FIELD_SPECS]:
+            raise ValueError(f"Unknown analysis fields: {', '.join(unknown)}")
+        print(f"🧠 AnalysisAgent: Regenerating fields {fields} for: {video_id}")
+        video_doc_ref = db.collection("videos").document(video_id)
+        doc = await video_doc_ref.get()
+        video_data = doc.to_dict()
+        if not video_data.get("structured_data"):
+            raise ValueError("Content analysis not found. Run the analysis stage first.")
+
+        transcript_data = await self._download_transcript(video_data)
+        new_values = await self._generate(
+            video_id, transcript_data, fields, highlight_windows=video_data.get("highlight_windows")
+        )
+
+        await video_doc_ref.update({f"structured_data.{name}": value for name, value in new_values.items()})
+        await self._save_analysis_to_gcs(video_id, {**video_data["structured_data"], **new_values})
+        print(f"   Regenerated and merged {len(new_values)} analysis field(s).")
+        return new_values
+
+    async def _download_transcript(self, video_data: dict) -> dict:
+        transcript_gcs_uri = video_data.get("transcript_gcs_uri")
+        if not transcript_gcs_uri:
+            raise ValueError("Transcript GCS URI not found in Firestore document.")
+
+        print(f"   Downloading transcript from: {transcript_gcs_uri}")
+        bucket = self.storage_client.bucket(self.bucket_name)
+        blob = bucket.blob(transcript_gcs_uri.replace(f"gs://{self.bucket_name}/", ""))
+
+        # The transcript is now a JSON object
+        transcript_json_string = await asyncio.to_thread(blob.download_as_text)
+        return json.loads(transcript_json_string)
+
+    async def _save_analysis_to_gcs(self, video_id: str, analysis_results: dict) -> str:
+        analysis_path_gcs = f"analyses/{video_id}_analysis.json"
+        analysis_blob = self.storage_client.bucket(self.bucket_name).blob(analysis_path_gcs)
+        await asyncio.to_thread(analysis_blob.upload_from_string, json.dumps(analysis_results, indent=2), 'application/json')
+        print(f"   Analysis saved to GCS: gs://{self.bucket_name}/{analysis_path_gcs}")
+        return f"gs://{self.bucket_name}/{analysis_path_gcs}"
+
+    async def _generate(
+        self,
+        video_id: str,
+        transcript_data: dict,
+        fields: list[str],
+        batch: bool = False,
+        highlight_windows: list = None,
+    ) -> dict:
+        """Generates the given `structured_data` fields with Gemini and validates them."""
+        # With pre-ranked highlight windows and timed segments, shorts candidates are
+        # chosen from the shortlist in a separate, much smaller call.
+        if "shorts_candidates" in fields and highlight_windows and transcript_data.get("segments"):
+            shorts_prompt = self._build_highlights_prompt(transcript_data["segments"], highlight_windows)
+            shorts_call = self._run_prompt(video_id, shorts_prompt, ["shorts_candidates"], batch)
+            other_fields = [name for name in fields if name != "shorts_candidates"]
+            if other_fields:
+                results, shorts = await asyncio.gather(
+                    self._run_prompt(video_id, self._build_prompt(transcript_data, other_fields), other_fields, batch),
+                    shorts_call,
+                )
+                results = {**results, **shorts}
+            else:
+                results = await shorts_call
+        else:
+            results = await self._run_prompt(video_id, self._build_prompt(transcript_data, fields), fields, batch)
+
+        if results.get("shorts_candidates") and transcript_data.get("segments"):
+            self._snap_shorts(results["shorts_candidates"], TranscriptIndex.from_segments(transcript_data["segments"]))
+        return results
+
+    def _snap_shorts(self, shorts_candidates: list[dict], index: TranscriptIndex):
+        """Snaps each candidate to sentence edges and replaces its snippet with the exact transcript text."""
+        for candidate in shorts_candidates:
+            start, end = index.snap(candidate["start_time"], candidate["end_time"])
+            excerpt = index.query(start, end)
+            if excerpt["text"]:
+                candidate["start_time"], candidate["end_time"] = start, end
+                candidate["transcript_snippet"] = excerpt["text"]
+
+    async def _run_prompt(self, video_id: str, prompt: str, fields: list[str], batch: bool = False) -> dict:
+        schema = StructuredData if set(fields) == set(ANALYSIS_FIELD_SPECS) else field_subset(StructuredData, fields)
+        input_tokens = estimate_tokens(prompt)
+        model_name = model_router.choose("analysis", input_tokens, self.model_name)
+        print(f"   Analyzing transcript with {model_name} for: {', '.join(fields)}")
+        response = await generate_content(
+            model_name,
+            prompt,
+            stage="analysis",
+            input_tokens=input_tokens,
+            generation_config=genai.types.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=schema_subset(STRUCTURED_DATA_SCHEMA, fields),
+            ),
+            video_id=video_id,
+            stream_fields=[field for field in ("summary",) if field in fields],
+            batch=batch,
+        )
+        return parse_structured(response.text, schema, model_name).model_dump()
+
+    def _build_prompt(self, transcript_data: dict, fields: list[str]) -> str:
         # We now pass the full transcript text to the prompt
         full_transcript = transcript_data.get("full_transcript", "")
+        field_specs = json.dumps({name: ANALYSIS_FIELD_SPECS[name] for name in fields}, indent=4, ensure_ascii=False)
 
-        return f"""
+        if "shorts_candidates" in fields:
+            task = """
         You are an expert social media video editor and content strategist, specializing in identifying viral moments for YouTube Shorts.
         Analyze the following video transcript to identify 3-5 segments that would make compelling, self-contained YouTube Shorts (under 60 seconds).
 
@@ -124,7 +238,12 @@ class AnalysisAgent:
         - A brief (1-2 sentence) reason explaining why this segment is a strong candidate (e.g., "Strong emotional hook," "Clear, actionable advice," "Controversial but interesting take").
         - The transcript snippet for that segment.
 
-        Your primary goal is to find "golden nuggets"—moments of high emotion, clear value, or strong hooks that can stand alone and capture attention.
+        Your primary goal is to find "golden nuggets"—moments of high emotion, clear value, or strong hooks that can stand alone and capture attention."""
+        else:
+            task = """
+        You are an expert content strategist. Analyze the following video transcript."""
+
+        return f"""{task}
 
         Here is the full video transcript:
         ---
@@ -132,20 +251,37 @@ class AnalysisAgent:
         ---
 
         Based on the transcript, generate a JSON object with the following schema:
-        {{
-            "key_themes": ["A list of 3-5 main topics or ideas discussed in the video."],
-            "summary": "A concise, one-paragraph summary of the video's content.",
-            "bullet_summary": ["A detailed summary of the video's content, presented as a list of strings (bullet points)."],
-            "meaningful_quotes": ["A list of 2-4 impactful, shareable quotes from the transcript."],
-            "call_to_action": "Identify the primary call to action or the main takeaway message for the audience.",
-            "shorts_candidates": [
-                {{
-                    "suggested_title": "The Single Biggest Mistake Programmers Make",
-                    "start_time": 45.3,
-                    "end_time": 92.1,
-                    "reason": "This segment has a very strong, controversial hook and presents a clear, common problem that will resonate with the target audience.",
-                    "transcript_snippet": "The biggest mistake that I see programmers make is..."
-                }}
-            ]
-        }}
+        {field_specs}
+        """
+
+    def _build_highlights_prompt(self, segments: list, highlight_windows: list) -> str:
+        field_specs = json.dumps({"shorts_candidates": ANALYSIS_FIELD_SPECS["shorts_candidates"]}, indent=4, ensure_ascii=False)
+        windows = []
+        for i, window in enumerate(highlight_windows, start=1):
+            excerpt = "\n".join(
+                f"[{segment['start']:.1f}s] {segment['text'].strip()}"
+                for segment in segments
+                if segment["start"] < window["end"] and segment["end"] > window["start"]
+            )
+            windows.append(
+                f"Window {i}: {window['start']:.1f}s to {window['end']:.1f}s "
+                f"(loudness {window['loudness_db']:.1f} dB, pitch variation {window['pitch_variation']:.1f} semitones, "
+                f"speech rate {window['speech_rate']:.1f} words/s, laughter/applause energy {window['reaction_energy']:.2f})\n"
+                f"{excerpt}"
+            )
+        windows_text = "\n\n".join(windows)
+
+        return f"""
+        You are an expert social media video editor and content strategist, specializing in identifying viral moments for YouTube Shorts.
+        The windows below were pre-selected from a longer video because their audio is the most animated: loud,
+        expressive, fast-paced, or followed by laughter or applause. Each comes with its timed transcript.
+
+        Pick the 3-5 windows that would make the most compelling, self-contained YouTube Shorts (under 60 seconds).
+        For each one, set the start and end time in seconds so that the clip begins and ends on the sentence boundaries
+        shown in its transcript, and give a catchy, SEO-friendly title, a brief (1-2 sentence) reason, and the transcript snippet.
+
+        {windows_text}
+
+        Generate a JSON object with the following schema:
+        {field_specs}
         """ 
\ No newline at end of file
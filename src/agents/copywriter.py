@@ -1,11 +1,36 @@
 import json
 import asyncio
+import os
 import google.generativeai as genai
 from google.cloud import storage, firestore
 
 from ..event_bus import event_bus
 from ..events import ContentAnalysisComplete, CopyReady
 from ..database import db
+from ..llm.generation import generate_content
+from ..llm.routing import model_router, estimate_tokens
+from ..llm.structured import parse_structured, StructuredOutputError
+from ..models.content import MarketingCopy, MARKETING_COPY_SCHEMA, field_subset, schema_subset
+
+# What the model is asked to write for each copy asset.
+COPY_FIELD_SPECS = {
+    "facebook_post": "A post for Facebook or Instagram. Start with a strong hook, elaborate on the video's main themes, and encourage discussion. Use relevant hashtags.",
+    "email_newsletter": "A complete email newsletter in Markdown. It must follow this exact structure: A short title, followed by '## Do you ever find yourself...' and an opening question. Then a brief reflection. A horizontal rule (---). '### ✨ In our latest video, we dive into a powerful idea:'. A blockquote with the core teaching. A sentence explaining what the video is NOT about, and then a sentence explaining what it IS about. A sentence describing the video's central metaphor. Another horizontal rule. A section titled '### 🔍 Here's a glimpse of what you'll explore:'. A list of the key takeaways from the ANALYSIS, each bolded and followed by its description on a new line. A final horizontal rule. A concluding sentence starting with 'If you're ready to...'. And finally, a link formatted as '👉 [**Watch Now**](#)'.",
+    "substack_article": "A complete Substack article in Markdown of approximately 400 words. The article must start with a compelling hook to draw the reader in. It should then expand on the video's lessons in a thoughtful blog post. Conclude the article with 3-5 journal prompts that help the reader personalize and apply the content to their own life.",
+}
+
+# The analysis fields each asset is written from, and whether it needs the full
+# transcript. Prompts carry only the union of what the requested assets need.
+COPY_FIELD_CONTEXT = {
+    "facebook_post": {"analysis": ["summary", "key_themes", "meaningful_quotes", "call_to_action"], "transcript": False},
+    "email_newsletter": {"analysis": ["summary", "key_themes", "bullet_summary", "call_to_action"], "transcript": False},
+    "substack_article": {"analysis": ["summary", "key_themes", "bullet_summary", "meaningful_quotes", "call_to_action"], "transcript": True},
+}
+
+# CopyReady fires once these assets are saved; the rest may finish (or fail) later.
+REQUIRED_COPY_ASSETS = [
+    name.strip() for name in os.getenv("COPY_REQUIRED_ASSETS", "facebook_post,email_newsletter").split(",") if name.strip()
+]
 
 class CopywriterAgent:
     """
@@ -15,7 +40,7 @@ class CopywriterAgent:
 
     def __init__(self, api_key: str, bucket_name: str, model_name: str):
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel(model_name=model_name)
+        self.model_name = model_name
         self.storage_client = storage.Client()
         self.bucket_name = bucket_name
         event_bus.subscribe(ContentAnalysisComplete, self.handle_analysis_complete)
@@ -54,107 +79,174 @@ class CopywriterAgent:
                 await event_bus.publish(copy_ready_event)
                 return
 
-            # 2. Fetch the full transcript from GCS
-            transcript_gcs_uri = video_data.get("transcript_gcs_uri")
-            if not transcript_gcs_uri:
-                raise ValueError("Transcript GCS URI not found in Firestore document.")
-            
-            await self._update_status(video_doc_ref, "generating_copy", "Downloading full transcript for context...")
-            
-            print(f"   Downloading transcript from: {transcript_gcs_uri}")
-            bucket = self.storage_client.bucket(self.bucket_name)
-            blob = bucket.blob(transcript_gcs_uri.replace(f"gs://{self.bucket_name}/", ""))
-            transcript_text = await asyncio.to_thread(blob.download_as_text)
-
-            # 3. Generate Copy with Gemini
-            await self._update_status(video_doc_ref, "generating_copy", "Writing copy with Gemini...")
-            print(f"   Generating marketing copy with {self.model.model_name}...")
-            prompt = self._build_prompt(event.structured_data, transcript_text)
-            response = await self.model.generate_content_async(
-                prompt,
-                generation_config=genai.types.GenerationConfig(response_mime_type="application/json")
+            # 2. Fetch the full transcript from GCS, if any asset is written from it
+            transcript_text = None
+            if any(context["transcript"] for context in COPY_FIELD_CONTEXT.values()):
+                await self._update_status(video_doc_ref, "generating_copy", "Downloading full transcript for context...")
+                transcript_text = await self._download_transcript(video_data)
+
+            # 3. Generate each asset concurrently with Gemini. Each one is saved as
+            # soon as it arrives, and CopyReady fires once the required ones are in.
+            # Backfilled videos wait for the next batch job.
+            batch = video_data.get("execution_mode") == "batch"
+            await self._update_status(
+                video_doc_ref, "generating_copy",
+                "Queued for batch copywriting with Gemini..." if batch else "Writing copy with Gemini..."
             )
-            
-            # --- Start Debug Logging ---
-            print("--- RAW GEMINI RESPONSE ---")
-            print(response.text)
-            print("--- END RAW GEMINI RESPONSE ---")
-            # --- End Debug Logging ---
-
-            copy_assets = json.loads(response.text)
-            print("   Marketing copy generated.")
-
-            # 4. Extract and save the Substack article BEFORE general cleanup
-            # to preserve its Markdown formatting (e.g., newlines).
-            substack_article_content = copy_assets.pop('substack_article', None)
-            substack_gcs_uri = None
-            substack_hook = None
-            
-            # --- Clean up the generated copy ---
-            # The model may return strings with escaped newlines (\\n) or other artifacts.
-            # We'll clean these up for better display on the frontend.
-            for key, value in copy_assets.items():
-                if isinstance(value, str):
-                    # Replace escaped newlines with HTML line breaks and remove extra backslashes
-                    copy_assets[key] = value.replace('\\n', '<br>').replace('\\', '')
-            
-            if substack_article_content:
-                # Now, process the pristine Substack article
-                article_filename = f"{event.video_id}_substack.md"
-                article_path_gcs = f"substack_posts/{article_filename}"
-                article_blob = bucket.blob(article_path_gcs)
-                await asyncio.to_thread(
-                    article_blob.upload_from_string, substack_article_content, 'text/markdown'
-                )
-                substack_gcs_uri = f"gs://{self.bucket_name}/{article_path_gcs}"
-                # Extract the first line as the hook, splitting on the literal \n
-                substack_hook = substack_article_content.split('\n')[0].strip()
-                print(f"   Substack article saved to GCS: {substack_gcs_uri}")
-
-            # 5. Save the rest of the copy and the new URI to Firestore
-            update_data = {
-                "marketing_copy": copy_assets, # Now without the Substack article
-                "status": "copy_generated",
-                "status_message": "Marketing copy created and saved."
+            tasks = {
+                asyncio.create_task(
+                    self._generate_asset(video_doc_ref, event.video_id, event.structured_data, transcript_text, name, batch)
+                ): name
+                for name in COPY_FIELD_SPECS
             }
-            if substack_gcs_uri:
-                update_data["substack_gcs_uri"] = substack_gcs_uri
-            if substack_hook:
-                update_data["substack_hook"] = substack_hook
+            completed, errors = [], {}
+            copy_ready = False
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = tasks[task]
+                    if task.exception() is not None:
+                        print(f"   ⚠️ Failed to generate {name}: {task.exception()}")
+                        errors[name] = task.exception()
+                        continue
+                    completed.append(name)
+
+                failed_required = [name for name in REQUIRED_COPY_ASSETS if name in errors]
+                if failed_required:
+                    for task in pending:
+                        task.cancel()
+                    raise errors[failed_required[0]]
 
-            await video_doc_ref.update(update_data)
+                if not copy_ready and all(name in completed for name in REQUIRED_COPY_ASSETS):
+                    # 4. Publish event for next agents while optional assets finish
+                    copy_ready = True
+                    await self._update_status(video_doc_ref, "copy_generated", "Marketing copy created and saved.")
+                    print("   Required marketing copy saved to Firestore.")
+                    copy_ready_task = asyncio.create_task(event_bus.publish(CopyReady(
+                        video_id=event.video_id,
+                        video_title=event.video_title,
+                    )))
+                elif not copy_ready and completed:
+                    await self._update_status(
+                        video_doc_ref, "generating_copy",
+                        f"Copy ready: {', '.join(completed)} ({len(completed)}/{len(COPY_FIELD_SPECS)})."
+                    )
+
+            if not copy_ready:
+                raise RuntimeError("None of the marketing copy assets could be generated.")
+            if errors:
+                # Only optional assets failed; record them without failing the stage.
+                await video_doc_ref.update({f"copy_errors.{name}": str(error) for name, error in errors.items()})
             print("   Marketing copy and artifacts saved to Firestore.")
+            await copy_ready_task
 
-            # 6. Publish event for next agents
-            copy_ready_event = CopyReady(
-                video_id=event.video_id,
-                video_title=event.video_title,
-            )
-            await event_bus.publish(copy_ready_event)
-
-        except json.JSONDecodeError as e:
-            print("--- FAILED TO PARSE JSON ---")
-            print(f"Error: {e}")
-            print("--- Raw response was: ---")
-            # It's already been printed above, but we can print it again in the error context
-            print(response.text if 'response' in locals() else "Response not available")
-            print("--------------------------")
-            # Re-raise or handle as a failed status
+        except StructuredOutputError as e:
+            print(f"❌ CopywriterAgent: Could not parse marketing copy: {e}")
             await self._update_status(video_doc_ref, "generating_copy_failed", "Failed to parse marketing copy from AI.", {"error": str(e)})
 
         except Exception as e:
             print(f"❌ CopywriterAgent Error: {e}")
             await self._update_status(video_doc_ref, "generating_copy_failed", "Failed to generate marketing copy.", {"error": str(e)})
 
-    def _build_prompt(self, structured_data: dict, transcript: str) -> str:
-        # Pretty print the JSON for better readability in the prompt
-        analysis_json = json.dumps(structured_data, indent=2)
+    async def regenerate_fields(self, video_id: str, fields: list[str]) -> dict:
+        """
+        Regenerates only the given copy assets and merges them into the existing
+        `marketing_copy` with field-path updates. Returns the new values.
+        """
+        print(f"✍️ CopywriterAgent: Regenerating fields {fields} for: {video_id}")
+        video_doc_ref = db.collection("videos").document(video_id)
+        doc = await video_doc_ref.get()
+        video_data = doc.to_dict()
+        structured_data = video_data.get("structured_data")
+        if not structured_data:
+            raise ValueError("Content analysis not found. Run the analysis stage first.")
 
-        return f"""
-        You are a world-class marketing copywriter and content strategist specializing in content for spiritual and personal growth brands.
-        Your task is to generate a set of marketing materials for a YouTube video based on the provided analysis and the full transcript.
+        needs_transcript = any(COPY_FIELD_CONTEXT[name]["transcript"] for name in fields if name in COPY_FIELD_CONTEXT)
+        transcript_text = await self._download_transcript(video_data) if needs_transcript else None
+        new_values = await self._generate(video_id, structured_data, transcript_text, fields)
+
+        update_data = {f"marketing_copy.{name}": value for name, value in new_values.items() if name != "substack_article"}
+        if substack_article_content := new_values.get("substack_article"):
+            update_data.update(await self._save_substack_article(video_id, substack_article_content))
+        await video_doc_ref.update(update_data)
+        print(f"   Regenerated and merged {len(new_values)} copy field(s).")
+        return new_values
+
+    async def _generate_asset(self, video_doc_ref, video_id: str, structured_data: dict, transcript: str | None, name: str, batch: bool = False) -> str:
+        """Generates one copy asset and saves it immediately."""
+        value = (await self._generate(video_id, structured_data, transcript, [name], batch))[name]
+        if name == "substack_article":
+            # The Substack article is stored in GCS as Markdown, not in Firestore.
+            update_data = await self._save_substack_article(video_id, value)
+        else:
+            update_data = {f"marketing_copy.{name}": value}
+        await video_doc_ref.update(update_data)
+        print(f"   Saved {name}.")
+        return name
 
-        First, use the ANALYSIS JSON as a creative brief to understand the core concepts.
+    async def _download_transcript(self, video_data: dict) -> str:
+        """Returns the transcript's plain text; the timestamped segments stay out of the prompts."""
+        transcript_gcs_uri = video_data.get("transcript_gcs_uri")
+        if not transcript_gcs_uri:
+            raise ValueError("Transcript GCS URI not found in Firestore document.")
+
+        print(f"   Downloading transcript from: {transcript_gcs_uri}")
+        bucket = self.storage_client.bucket(self.bucket_name)
+        blob = bucket.blob(transcript_gcs_uri.replace(f"gs://{self.bucket_name}/", ""))
+        transcript_text = await asyncio.to_thread(blob.download_as_text)
+        try:
+            return json.loads(transcript_text).get("full_transcript") or ""
+        except (json.JSONDecodeError, AttributeError):
+            # Transcripts saved before they were JSON are plain text.
+            return transcript_text
+
+    async def _save_substack_article(self, video_id: str, content: str) -> dict:
+        """Saves the pristine Markdown article to GCS and returns the Firestore fields that point to it."""
+        article_path_gcs = f"substack_posts/{video_id}_substack.md"
+        article_blob = self.storage_client.bucket(self.bucket_name).blob(article_path_gcs)
+        await asyncio.to_thread(article_blob.upload_from_string, content, 'text/markdown')
+        substack_gcs_uri = f"gs://{self.bucket_name}/{article_path_gcs}"
+        print(f"   Substack article saved to GCS: {substack_gcs_uri}")
+
+        fields = {"substack_gcs_uri": substack_gcs_uri}
+        # Extract the first line as the hook
+        if substack_hook := content.split('\n')[0].strip():
+            fields["substack_hook"] = substack_hook
+        return fields
+
+    async def _generate(self, video_id: str, structured_data: dict, transcript: str | None, fields: list[str], batch: bool = False) -> dict:
+        """Generates the given copy assets with Gemini and validates them."""
+        schema = MarketingCopy if set(fields) == set(COPY_FIELD_SPECS) else field_subset(MarketingCopy, fields)
+        prompt = self._build_prompt(structured_data, transcript, fields)
+        input_tokens = estimate_tokens(prompt)
+        model_name = model_router.choose("copywriting", input_tokens, self.model_name)
+        print(f"   Generating {', '.join(fields)} with {model_name}...")
+        response = await generate_content(
+            model_name,
+            prompt,
+            stage="copywriting",
+            input_tokens=input_tokens,
+            generation_config=genai.types.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=schema_subset(MARKETING_COPY_SCHEMA, fields),
+            ),
+            video_id=video_id,
+            stream_fields=[field for field in ("facebook_post", "email_newsletter") if field in fields],
+            batch=batch,
+        )
+        return parse_structured(response.text, schema, model_name).model_dump()
+
+    def _build_prompt(self, structured_data: dict, transcript: str | None, fields: list[str]) -> str:
+        # Only the analysis fields the requested assets are written from go into the brief.
+        analysis_fields = [name for name in structured_data if any(name in COPY_FIELD_CONTEXT[f]["analysis"] for f in fields)]
+        # Pretty print the JSON for better readability in the prompt
+        analysis_json = json.dumps({name: structured_data[name] for name in analysis_fields}, indent=2)
+        field_specs = json.dumps({name: COPY_FIELD_SPECS[name] for name in fields}, indent=4, ensure_ascii=False)
+
+        if transcript and any(COPY_FIELD_CONTEXT[f]["transcript"] for f in fields):
+            sources = "the provided analysis and the full transcript"
+            transcript_section = f"""
         Then, use the FULL TRANSCRIPT for deeper context, details, and to capture the speaker's authentic voice.
 
         ANALYSIS:
@@ -165,14 +257,23 @@ class CopywriterAgent:
         FULL TRANSCRIPT:
         ---
         {transcript}
+        ---"""
+        else:
+            sources = "the provided analysis"
+            transcript_section = f"""
+
+        ANALYSIS:
         ---
+        {analysis_json}
+        ---"""
+
+        return f"""
+        You are a world-class marketing copywriter and content strategist specializing in content for spiritual and personal growth brands.
+        Your task is to generate a set of marketing materials for a YouTube video based on {sources}.
+
+        First, use the ANALYSIS JSON as a creative brief to understand the core concepts.{transcript_section}
 
-        Generate a JSON object with the following schema. Ensure the tone is engaging, insightful, and tailored to each platform.
-        IMPORTANT: The entire output must be a single, valid JSON object. All strings within the JSON must be properly escaped, with any newline characters represented as \\n.
+        Generate a JSON object with the following fields. Ensure the tone is engaging, insightful, and tailored to each platform.
 
-        {{
-            "facebook_post": "A post for Facebook or Instagram. Start with a strong hook, elaborate on the video's main themes, and encourage discussion. Use relevant hashtags. Use \\n for all newlines.",
-            "email_newsletter": "A complete email newsletter. CRITICAL: ALL newlines, paragraphs, and line breaks MUST be represented as literal \\n characters. It must follow this exact structure: A short title, followed by '## Do you ever find yourself...' and an opening question. Then a brief reflection. A horizontal rule (---). '### ✨ In our latest video, we dive into a powerful idea:'. A blockquote with the core teaching. A sentence explaining what the video is NOT about, and then a sentence explaining what it IS about. A sentence describing the video's central metaphor. Another horizontal rule. A section titled '### 🔍 Here's a glimpse of what you'll explore:'. A list of the key takeaways from the ANALYSIS, each bolded and followed by its description on a new line. A final horizontal rule. A concluding sentence starting with 'If you're ready to...'. And finally, a link formatted as '👉 [**Watch Now**](#)'.",
-            "substack_article": "A complete Substack article of approximately 400 words. CRITICAL: ALL newlines, paragraphs, and line breaks MUST be represented as literal \\n characters. The article must start with a compelling hook to draw the reader in. It should then expand on the video's lessons in a thoughtful blog post. Conclude the article with 3-5 journal prompts that help the reader personalize and apply the content to their own life."
-        }}
+        {field_specs}
         """ 
\ No newline at end of file
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import asyncio
+from google.cloud import storage
+from ..event_bus import event_bus
+from ..events import ContentAnalysisComplete
+from ..database import db
+from ..llm.embeddings import embed_texts
+from ..vector_index import vector_index_store
+from ..topics import topic_clusterer
+
+# Transcript segments are grouped into windows of roughly this many seconds for embedding.
+EMBEDDING_WINDOW_SECONDS = float(os.getenv("EMBEDDING_WINDOW_SECONDS", "30"))
+
+class EmbeddingAgent:
+    """
+    🧭 EmbeddingAgent
+    Purpose: To embed transcript windows, key themes, quotes and Shorts candidates into
+    the owner's vector index, so similar moments can be found across the whole library,
+    and to place the video in the owner's topic clusters.
+    """
+
+    def __init__(self, bucket_name: str):
+        self.storage_client = storage.Client()
+        self.bucket_name = bucket_name
+        # Topic updates can re-cluster the whole library, so they run in the background.
+        self._topic_updates = set()
+        event_bus.subscribe(ContentAnalysisComplete, self.handle_analysis_complete)
+
+    async def handle_analysis_complete(self, event: ContentAnalysisComplete):
+        """
+        Embeds the video's items and appends them to the index, unless the same
+        content is already indexed. Failures are logged and never hold up the pipeline.
+        """
+        print(f"🧭 EmbeddingAgent: Embedding content for: {event.video_title}")
+        try:
+            doc = await db.collection("videos").document(event.video_id).get()
+            video_data = doc.to_dict() or {}
+            user_id = video_data.get("user_id")
+            if not user_id:
+                print(f"   Video {event.video_id} has no owner. Skipping embedding.")
+                return
+
+            segments = []
+            if transcript_gcs_uri := video_data.get("transcript_gcs_uri"):
+                blob = self.storage_client.bucket(self.bucket_name).blob(
+                    transcript_gcs_uri.replace(f"gs://{self.bucket_name}/", "")
+                )
+                segments = json.loads(await asyncio.to_thread(blob.download_as_text)).get("segments") or []
+
+            items = self._build_items(event.video_title, segments, event.structured_data or {})
+            if not items:
+                print(f"   Nothing to embed for {event.video_id}.")
+                return
+            fingerprint = hashlib.sha1(json.dumps(items, sort_keys=True).encode("utf-8")).hexdigest()
+            if await vector_index_store.fingerprint(user_id, event.video_id) == fingerprint:
+                print(f"   Embeddings for {event.video_id} are up to date. Skipping embedding.")
+                return
+
+            vectors = await embed_texts([item["text"] for item in items])
+            await vector_index_store.add_video(user_id, event.video_id, items, vectors, fingerprint)
+            print(f"   ✅ Embedded {len(items)} item(s) for {event.video_id}.")
+            task = asyncio.create_task(self._update_topics(user_id, event.video_id))
+            self._topic_updates.add(task)
+            task.add_done_callback(self._topic_updates.discard)
+        except Exception as e:
+            print(f"   ⚠️ Could not embed content for {event.video_id}: {e}")
+
+    async def _update_topics(self, user_id: str, video_id: str):
+        try:
+            await topic_clusterer.add_video(user_id, video_id)
+        except Exception as e:
+            print(f"   ⚠️ Could not update topic clusters for {video_id}: {e}")
+
+    def _build_items(self, video_title: str, segments: list[dict], structured_data: dict) -> list[dict]:
+        items = []
+        window = []
+        for segment in segments:
+            window.append(segment)
+            if window[-1]["end"] - window[0]["start"] >= EMBEDDING_WINDOW_SECONDS:
+                items.append(self._transcript_item(video_title, window))
+                window = []
+        if window:
+            items.append(self._transcript_item(video_title, window))
+
+        for theme in structured_data.get("key_themes") or []:
+            items.append({"kind": "theme", "video_title": video_title, "text": theme})
+
+        for quote in structured_data.get("meaningful_quotes") or []:
+            items.append({"kind": "quote", "video_title": video_title, "text": quote})
+
+        for candidate in structured_data.get("shorts_candidates") or []:
+            items.append({
+                "kind": "short",
+                "video_title": video_title,
+                "title": candidate.get("suggested_title"),
+                "start": candidate.get("start_time"),
+                "end": candidate.get("end_time"),
+                "text": candidate.get("transcript_snippet") or candidate.get("suggested_title") or "",
+            })
+        return [item for item in items if item["text"].strip()]
+
+    def _transcript_item(self, video_title: str, window: list[dict]) -> dict:
+        return {
+            "kind": "transcript",
+            "video_title": video_title,
+            "start": window[0]["start"],
+            "end": window[-1]["end"],
+            "text": " ".join(segment["text"].strip() for segment in window),
+        }
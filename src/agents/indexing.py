@@ -0,0 +1,45 @@
+import json
+import asyncio
+from google.cloud import storage
+from ..event_bus import event_bus
+from ..events import TranscriptReady
+from ..database import db
+from ..transcript_search import search_index_store
+
+class IndexingAgent:
+    """
+    🔎 IndexingAgent
+    Purpose: To add each new transcript to its owner's full-text search index.
+    """
+
+    def __init__(self, bucket_name: str):
+        self.storage_client = storage.Client()
+        self.bucket_name = bucket_name
+        event_bus.subscribe(TranscriptReady, self.handle_transcript_ready)
+
+    async def handle_transcript_ready(self, event: TranscriptReady):
+        """
+        Downloads the transcript and indexes its segments. Indexing failures are
+        logged and never hold up the rest of the pipeline.
+        """
+        print(f"🔎 IndexingAgent: Indexing transcript for: {event.video_title}")
+        try:
+            doc = await db.collection("videos").document(event.video_id).get()
+            user_id = (doc.to_dict() or {}).get("user_id") if doc.exists else None
+            if not user_id:
+                print(f"   Video {event.video_id} has no owner. Skipping indexing.")
+                return
+
+            blob = self.storage_client.bucket(self.bucket_name).blob(
+                event.transcript_gcs_uri.replace(f"gs://{self.bucket_name}/", "")
+            )
+            transcript_data = json.loads(await asyncio.to_thread(blob.download_as_text))
+            segments = transcript_data.get("segments") or [
+                # Untimed transcripts are indexed as one segment, so hits still find the video.
+                {"start": 0.0, "end": 0.0, "text": transcript_data.get("full_transcript", "")}
+            ]
+
+            await search_index_store.add_video(user_id, event.video_id, event.video_title, segments)
+            print(f"   ✅ Indexed {len(segments)} transcript segment(s) for {event.video_id}.")
+        except Exception as e:
+            print(f"   ⚠️ Could not index transcript for {event.video_id}: {e}")
@@ -116,7 +116,6 @@ class IngestionAgent:
                     doc = await video_doc_ref.get()
                     if not doc.exists:
                         print(f"🕵️ IngestionAgent: ✅ New video found: '{video_title}'")
-                        print("   (Processing only the single most recent new video for this cycle)")
                         
                         video_url = f"https://www.youtube.com/watch?v={video_id}"
                         
@@ -127,6 +126,8 @@ class IngestionAgent:
                             "video_url": video_url,
                             "status": "ingested",
                             "status_message": f"New video found on channel: {video_title}",
+                            # Nobody is waiting on auto-ingested videos, so they use batch LLM calls.
+                            "execution_mode": "batch",
                             "created_at": datetime.utcnow(),
                         })
 
@@ -135,10 +136,9 @@ class IngestionAgent:
                             video_url=video_url,
                             video_title=video_title
                         )
-                        await event_bus.publish(new_video_event)
-                        
-                        # Stop after processing the first new video to avoid flooding.
-                        break
+                        # Every new video of this cycle runs at once in the background, so
+                        # their Gemini requests share batch jobs and the monitor keeps polling.
+                        event_bus.publish_in_background(new_video_event)
                     else:
                         # Videos are ordered by date, so if we've seen this one, we've seen all subsequent ones.
                         print(f"🕵️ IngestionAgent: ⚪️ Video '{video_title}' already processed. No newer videos to process in this cycle.")
@@ -1,6 +1,7 @@
 import asyncio
 import os
 import tempfile
+import time
 import uuid
 import json
 from datetime import datetime, timedelta
@@ -19,6 +20,19 @@ from ..database import db
 from ..event_bus import event_bus
 from ..events import NewVideoDetected, IngestedVideo, TranscriptReady
 from ..security import decrypt_data, encrypt_data
+from ..llm.routing import model_router, record_latency
+from ..llm.usage import record_usage, usage_from_response
+from ..llm.structured import parse_structured, StructuredOutputError
+from ..models.content import TimedTranscript, TIMED_TRANSCRIPT_SCHEMA
+from ..video_processing import extract_audio
+from ..highlights import rank_highlights
+from ..transcript_index import TranscriptIndex
+from ..fingerprint import audio_fingerprint
+from ..duplicates import DUPLICATE_DETECTION_ENABLED, fingerprint_scope, fingerprint_store
+
+# Rank likely highlight windows from the audio (see highlights.py) while transcribing.
+HIGHLIGHTS_ENABLED = os.getenv("HIGHLIGHT_PRERANK_ENABLED", "true").lower() == "true"
+HIGHLIGHT_SAMPLE_RATE = 16000
 
 class TranscriptionAgent:
     """
@@ -123,28 +137,38 @@ class TranscriptionAgent:
         video_data = b''.join(response.iter_content(chunk_size=8192))
         mime_type = blob.content_type or "video/mp4"
 
-        video_part = Part.from_bytes(data=video_data, mime_type=mime_type)
-        prompt = "Please transcribe this video's audio."
-
-        model_response = await asyncio.to_thread(
-            self.client.models.generate_content,
-            model=self.model_name,
-            contents=[video_part, prompt]
-        )
+        # Audio is decoded for duplicate detection and for highlight ranking while Gemini transcribes.
+        audio_task = None
+        if HIGHLIGHTS_ENABLED or DUPLICATE_DETECTION_ENABLED:
+            audio_task = asyncio.create_task(asyncio.to_thread(
+                extract_audio, video_data, HIGHLIGHT_SAMPLE_RATE, self.ffmpeg_path
+            ))
+        transcription_task = asyncio.create_task(self._transcribe(video_id, video_data, mime_type))
+        if DUPLICATE_DETECTION_ENABLED and await self._check_for_duplicate(video_id, gcs_uri, audio_task):
+            # The user decides what happens to a duplicate, so its transcription is abandoned.
+            transcription_task.cancel()
+            await asyncio.gather(transcription_task, return_exceptions=True)
+            return
+
+        model_response, model_name = await transcription_task
         print("   Transcription received.")
 
-        transcript_json = self._parse_transcript_response(model_response)
+        transcript_json = self._parse_transcript_response(model_response, model_name)
         transcript_gcs_uri = await self._save_transcript_to_gcs(video_id, transcript_json)
 
-        await self.update_video_status(
-            video_id,
-            "transcribed",
-            {
-                "transcript_gcs_uri": transcript_gcs_uri, 
-                "original_video_gcs_uri": gcs_uri,
-                "status_message": "Transcription complete. Saved to cloud."
-            }
-        )
+        update_data = {
+            "transcript_gcs_uri": transcript_gcs_uri, 
+            "original_video_gcs_uri": gcs_uri,
+            "status_message": "Transcription complete. Saved to cloud."
+        }
+        if transcript_json["segments"]:
+            update_data["transcript_index_gcs_uri"] = await self._save_transcript_index_to_gcs(
+                video_id, TranscriptIndex.from_segments(transcript_json["segments"])
+            )
+        if audio_task and HIGHLIGHTS_ENABLED:
+            if highlight_windows := await self._rank_highlights(audio_task, transcript_json["segments"]):
+                update_data["highlight_windows"] = highlight_windows
+        await self.update_video_status(video_id, "transcribed", update_data)
 
         await event_bus.publish(TranscriptReady(
             video_id=video_id,
@@ -260,6 +284,15 @@ class TranscriptionAgent:
         print(f"   Transcript saved to GCS: {transcript_gcs_uri}")
         return transcript_gcs_uri
 
+    async def _save_transcript_index_to_gcs(self, video_id: str, index: TranscriptIndex) -> str:
+        index_blob_gcs_path = f"transcripts/{video_id}_index.json"
+        index_blob = self.bucket.blob(index_blob_gcs_path)
+        await asyncio.to_thread(index_blob.upload_from_string, json.dumps(index.to_dict()), 'application/json')
+
+        index_gcs_uri = f"gs://{self.bucket_name}/{index_blob_gcs_path}"
+        print(f"   Transcript index ({len(index)} words) saved to GCS: {index_gcs_uri}")
+        return index_gcs_uri
+
     async def _cleanup_gcs_file(self, gcs_uri: str):
         try:
             blob_path = gcs_uri.replace(f"gs://{self.bucket_name}/", "")
@@ -276,7 +309,96 @@ class TranscriptionAgent:
             transcript_gcs_uri=video_data.get("transcript_gcs_uri")
         ))
 
-    def _parse_transcript_response(self, response) -> dict:
+    async def _transcribe(self, video_id: str, video_data: bytes, mime_type: str) -> tuple:
+        """Sends the video to Gemini for a timed transcript. Returns the response and the model used."""
+        video_part = Part.from_bytes(data=video_data, mime_type=mime_type)
+        prompt = (
+            "Please transcribe this video's audio. Split the transcript into segments of one or two "
+            "sentences, and give each segment's start and end time in seconds from the start of the video."
+        )
+
+        # Video input has no text token count to route on; the transcription
+        # policy keeps it on the configured model unless GEMINI_MODEL_TRANSCRIPTION is set.
+        model_name = model_router.choose("transcription", 0, self.model_name)
+        started = time.monotonic()
+        # The async client, so cancelling the task also aborts the request.
+        async with record_latency(model_name, 0):
+            model_response = await self.client.aio.models.generate_content(
+                model=model_name,
+                contents=[video_part, prompt],
+                config={"response_mime_type": "application/json", "response_schema": TIMED_TRANSCRIPT_SCHEMA},
+            )
+        input_tokens, output_tokens = usage_from_response(model_response)
+        await record_usage(
+            video_id, "transcription", model_name,
+            input_tokens=input_tokens, output_tokens=output_tokens, seconds=time.monotonic() - started,
+        )
+        return model_response, model_name
+
+    async def _check_for_duplicate(self, video_id: str, gcs_uri: str, audio_task: asyncio.Task) -> bool:
+        """
+        Fingerprints the audio and looks for an earlier upload of the same audio.
+        On a match, the video waits for the user to choose between reusing that
+        upload's transcript, analysis and copy or processing it anyway, and True
+        is returned. Detection problems never block transcription.
+        """
+        try:
+            samples = await audio_task
+            fingerprint = await asyncio.to_thread(audio_fingerprint, samples, HIGHLIGHT_SAMPLE_RATE)
+            if not len(fingerprint):
+                return False
+            doc = await db.collection("videos").document(video_id).get()
+            video_data = doc.to_dict() or {}
+            scope = fingerprint_scope(video_data)
+            match = await fingerprint_store.find_duplicate(scope, video_id, fingerprint)
+            await fingerprint_store.add(scope, video_id, fingerprint)
+            if not match or video_data.get("duplicate_decision") == "process":
+                return False
+
+            source_doc = await db.collection("videos").document(match["video_id"]).get()
+            source = (source_doc.to_dict() or {}) if source_doc.exists else {}
+            if not source.get("transcript_gcs_uri"):
+                return False
+            match["video_title"] = source.get("video_title")
+            print(f"   ♻️ Audio matches '{match['video_title']}' ({match['video_id']}) at offset {match['offset_seconds']}s.")
+            await self.update_video_status(video_id, "duplicate_detected", {
+                "duplicate_of": match,
+                "original_video_gcs_uri": gcs_uri,
+                "status_message": f"This looks like a re-upload of '{match['video_title']}'. Reuse its transcript, analysis and copy, or process it anyway?",
+            })
+            return True
+        except Exception as e:
+            print(f"   [Warning] Could not check for duplicate uploads: {e}")
+            return False
+
+    async def _rank_highlights(self, audio_task: asyncio.Task, segments: list) -> list:
+        """
+        Ranks candidate highlight windows from the decoded audio and the timed
+        segments. Returns an empty list if the audio could not be analyzed.
+        """
+        try:
+            samples = await audio_task
+            highlight_windows = await asyncio.to_thread(rank_highlights, samples, HIGHLIGHT_SAMPLE_RATE, segments)
+            print(f"   Ranked {len(highlight_windows)} highlight windows from the audio.")
+            return highlight_windows
+        except Exception as e:
+            print(f"   [Warning] Could not rank highlights from the audio: {e}")
+            return []
+
+    def _parse_transcript_response(self, response, model_name: str) -> dict:
+        # Timestamped transcripts come back as JSON segments.
+        if text := getattr(response, 'text', None):
+            try:
+                timed = parse_structured(text, TimedTranscript, model_name)
+                if timed.segments:
+                    segments = [segment.model_dump() for segment in timed.segments]
+                    return {
+                        "full_transcript": " ".join(segment["text"].strip() for segment in segments).strip(),
+                        "segments": segments,
+                    }
+            except StructuredOutputError:
+                print("   [Notice] Transcript was not returned as timed segments. Using it as plain text.")
+
         transcript_data = {"full_transcript": "", "segments": []}
         full_text_parts = []
         
@@ -1,14 +1,46 @@
 import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
 import google.generativeai as genai
-import vertexai
-from vertexai.preview.vision_models import ImageGenerationModel
 
 from ..event_bus import event_bus
 from ..events import CopyReady, VisualsReady
 from ..database import db
-from google.cloud import storage
+from ..llm.generation import generate_content
+from ..llm.routing import model_router, estimate_tokens
+from ..llm.usage import record_usage
+from ..imagen.registry import imagen_models, DEFAULT_IMAGEN_MODEL
+from ..imagen.batching import image_batcher
+from ..imagen.cache import image_cache
+from ..quotas import video_owner
+from ..imagen.scheduler import BACKGROUND, INTERACTIVE
+from ..compositing.derivatives import create_derivatives
+from ..compositing.pool import render_pool
+from ..compositing.quote_cards import render_quote_card
+from ..compositing.templates import BUILTIN_TEMPLATES, DEFAULT_TEMPLATE, ThumbnailTemplate, template_store
+from ..compositing.thumbnails import FORMATS as THUMBNAIL_FORMATS, render_thumbnails
+from google.cloud import firestore, storage
 import uuid
 
+# Quote cards share this many generated backgrounds per video.
+QUOTE_CARD_BACKGROUNDS = int(os.getenv("QUOTE_CARD_BACKGROUNDS", "2"))
+# Video doc field holding the visuals made so far, until the stage completes.
+CHECKPOINT_FIELD = "visuals_checkpoint"
+
+
+def _checkpoint_inputs(video_title: str, structured_data: dict) -> str:
+    """Identifies what the visuals are made from; a checkpoint is only reused for the same inputs."""
+    inputs = {
+        "title": video_title,
+        "summary": structured_data.get("summary"),
+        "key_themes": structured_data.get("key_themes"),
+        "meaningful_quotes": structured_data.get("meaningful_quotes"),
+    }
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
+
 class VisualsAgent:
     """
     🎨 VisualsAgent
@@ -17,74 +49,231 @@ class VisualsAgent:
 
     def __init__(self, project_id: str, location: str, bucket_name: str, api_key: str, model_name: str, gemini_model_name: str):
         genai.configure(api_key=api_key)
-        vertexai.init(project=project_id, location=location)
-        self.model = genai.GenerativeModel(model_name=gemini_model_name)
-        self.image_model = ImageGenerationModel.from_pretrained(model_name)
+        imagen_models.init(project_id, location)
+        self.gemini_model_name = gemini_model_name
+        self.image_model_name = model_name or DEFAULT_IMAGEN_MODEL
+        self.image_model = imagen_models.get(self.image_model_name)
         self.storage_client = storage.Client()
         self.bucket_name = bucket_name
         event_bus.subscribe(CopyReady, self.handle_copy_ready)
 
-    async def _generate_and_upload_image(self, prompt: str, video_id: str, index: int, model_name: str = None) -> str:
-        """Generates a single image, uploads it, and returns the public URL."""
-        
-        image_model = self.image_model
-        if model_name:
+    async def _generate_and_upload_image(self, prompt: str, video_id: str, index: int, model_name: str = None, lane: str = BACKGROUND, new_variation: bool = False) -> dict:
+        """Generates a single image, uploads it with its derivatives, and returns {gcs_uri, derivatives, cached}."""
+        return (await self._generate_and_upload_images(prompt, video_id, [index], model_name, lane, new_variation))[0]
+
+    async def _generate_and_upload_images(self, prompt: str, video_id: str, indexes: list, model_name: str = None, lane: str = BACKGROUND, new_variation: bool = False) -> list:
+        """
+        Generates one image per index from the same prompt, sharing Imagen calls,
+        uploads them, and returns {gcs_uri, derivatives, cached} for each (None
+        where no image came back).
+        """
+        images = await self._obtain_images(
+            prompt, video_id, [f"{video_id}_visual_{index}_{uuid.uuid4()}.png" for index in indexes],
+            model_name, lane, new_variation=new_variation,
+        )
+        return images + [None] * (len(indexes) - len(images))
+
+    async def _obtain_images(
+        self, prompt: str, video_id: str, filenames: list, model_name: str = None, lane: str = BACKGROUND,
+        new_variation: bool = False, publish: bool = True, with_bytes: bool = False,
+    ) -> list:
+        """
+        Returns up to one image per filename for the prompt, as {gcs_uri,
+        derivatives, cached} (plus "bytes" if asked for). Images already made
+        for the same model and prompt are reused from the image cache unless
+        `new_variation` is set; only the rest are generated and uploaded under
+        `filenames`, with derivatives if `publish`. Reuse is limited to the
+        video owner's images, and each reused image is copied under its filename.
+        """
+        model_name = model_name or self.image_model_name
+        owner_id = await video_owner(video_id)
+        cached = [] if new_variation else await image_cache.lookup(model_name, prompt, len(filenames), user_id=owner_id)
+        if cached:
+            print(f"     - Reusing {len(cached)} cached image(s) for: {prompt[:80]}...")
+            cached = await asyncio.gather(*(
+                image_cache.claim(image, f"images/{filename}") for image, filename in zip(cached, filenames)
+            ))
+        results = [{**image, "cached": True} for image in cached]
+        if with_bytes:
+            async def download(image):
+                blob = self.storage_client.bucket(self.bucket_name).blob(image["gcs_uri"].replace(f"gs://{self.bucket_name}/", ""))
+                return {**image, "bytes": await asyncio.to_thread(blob.download_as_bytes)}
+            results = list(await asyncio.gather(*(download(image) for image in results)))
+
+        missing = filenames[len(cached):]
+        if missing:
+            generated = await self._generate_images(prompt, video_id, len(missing), model_name, lane)
+
+            async def upload(filename, image_bytes):
+                if publish:
+                    image = await self._publish_image(filename, image_bytes)
+                else:
+                    image = {"gcs_uri": await self._upload_image(filename, image_bytes), "derivatives": {}}
+                return image, image_bytes
+
+            uploaded = await asyncio.gather(*(upload(filename, image_bytes) for filename, image_bytes in zip(missing, generated)))
+            await image_cache.add(model_name, prompt, [image for image, _ in uploaded], user_id=owner_id)
+            results += [
+                {**image, "cached": False, **({"bytes": image_bytes} if with_bytes else {})}
+                for image, image_bytes in uploaded
+            ]
+        return results
+
+    async def _generate_images(self, prompt: str, video_id: str, count: int, model_name: str = None, lane: str = BACKGROUND) -> list:
+        """
+        Generates up to `count` images for one prompt and returns their PNG bytes.
+        Pipeline images use the background lane; on-demand ones pass INTERACTIVE.
+        """
+        model_name = model_name or self.image_model_name
+        if model_name != self.image_model_name:
             print(f"   - Using on-demand model: {model_name}")
-            image_model = ImageGenerationModel.from_pretrained(model_name)
 
-        print(f"     - Generating image {index}: {prompt[:80]}...")
-        response = await asyncio.to_thread(
-            image_model.generate_images,
-            prompt=prompt,
-            number_of_images=1
+        print(f"     - Generating {count} image(s): {prompt[:80]}...")
+        started = time.monotonic()
+        images = await image_batcher.generate(model_name, prompt, count, lane)
+        await record_usage(
+            video_id, "images", model_name,
+            images=len(images), seconds=time.monotonic() - started,
         )
-        
+
         # Add a check to ensure the model returned an image
-        if not response.images:
-            print(f"       ⚠️ Image generation failed for prompt: {prompt[:80]}...")
-            return None
+        if len(images) < count:
+            print(f"       ⚠️ Image generation returned {len(images)} of {count} images for prompt: {prompt[:80]}...")
+        return images
 
-        image_bytes = response.images[0]._image_bytes
-        
-        # Upload to GCS
-        image_filename = f"{video_id}_visual_{index}_{uuid.uuid4()}.png"
+    async def _upload_image(self, image_filename: str, image_bytes: bytes, content_type: str = 'image/png') -> str:
         blob = self.storage_client.bucket(self.bucket_name).blob(f"images/{image_filename}")
-        
-        await asyncio.to_thread(blob.upload_from_string, image_bytes, 'image/png')
-        
+        await asyncio.to_thread(blob.upload_from_string, image_bytes, content_type)
         gcs_uri = f"gs://{self.bucket_name}/{blob.name}"
         print(f"       Uploaded to {gcs_uri}")
         return gcs_uri
 
-    async def generate_single_image_from_prompt(self, video_id: str, prompt: str, model_name: str = None) -> dict:
+    async def _publish_image(self, image_filename: str, image_bytes: bytes) -> dict:
+        """
+        Uploads an image shown in the UI together with its resized WebP/AVIF
+        derivatives. Returns {gcs_uri, derivatives}; the derivatives are empty
+        if rendering them failed, and readers then fall back to the original.
+        """
+        gcs_uri = await self._upload_image(image_filename, image_bytes)
+        try:
+            derivatives = await create_derivatives(self.bucket_name, gcs_uri, image_bytes, self.storage_client)
+        except Exception as e:
+            print(f"       ⚠️ Could not create derivatives of {gcs_uri}: {e}")
+            derivatives = {}
+        return {"gcs_uri": gcs_uri, "derivatives": derivatives}
+
+    async def _generate_thumbnail(self, prompt: str, video_id: str, index: int, title: str, template: ThumbnailTemplate) -> dict:
+        """
+        Generates a thumbnail background and composites the title onto it in
+        every thumbnail format. Returns None if no image came back.
+        """
+        images = await self._obtain_images(prompt, video_id, [f"{video_id}_visual_{index}_{uuid.uuid4()}.png"], with_bytes=True)
+        if not images:
+            return None
+        background = images[0].pop("bytes")
+        thumbnail = {"prompt": prompt, **images[0]}
+        try:
+            thumbnail["composites"] = await self._render_composites(video_id, background, title, template)
+            thumbnail["template"] = template.name
+        except Exception as e:
+            print(f"       ⚠️ Could not composite thumbnail {index}: {e}")
+        return thumbnail
+
+    async def _render_composites(self, video_id: str, background: bytes, title: str, template: ThumbnailTemplate, formats: list = None) -> dict:
+        """Renders the title over a background in each format and returns {format: gcs_uri}."""
+        formats = formats or list(THUMBNAIL_FORMATS)
+        spec = template.render_spec()
+        rendered = await render_pool.run(render_thumbnails, background, [(title, spec, output_format) for output_format in formats])
+        uris = await asyncio.gather(*(
+            self._upload_image(f"{video_id}_thumbnail_{output_format}_{uuid.uuid4()}.jpg", image_bytes, 'image/jpeg')
+            for output_format, image_bytes in zip(formats, rendered)
+        ))
+        return dict(zip(formats, uris))
+
+    async def composite_thumbnail(self, video_id: str, background_gcs_uri: str, title: str, template: ThumbnailTemplate, formats: list = None) -> dict:
+        """
+        Composites a title onto an existing image of the video with a template,
+        without calling Imagen. Used for on-demand variants from the frontend.
+        """
+        blob = self.storage_client.bucket(self.bucket_name).blob(background_gcs_uri.replace(f"gs://{self.bucket_name}/", ""))
+        background = await asyncio.to_thread(blob.download_as_bytes)
+        composites = await self._render_composites(video_id, background, title, template, formats)
+        return {"source_gcs_uri": background_gcs_uri, "title": title, "template": template.name, "composites": composites}
+
+    async def generate_single_image_from_prompt(self, video_id: str, prompt: str, model_name: str = None, new_variation: bool = False) -> dict:
         """
         Generates a single image and returns a dict with the prompt and URL.
-        This is used for on-demand generation from the frontend.
+        This is used for on-demand generation from the frontend. An image made
+        earlier from the same prompt is returned instead (with "cached": True)
+        unless `new_variation` is set.
         """
         index = f"ondemand_{uuid.uuid4()}"
-        image_gcs_uri = await self._generate_and_upload_image(prompt, video_id, index, model_name=model_name)
-        if image_gcs_uri:
-            return {"prompt": prompt, "gcs_uri": image_gcs_uri}
-        return None
-
-    async def _generate_quote_image(self, quote: str, video_id: str, index: int, key_themes: list) -> dict:
-        """Generates a background image for a specific quote."""
-        theme_str = ", ".join(key_themes)
-        prompt = (
-            "Create a visually stunning, abstract, and subtle background image suitable for a quote. "
-            f"The image should be inspired by themes of: {theme_str}. "
-            "It should evoke a feeling of inspiration and insight. Do NOT include any text, letters, or words in the image. "
-            "The style should be elegant and minimalist, with a soft focus and a gentle color palette."
+        image = await self._generate_and_upload_image(
+            prompt, video_id, index, model_name=model_name, lane=INTERACTIVE, new_variation=new_variation
         )
-        
-        print(f"   - Generating background for quote {index}...")
-        image_gcs_uri = await self._generate_and_upload_image(prompt, video_id, f"quote_{index}")
-        
-        if image_gcs_uri:
-            return {"quote": quote, "gcs_uri": image_gcs_uri}
+        if image:
+            return {"prompt": prompt, **image}
         return None
 
-    async def _generate_image_prompts(self, structured_data: dict, substack_gcs_uri: str) -> list[str]:
+    async def _generate_quote_images(self, quotes: list, video_id: str, key_themes: list, checkpoint: dict, save_checkpoint) -> list:
+        """
+        Generates a few theme backgrounds for the video in one Imagen call, then
+        renders each quote onto them locally, cycling through the backgrounds.
+        Backgrounds and cards already in the checkpoint are reused; new ones are
+        checkpointed as they complete. Returns one visual (or None) per quote.
+        """
+        backgrounds = None
+        if background_uris := checkpoint.get("quote_backgrounds"):
+            bucket = self.storage_client.bucket(self.bucket_name)
+            try:
+                backgrounds = await asyncio.gather(*(
+                    asyncio.to_thread(bucket.blob(uri.replace(f"gs://{self.bucket_name}/", "")).download_as_bytes)
+                    for uri in background_uris
+                ))
+            except Exception as e:
+                print(f"   - Checkpointed quote backgrounds are unavailable ({e}); generating new ones.")
+        if backgrounds is None:
+            theme_str = ", ".join(key_themes)
+            prompt = (
+                "Create a visually stunning, abstract, and subtle background image suitable for a quote. "
+                f"The image should be inspired by themes of: {theme_str}. "
+                "It should evoke a feeling of inspiration and insight. Do NOT include any text, letters, or words in the image. "
+                "The style should be elegant and minimalist, with a soft focus and a gentle color palette."
+            )
+
+            print(f"   - Generating backgrounds for {len(quotes)} quotes...")
+            images = await self._obtain_images(
+                prompt, video_id,
+                [f"{video_id}_quote_background_{i}_{uuid.uuid4()}.png" for i in range(min(QUOTE_CARD_BACKGROUNDS, len(quotes)))],
+                publish=False, with_bytes=True,
+            )
+            if not images:
+                return [None] * len(quotes)
+            backgrounds = [image["bytes"] for image in images]
+            background_uris = [image["gcs_uri"] for image in images]
+            await save_checkpoint({f"{CHECKPOINT_FIELD}.quote_backgrounds": background_uris})
+
+        done = checkpoint.get("quote_visuals", {})
+        todo = [i for i in range(len(quotes)) if f"q{i}" not in done]
+        if todo:
+            print(f"   - Rendering {len(todo)} of {len(quotes)} quote cards...")
+
+        async def make_card(i):
+            try:
+                card = await render_pool.run(render_quote_card, backgrounds[i % len(backgrounds)], quotes[i])
+            except Exception as e:
+                print(f"       ⚠️ Could not render quote card {i}: {e}")
+                return None
+            image = await self._publish_image(f"{video_id}_quote_card_{i}_{uuid.uuid4()}.png", card)
+            visual = {"quote": quotes[i], **image, "background_gcs_uri": background_uris[i % len(background_uris)]}
+            await save_checkpoint({f"{CHECKPOINT_FIELD}.quote_visuals.q{i}": visual})
+            return visual
+
+        made = await asyncio.gather(*(make_card(i) for i in todo))
+        visuals = {f"q{i}": visual for i, visual in zip(todo, made)}
+        return [done.get(f"q{i}") or visuals.get(f"q{i}") for i in range(len(quotes))]
+
+    async def _generate_image_prompts(self, video_id: str, structured_data: dict, substack_gcs_uri: str, batch: bool = False) -> list[str]:
         """Generates a list of image prompts using Gemini."""
         # Download the substack article from GCS to get the hook
         hook = ""
@@ -105,7 +294,12 @@ class VisualsAgent:
         print("   Generating descriptive prompts for image generation...")
         summary = structured_data.get("summary", "")
         prompt_generation_prompt = self._build_image_prompt_generator(summary, hook)
-        response = await self.model.generate_content_async(prompt_generation_prompt)
+        input_tokens = estimate_tokens(prompt_generation_prompt)
+        model_name = model_router.choose("image_prompts", input_tokens, self.gemini_model_name)
+        response = await generate_content(
+            model_name, prompt_generation_prompt, stage="image_prompts",
+            input_tokens=input_tokens, video_id=video_id, batch=batch,
+        )
         return [p.strip() for p in response.text.split('---') if p.strip()]
 
     async def handle_copy_ready(self, event: CopyReady):
@@ -117,9 +311,7 @@ class VisualsAgent:
         video_doc_ref = db.collection("videos").document(event.video_id)
 
         try:
-            await video_doc_ref.update({"status": "generating_visuals"})
-
-            # Check if visuals already exist
+            # Check if visuals already exist, so a repeated CopyReady is a no-op
             doc = await video_doc_ref.get()
             video_data = doc.to_dict()
             if video_data.get("status") in ["visuals_generated", "published"]:
@@ -131,64 +323,96 @@ class VisualsAgent:
                 await event_bus.publish(visuals_ready_event)
                 return
 
+            await video_doc_ref.update({"status": "generating_visuals"})
+
             # Get the analysis and copy from the document
             structured_data = video_data.get("structured_data")
             if not structured_data:
                 raise ValueError("Could not find 'structured_data' in the video document.")
 
-            marketing_copy = video_data.get("marketing_copy", {})
             substack_article_gcs_uri = video_data.get("substack_gcs_uri")
-            
-            # --- Thumbnail Image Generation ---
-            print("   Starting thumbnail generation...")
-            image_prompts_task = self._generate_image_prompts(structured_data, substack_article_gcs_uri)
-            
+
+            # --- Checkpoint ---
+            # Each finished image is recorded as soon as it exists, so a retry
+            # only makes what is still missing. A checkpoint from different
+            # analysis inputs is stale and starts over.
+            inputs = _checkpoint_inputs(event.video_title, structured_data)
+            checkpoint = video_data.get(CHECKPOINT_FIELD) or {}
+            if checkpoint.get("inputs") != inputs:
+                checkpoint = {"inputs": inputs}
+                await video_doc_ref.update({CHECKPOINT_FIELD: checkpoint})
+            else:
+                print(f"   Resuming visuals from checkpoint ({len(checkpoint.get('thumbnails', {}))} thumbnails, "
+                      f"{len(checkpoint.get('quote_visuals', {}))} quote cards done).")
+
+            async def save_checkpoint(fields: dict):
+                await video_doc_ref.update(fields)
+
             # --- Quote Visual Generation ---
             quotes = structured_data.get("meaningful_quotes", [])
             key_themes = structured_data.get("key_themes", [])
             quote_visuals_task = None
             if quotes:
                 print(f"   Starting visual generation for {len(quotes)} quotes...")
-                quote_tasks = [
-                    self._generate_quote_image(quote, event.video_id, i, key_themes)
-                    for i, quote in enumerate(quotes)
-                ]
-                quote_visuals_task = asyncio.gather(*quote_tasks)
-
-            # Await the prompt generation first
-            image_prompts = await image_prompts_task
-            
-            # Now, create and gather the tasks for generating the main thumbnail images
-            print(f"   Generating and uploading {len(image_prompts)} thumbnail images...")
-            thumbnail_tasks = [
-                self._generate_and_upload_image(prompt, event.video_id, i + 1)
-                for i, prompt in enumerate(image_prompts)
-            ]
-            thumbnails_gathertask = asyncio.gather(*thumbnail_tasks)
+                quote_visuals_task = asyncio.create_task(
+                    self._generate_quote_images(quotes, event.video_id, key_themes, checkpoint, save_checkpoint)
+                )
+
+            # --- Thumbnail Image Generation ---
+            print("   Starting thumbnail generation...")
+            image_prompts = checkpoint.get("image_prompts")
+            if not image_prompts:
+                try:
+                    image_prompts = await self._generate_image_prompts(
+                        event.video_id, structured_data, substack_article_gcs_uri, batch=video_data.get("execution_mode") == "batch"
+                    )
+                except Exception:
+                    if quote_visuals_task:
+                        await asyncio.gather(quote_visuals_task, return_exceptions=True)
+                    raise
+                await save_checkpoint({f"{CHECKPOINT_FIELD}.image_prompts": image_prompts})
+
+            try:
+                template = await template_store.get(video_data.get("user_id"))
+            except KeyError:
+                template = BUILTIN_TEMPLATES[DEFAULT_TEMPLATE]
+
+            done_thumbnails = checkpoint.get("thumbnails", {})
 
-            # Await all image generation tasks concurrently
-            all_results = await asyncio.gather(
-                thumbnails_gathertask,
-                quote_visuals_task if quote_visuals_task else asyncio.sleep(0) # gather needs an awaitable
+            async def make_thumbnail(index, prompt):
+                if f"t{index}" in done_thumbnails:
+                    return done_thumbnails[f"t{index}"]
+                thumbnail = await self._generate_thumbnail(prompt, event.video_id, index, event.video_title, template)
+                if thumbnail:
+                    await save_checkpoint({f"{CHECKPOINT_FIELD}.thumbnails.t{index}": thumbnail})
+                return thumbnail
+
+            print(f"   Generating and uploading {sum(f't{i + 1}' not in done_thumbnails for i in range(len(image_prompts)))} thumbnail images...")
+            # Every image runs to completion even if another fails, so all finished work is checkpointed.
+            thumbnail_results, quote_results = await asyncio.gather(
+                asyncio.gather(*(make_thumbnail(i + 1, prompt) for i, prompt in enumerate(image_prompts)), return_exceptions=True),
+                quote_visuals_task if quote_visuals_task else asyncio.sleep(0, result=[]),
+                return_exceptions=True,
             )
-            
-            image_urls_with_none = all_results[0]
-            quote_visuals_with_none = all_results[1] if len(all_results) > 1 and quote_visuals_task else []
-
-            # --- New Data Structure ---
-            # Combine prompts and URLs into a list of objects
-            generated_thumbnails = [
-                {"prompt": prompt, "gcs_uri": url}
-                for prompt, url in zip(image_prompts, image_urls_with_none) if url is not None
-            ]
+            errors = [result for result in thumbnail_results if isinstance(result, BaseException)]
+            if isinstance(quote_results, BaseException):
+                errors.append(quote_results)
+                quote_results = []
+            if errors:
+                raise RuntimeError(
+                    f"{len(errors)} visual(s) failed; finished images are kept and a re-trigger makes only the rest. "
+                    f"First error: {errors[0]}"
+                )
 
-            quote_visuals = [qv for qv in quote_visuals_with_none if qv is not None]
+            generated_thumbnails = [thumbnail for thumbnail in thumbnail_results if thumbnail is not None]
+            quote_visuals = [qv for qv in quote_results if qv is not None]
 
             # Update Firestore with all generated URLs at once
             update_data = {
                 # Storing the combined list of objects now
                 "generated_thumbnails": generated_thumbnails,
-                "status": "visuals_generated"
+                "status": "visuals_generated",
+                CHECKPOINT_FIELD: firestore.DELETE_FIELD,
             }
             if quote_visuals:
                 update_data["quote_visuals"] = quote_visuals
@@ -228,4 +452,35 @@ class VisualsAgent:
         "{hook}"
 
         Based on this, generate two image prompts.
-        """
\ No newline at end of file
+        """
+
+_visuals_agent = None
+# Startup builds the agent in a thread while requests may already ask for it.
+_visuals_agent_lock = threading.Lock()
+
+def get_visuals_agent() -> VisualsAgent:
+    """
+    Returns the process-wide VisualsAgent, creating it from the environment on
+    first use. There must only be one, since each instance subscribes to CopyReady.
+    """
+    global _visuals_agent
+    if _visuals_agent is not None:
+        return _visuals_agent
+    with _visuals_agent_lock:
+        if _visuals_agent is not None:
+            return _visuals_agent
+        settings = {
+            "project_id": os.getenv("GOOGLE_CLOUD_PROJECT"),
+            "location": os.getenv("GCP_REGION"),
+            "bucket_name": os.getenv("GCS_BUCKET_NAME"),
+            "api_key": os.getenv("GEMINI_API_KEY"),
+        }
+        missing = [name for name, value in settings.items() if not value]
+        if missing:
+            raise ValueError(f"Missing settings for the VisualsAgent: {', '.join(missing)}")
+        _visuals_agent = VisualsAgent(
+            model_name=os.getenv("IMAGEN_MODEL_NAME"),
+            gemini_model_name=os.getenv("GEMINI_MODEL_NAME", ""),
+            **settings,
+        )
+    return _visuals_agent
@@ -3,7 +3,8 @@ import os
 import shutil
 
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
@@ -13,9 +14,14 @@ from .routers import (
     clips as clips_router,
     generation as generation_router,
     admin as admin_router,
+    topics as topics_router,
     db_upload as db_upload_router,
+    jobs as jobs_router,
 )
 from .services import session_service, artifact_service
+from .quotas import QuotaExceededError
+from .compositing.pool import render_pool
+from .warmup import warm_up
 
 # Load environment variables from .env file
 load_dotenv()
@@ -34,6 +40,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(QuotaExceededError)
+async def quota_exceeded_handler(request: Request, exc: QuotaExceededError):
+    """Rejects work that would exceed the user's daily quota with a 429."""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc), "resource": exc.resource, "limit": exc.limit, "used": exc.used},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # A simple in-memory cache for downloaded video paths
 video_cache = {}
 
@@ -53,98 +68,121 @@ def shutdown_event():
         except Exception as e:
             print(f"   Error removing cache for {video_id}: {e}")
     print("Video cache cleanup complete.")
+    render_pool.shutdown()
 
 
 @app.on_event("startup")
 async def startup_event():
     """
-    On startup, instantiate all the agents to register their event handlers
-    and start any background tasks.
+    On startup, begin warming up the agents in the background, so the server
+    listens right away and /health reports 503 until every agent is ready.
+    """
+    app.state.video_cache = video_cache
+    app.state.ingestion_agent = None
+    app.state.warm_up_task = asyncio.create_task(warm_up_agents())
+
+
+async def warm_up_agents():
+    """
+    Instantiates all the agents to register their event handlers, loads the
+    Imagen models and starts any background tasks. Agents are built
+    concurrently off the event loop and each one's init time is reported.
     """
     # Import agents here to avoid circular dependencies on startup
     from src.agents.analysis import AnalysisAgent
     from src.agents.copywriter import CopywriterAgent
+    from src.agents.embedding import EmbeddingAgent
+    from src.agents.indexing import IndexingAgent
     from src.agents.ingestion import IngestionAgent
     from src.agents.publisher import PublisherAgent
     from src.agents.transcription import TranscriptionAgent
-    from src.agents.visuals import VisualsAgent
-
-    app.state.video_cache = video_cache
+    from src.agents.visuals import get_visuals_agent
+    from src.imagen.registry import imagen_models
 
     print("Application starting up...")
-    
-    gcs_bucket_name = os.getenv("GCS_BUCKET_NAME")
-    if not gcs_bucket_name:
-        print("🚨 GCS_BUCKET_NAME is not configured. File storage agents will fail.")
-        return
-
-    gemini_api_key = os.getenv("GEMINI_API_KEY")
-    if not gemini_api_key or gemini_api_key == "YOUR_GEMINI_API_KEY_HERE":
-        print("🚨 GEMINI_API_KEY is not configured. Transcription and other AI agents will fail.")
-        return
-
-    ffmpeg_path = os.getenv("FFMPEG_PATH")
-    if not ffmpeg_path:
-        print("⚪️ FFMPEG_PATH environment variable not set. Transcription will try to use 'ffmpeg' from the system's PATH.")
-
-    gcp_project_id = os.getenv("GOOGLE_CLOUD_PROJECT")
-    gcp_region = os.getenv("GCP_REGION")
-    if not gcp_project_id or not gcp_region:
-        print("🚨 GOOGLE_CLOUD_PROJECT or GCP_REGION are not configured. The VisualsAgent will fail.")
-
-    imagen_model_name = os.getenv("IMAGEN_MODEL_NAME", "")
-    print(f"⚪️ Using Imagen model: {imagen_model_name}")
-
-    gemini_model_name = os.getenv("GEMINI_MODEL_NAME", "")
-    print(f"⚪️ Using Gemini model: {gemini_model_name}")
-
-    api_key = os.getenv("YOUTUBE_API_KEY")
-    channel_id = os.getenv("TARGET_CHANNEL_ID")
-    
-    if not api_key or api_key == "YOUR_YOUTUBE_API_KEY":
-        print("🚨 YOUTUBE_API_KEY is not set or is invalid. Please set it in your .env file.")
-        app.state.ingestion_agent = None
-        return
-        
     try:
-        print("Attempting to initialize IngestionAgent...")
-        app.state.ingestion_agent = IngestionAgent(api_key=api_key, channel_id=channel_id)
-        print("✅ IngestionAgent initialized successfully.")
+        gcs_bucket_name = os.getenv("GCS_BUCKET_NAME")
+        if not gcs_bucket_name:
+            print("🚨 GCS_BUCKET_NAME is not configured. File storage agents will fail.")
+            warm_up.fail("config", "GCS_BUCKET_NAME is not configured.")
+            return
+
+        gemini_api_key = os.getenv("GEMINI_API_KEY")
+        if not gemini_api_key or gemini_api_key == "YOUR_GEMINI_API_KEY_HERE":
+            print("🚨 GEMINI_API_KEY is not configured. Transcription and other AI agents will fail.")
+            warm_up.fail("config", "GEMINI_API_KEY is not configured.")
+            return
+
+        ffmpeg_path = os.getenv("FFMPEG_PATH")
+        if not ffmpeg_path:
+            print("⚪️ FFMPEG_PATH environment variable not set. Transcription will try to use 'ffmpeg' from the system's PATH.")
+
+        gcp_project_id = os.getenv("GOOGLE_CLOUD_PROJECT")
+        gcp_region = os.getenv("GCP_REGION")
+        if not gcp_project_id or not gcp_region:
+            print("🚨 GOOGLE_CLOUD_PROJECT or GCP_REGION are not configured. The VisualsAgent will fail.")
+
+        imagen_model_name = os.getenv("IMAGEN_MODEL_NAME", "")
+        print(f"⚪️ Using Imagen model: {imagen_model_name}")
+
+        gemini_model_name = os.getenv("GEMINI_MODEL_NAME", "")
+        print(f"⚪️ Using Gemini model: {gemini_model_name}")
+
+        api_key = os.getenv("YOUTUBE_API_KEY")
+        channel_id = os.getenv("TARGET_CHANNEL_ID")
+        
+        if not api_key or api_key == "YOUR_YOUTUBE_API_KEY":
+            print("🚨 YOUTUBE_API_KEY is not set or is invalid. Please set it in your .env file.")
+            warm_up.fail("ingestion", "YOUTUBE_API_KEY is not set or is invalid.")
+            return
+
+        await warm_up.run([
+            [("ingestion", lambda: IngestionAgent(api_key=api_key, channel_id=channel_id))],
+            [("transcription", lambda: TranscriptionAgent(
+                api_key=gemini_api_key,
+                bucket_name=gcs_bucket_name,
+                ffmpeg_path=ffmpeg_path,
+                model_name=gemini_model_name
+            ))],
+            [
+                # Subscribed before the AnalysisAgent so a transcript is searchable as soon as it is ready.
+                ("indexing", lambda: IndexingAgent(bucket_name=gcs_bucket_name)),
+                ("analysis", lambda: AnalysisAgent(api_key=gemini_api_key, bucket_name=gcs_bucket_name, model_name=gemini_model_name)),
+            ],
+            [
+                # Embedding is quick, so it runs before copywriting picks up the analysis.
+                ("embedding", lambda: EmbeddingAgent(bucket_name=gcs_bucket_name)),
+                ("copywriter", lambda: CopywriterAgent(api_key=gemini_api_key, bucket_name=gcs_bucket_name, model_name=gemini_model_name)),
+            ],
+            [
+                # One shared agent, so CopyReady is handled once and routers reuse its models.
+                ("visuals", get_visuals_agent),
+                ("imagen_models", imagen_models.warm),
+            ],
+            [("publisher", lambda: PublisherAgent(bucket_name=gcs_bucket_name))],
+        ])
+
+        app.state.ingestion_agent = warm_up.results.get("ingestion")
+        app.state.analysis_agent = warm_up.results.get("analysis")
+        app.state.copywriter_agent = warm_up.results.get("copywriter")
+        app.state.visuals_agent = warm_up.results.get("visuals")
+        if warm_up.components.get("imagen_models", {}).get("ok"):
+            print(f"✅ Imagen models loaded: {', '.join(imagen_models.loaded())}")
+
+        enable_auto_ingestion = os.getenv("ENABLE_AUTO_INGESTION", "false").lower() == "true"
+        
+        if enable_auto_ingestion and app.state.ingestion_agent:
+            print("✅ Auto-ingestion monitoring is ENABLED.")
+            asyncio.create_task(app.state.ingestion_agent.start_monitoring())
+        else:
+            print("⚪️ Auto-ingestion monitoring is DISABLED. Use the web UI for on-demand processing.")
+        
+        print("All agents have been initialized.")
     except Exception as e:
-        print("🚨🚨🚨 FAILED TO INITIALIZE INGESTION AGENT 🚨🚨🚨")
-        print(f"The error was: {e}")
-        import traceback
-        traceback.print_exc()
-        app.state.ingestion_agent = None
-
-    enable_auto_ingestion = os.getenv("ENABLE_AUTO_INGESTION", "false").lower() == "true"
-    
-    if enable_auto_ingestion and app.state.ingestion_agent:
-        print("✅ Auto-ingestion monitoring is ENABLED.")
-        asyncio.create_task(app.state.ingestion_agent.start_monitoring())
-    else:
-        print("⚪️ Auto-ingestion monitoring is DISABLED. Use the web UI for on-demand processing.")
-    
-    TranscriptionAgent(
-        api_key=gemini_api_key, 
-        bucket_name=gcs_bucket_name,
-        ffmpeg_path=ffmpeg_path,
-        model_name=gemini_model_name
-    )
-    AnalysisAgent(api_key=gemini_api_key, bucket_name=gcs_bucket_name, model_name=gemini_model_name)
-    CopywriterAgent(api_key=gemini_api_key, bucket_name=gcs_bucket_name, model_name=gemini_model_name)
-    
-    app.state.visuals_agent = VisualsAgent(
-        project_id=gcp_project_id,
-        location=gcp_region,
-        bucket_name=gcs_bucket_name,
-        api_key=gemini_api_key,
-        model_name=imagen_model_name,
-        gemini_model_name=gemini_model_name
-    )
-    PublisherAgent(bucket_name=gcs_bucket_name)
-    
-    print("All agents have been initialized.")
+        print(f"🚨 Warm-up failed: {e}")
+        warm_up.fail("warm_up", str(e))
+    finally:
+        warm_up.finish()
 
 
 app.include_router(auth_router.router)
@@ -152,6 +190,8 @@ app.include_router(videos_router.router)
 app.include_router(clips_router.router)
 app.include_router(generation_router.router)
 app.include_router(admin_router.router)
+app.include_router(topics_router.router)
 app.include_router(db_upload_router.router)
+app.include_router(jobs_router.router)
 
 app.mount("/", StaticFiles(directory="frontend/dist", html=True), name="static-frontend") 
\ No newline at end of file
@@ -0,0 +1,105 @@
+import asyncio
+import io
+import os
+from typing import Dict, Iterable, Optional
+
+from google.cloud import storage
+from PIL import Image, features
+
+from .pool import render_pool
+
+# Longest side in pixels of each variant; originals are never upscaled.
+VARIANTS = {
+    "card": 320,
+    "preview": 768,
+    "full": 1600,
+}
+# Encoders in order of preference. AVIF is skipped where Pillow was built without it.
+DERIVATIVE_FORMATS = [
+    name.strip() for name in os.getenv("IMAGE_DERIVATIVE_FORMATS", "webp,avif").split(",")
+    if name.strip() and features.check(name.strip())
+]
+ENCODER_OPTIONS = {
+    "webp": {"quality": 82, "method": 4},
+    "avif": {"quality": 60, "speed": 8},
+}
+CONTENT_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+# Derivative paths are content-addressed by their original's path, so they never change.
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+DERIVATIVES_PREFIX = "derivatives"
+
+
+def derivative_path(original_path: str, variant: str, image_format: str) -> str:
+    """derivatives/<original path without extension>/<variant>.<format>"""
+    stem, _ = os.path.splitext(original_path)
+    return f"{DERIVATIVES_PREFIX}/{stem}/{variant}.{image_format}"
+
+
+def render_derivatives(image_bytes: bytes, formats: list) -> Dict[str, Dict[str, bytes]]:
+    """Encodes every variant of an image in every format. Runs in a render worker."""
+    original = Image.open(io.BytesIO(image_bytes))
+    original = original.convert("RGBA" if original.mode in ("RGBA", "LA", "P") else "RGB")
+    rendered = {}
+    for variant, longest_side in VARIANTS.items():
+        image = original
+        if max(original.size) > longest_side:
+            image = original.copy()
+            image.thumbnail((longest_side, longest_side), Image.LANCZOS)
+        rendered[variant] = {}
+        for image_format in formats:
+            output = io.BytesIO()
+            image.save(output, format=image_format.upper(), **ENCODER_OPTIONS.get(image_format, {}))
+            rendered[variant][image_format] = output.getvalue()
+    return rendered
+
+
+async def create_derivatives(bucket_name: str, gcs_uri: str, image_bytes: bytes, storage_client: Optional[storage.Client] = None) -> dict:
+    """
+    Renders and uploads the variants of an uploaded image. Returns
+    {variant: {format: {"gcs_uri", "bytes"}}}, recorded next to the original so
+    readers can pick the smallest file a client accepts.
+    """
+    if not DERIVATIVE_FORMATS:
+        return {}
+    bucket = (storage_client or storage.Client()).bucket(bucket_name)
+    original_path = gcs_uri.replace(f"gs://{bucket_name}/", "")
+    rendered = await render_pool.run(render_derivatives, image_bytes, DERIVATIVE_FORMATS)
+
+    async def upload(variant, image_format, data):
+        blob = bucket.blob(derivative_path(original_path, variant, image_format))
+        blob.cache_control = CACHE_CONTROL
+        await asyncio.to_thread(blob.upload_from_string, data, CONTENT_TYPES[image_format])
+        return variant, image_format, {"gcs_uri": f"gs://{bucket_name}/{blob.name}", "bytes": len(data)}
+
+    uploads = await asyncio.gather(*(
+        upload(variant, image_format, data)
+        for variant, encoded in rendered.items()
+        for image_format, data in encoded.items()
+    ))
+    derivatives: Dict[str, dict] = {}
+    for variant, image_format, entry in uploads:
+        derivatives.setdefault(variant, {})[image_format] = entry
+    return derivatives
+
+
+def accepted_formats(accept_header: Optional[str]) -> set:
+    """Image formats a client accepts; WebP is assumed, as every current browser decodes it."""
+    accepted = {"webp"}
+    for image_format, content_type in CONTENT_TYPES.items():
+        if accept_header and content_type in accept_header:
+            accepted.add(image_format)
+    return accepted
+
+
+def pick_derivative(image: dict, variant: str, accepted: Iterable[str]) -> Optional[str]:
+    """
+    The GCS URI of the smallest file of `variant` in an accepted format, or
+    None if the image has no such derivative (e.g. images made before them).
+    """
+    options = [
+        entry for image_format, entry in ((image.get("derivatives") or {}).get(variant) or {}).items()
+        if image_format in accepted
+    ]
+    if not options:
+        return None
+    return min(options, key=lambda entry: entry["bytes"])["gcs_uri"]
@@ -0,0 +1,36 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+# Image rendering is CPU-bound, so it runs in worker processes rather than threads.
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "0")) or max(1, min(4, (os.cpu_count() or 1) - 1))
+
+
+class RenderPool:
+    """
+    A process pool shared by all compositing work, started on first use. Each
+    worker keeps its own font and template caches, so they stay warm across jobs.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def run(self, fn: Callable, *args):
+        """Runs a picklable, module-level function in a worker and returns its result."""
+        return await asyncio.get_running_loop().run_in_executor(self._pool(), fn, *args)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Global instance of the RenderPool
+render_pool = RenderPool(RENDER_WORKERS)
@@ -0,0 +1,104 @@
+import io
+import os
+from typing import Tuple
+
+from PIL import Image, ImageDraw, ImageFilter, ImageOps, ImageStat
+
+from .text import contrast_ratio, fit_text, line_height, relative_luminance, text_width
+
+CARD_SIZE = (1080, 1080)
+MARGIN = 0.08
+LIGHT_TEXT = (255, 255, 255)
+DARK_TEXT = (24, 24, 24)
+# Below this contrast against the background, or above this luminance spread
+# (a busy region), the text gets a translucent panel behind it.
+MIN_CONTRAST = 4.5
+MAX_BUSYNESS = 0.18
+QUOTE_FONT_MAX_SIZE = int(os.getenv("QUOTE_CARD_MAX_FONT_SIZE", "72"))
+
+
+def _regions(size: Tuple[int, int], text_height: int):
+    """Candidate text boxes (left, top, right, bottom): top, middle and bottom of the card."""
+    width, height = size
+    margin = int(width * MARGIN)
+    top_options = [margin, (height - text_height) // 2, height - margin - text_height]
+    return [(margin, top, width - margin, top + text_height) for top in top_options]
+
+
+def _percentile(histogram, fraction: float) -> int:
+    target, seen = fraction * sum(histogram), 0
+    for value, count in enumerate(histogram):
+        seen += count
+        if seen >= target:
+            return value
+    return len(histogram) - 1
+
+
+def _region_stats(gray: Image.Image, box) -> Tuple[float, float, float]:
+    """
+    The relative luminance of the darkest and lightest parts of a box (5th and
+    95th percentiles) and the spread of its gray levels, all 0-1.
+    """
+    region = gray.crop(box)
+    histogram = region.histogram()
+    dark, light = _percentile(histogram, 0.05), _percentile(histogram, 0.95)
+    busyness = ImageStat.Stat(region).stddev[0] / 255
+    return relative_luminance((dark,) * 3), relative_luminance((light,) * 3), busyness
+
+
+def _worst_contrast(text_color, dark: float, light: float) -> float:
+    text = relative_luminance(text_color)
+    return min(contrast_ratio(text, dark), contrast_ratio(text, light))
+
+
+def render_quote_card(background_png: bytes, quote: str) -> bytes:
+    """
+    Lays a quote over a background image and returns the card as PNG bytes.
+    The text goes in the calmest of three bands, in whichever of light or dark
+    text contrasts more with all of it, with a panel behind it when even that
+    is not enough.
+    """
+    background = Image.open(io.BytesIO(background_png)).convert("RGB")
+    card = ImageOps.fit(background, CARD_SIZE, method=Image.LANCZOS)
+    width, height = card.size
+    margin = int(width * MARGIN)
+    text = "“" + quote.strip().strip('"“”') + "”"
+
+    font, lines = fit_text(
+        text, "bold",
+        max_width=width - 2 * margin,
+        max_height=int(height * 0.45),
+        max_size=QUOTE_FONT_MAX_SIZE,
+        max_lines=8,
+    )
+    step = line_height(font)
+    text_height = step * len(lines)
+
+    gray = card.convert("L").filter(ImageFilter.BoxBlur(2))
+    candidates = [(_region_stats(gray, box), box) for box in _regions(card.size, text_height)]
+    (dark, light, busyness), box = min(candidates, key=lambda candidate: candidate[0][2])
+
+    # Pick the text color that contrasts best with every part of the box.
+    fill = max((LIGHT_TEXT, DARK_TEXT), key=lambda color: _worst_contrast(color, dark, light))
+    shadow = DARK_TEXT if fill == LIGHT_TEXT else LIGHT_TEXT
+
+    overlay = Image.new("RGBA", card.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    if _worst_contrast(fill, dark, light) < MIN_CONTRAST or busyness > MAX_BUSYNESS:
+        pad = int(margin * 0.5)
+        draw.rounded_rectangle(
+            (box[0] - pad, box[1] - pad, box[2] + pad, box[3] + pad),
+            radius=pad, fill=shadow + (150,),
+        )
+
+    offset = max(1, font.size // 24)
+    for i, line in enumerate(lines):
+        x = (width - text_width(line, font)) / 2
+        y = box[1] + i * step
+        draw.text((x + offset, y + offset), line, font=font, fill=shadow + (110,))
+        draw.text((x, y), line, font=font, fill=fill + (255,))
+
+    card = Image.alpha_composite(card.convert("RGBA"), overlay).convert("RGB")
+    output = io.BytesIO()
+    card.save(output, format="PNG", optimize=True)
+    return output.getvalue()
@@ -0,0 +1,124 @@
+import os
+from typing import Dict, List, Literal, Optional
+
+from pydantic import BaseModel, Field, field_validator
+
+from ..database import db
+
+# Custom template fonts must be files in this directory, named without a path.
+FONT_DIR = os.getenv("RENDER_FONT_DIR", "/usr/share/fonts/truetype")
+TEMPLATES_COLLECTION = "thumbnail_templates"
+DEFAULT_TEMPLATE = "bold"
+
+
+class SafeArea(BaseModel):
+    """The box the title is laid out in, as fractions of the output's width and height."""
+    left: float = Field(0.06, ge=0, le=1)
+    top: float = Field(0.08, ge=0, le=1)
+    right: float = Field(0.6, ge=0, le=1)
+    bottom: float = Field(0.92, ge=0, le=1)
+
+
+class ThumbnailTemplate(BaseModel):
+    """A brand layout for composited thumbnails: title font, colors, scrim and safe areas."""
+    name: str
+    title_font: str = "bold"
+    title_color: str = "#FFFFFF"
+    stroke_color: str = "#000000"
+    # Outline width as a fraction of the font size.
+    stroke_width: float = Field(0.05, ge=0, le=0.2)
+    accent_color: Optional[str] = "#FFCC00"
+    scrim: Literal["left", "bottom", "none"] = "left"
+    scrim_color: str = "#000000"
+    scrim_opacity: float = Field(0.65, ge=0, le=1)
+    align: Literal["left", "center"] = "left"
+    uppercase: bool = True
+    max_lines: int = Field(3, ge=1, le=6)
+    # Largest title size on a 1280px-wide output; scaled with the output's longer side.
+    max_font_size: int = Field(140, ge=16, le=400)
+    landscape_safe_area: SafeArea = SafeArea()
+    vertical_safe_area: SafeArea = SafeArea(left=0.08, top=0.55, right=0.92, bottom=0.8)
+
+    @field_validator("title_font")
+    @classmethod
+    def _known_font(cls, value: str) -> str:
+        if value in ("bold", "regular"):
+            return value
+        if os.path.basename(value) != value or not os.path.isfile(os.path.join(FONT_DIR, value)):
+            raise ValueError(f"Unknown font '{value}'. Use 'bold', 'regular' or a font file in {FONT_DIR}.")
+        return value
+
+    def render_spec(self) -> dict:
+        """The template as plain data for the render workers, with the font resolved to a path."""
+        spec = self.model_dump()
+        if self.title_font not in ("bold", "regular"):
+            spec["title_font"] = os.path.join(FONT_DIR, self.title_font)
+        return spec
+
+
+BUILTIN_TEMPLATES: Dict[str, ThumbnailTemplate] = {
+    template.name: template for template in [
+        ThumbnailTemplate(name="bold"),
+        ThumbnailTemplate(
+            name="clean",
+            scrim="bottom",
+            scrim_opacity=0.55,
+            align="center",
+            uppercase=False,
+            accent_color=None,
+            stroke_width=0.0,
+            landscape_safe_area=SafeArea(left=0.06, top=0.62, right=0.94, bottom=0.94),
+            vertical_safe_area=SafeArea(left=0.08, top=0.7, right=0.92, bottom=0.86),
+        ),
+        ThumbnailTemplate(
+            name="minimal",
+            scrim="none",
+            accent_color=None,
+            stroke_width=0.08,
+            landscape_safe_area=SafeArea(left=0.05, top=0.05, right=0.7, bottom=0.5),
+        ),
+    ]
+}
+
+
+class TemplateStore:
+    """
+    Serves the built-in templates plus each user's own, which are kept in
+    Firestore (thumbnail_templates/<user_id>) and cached in memory per user.
+    """
+
+    def __init__(self):
+        self._cache: Dict[str, dict] = {}
+
+    async def _user_doc(self, user_id: str) -> dict:
+        if user_id not in self._cache:
+            doc = await db.collection(TEMPLATES_COLLECTION).document(user_id).get()
+            self._cache[user_id] = (doc.to_dict() or {}) if doc.exists else {}
+        return self._cache[user_id]
+
+    async def list(self, user_id: Optional[str]) -> List[ThumbnailTemplate]:
+        custom = (await self._user_doc(user_id)).get("templates", {}) if user_id else {}
+        templates = dict(BUILTIN_TEMPLATES)
+        templates.update({name: ThumbnailTemplate(**data) for name, data in custom.items()})
+        return list(templates.values())
+
+    async def get(self, user_id: Optional[str], name: Optional[str] = None) -> ThumbnailTemplate:
+        """Returns the named template, or the user's default one. Raises KeyError if it does not exist."""
+        user_doc = await self._user_doc(user_id) if user_id else {}
+        name = name or user_doc.get("default_template") or DEFAULT_TEMPLATE
+        if data := user_doc.get("templates", {}).get(name):
+            return ThumbnailTemplate(**data)
+        if name in BUILTIN_TEMPLATES:
+            return BUILTIN_TEMPLATES[name]
+        raise KeyError(name)
+
+    async def save(self, user_id: str, template: ThumbnailTemplate, make_default: bool = False):
+        fields = {"templates": {template.name: template.model_dump()}}
+        if make_default:
+            fields["default_template"] = template.name
+        await db.collection(TEMPLATES_COLLECTION).document(user_id).set(fields, merge=True)
+        self._cache.pop(user_id, None)
+
+
+# Global instance of the TemplateStore
+template_store = TemplateStore()
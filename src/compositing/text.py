@@ -0,0 +1,124 @@
+import os
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+# Fonts are looked up in this order; the Docker image ships DejaVu (fonts-dejavu-core).
+FONT_PATHS = {
+    "bold": [
+        os.getenv("RENDER_FONT_BOLD", ""),
+        "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+        "DejaVuSans-Bold.ttf",
+    ],
+    "regular": [
+        os.getenv("RENDER_FONT_REGULAR", ""),
+        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+        "DejaVuSans.ttf",
+    ],
+}
+
+# A scratch surface for measuring text without an image to draw on.
+_MEASURE = ImageDraw.Draw(Image.new("L", (1, 1)))
+
+
+@lru_cache(maxsize=128)
+def load_font(style: str, size: int) -> ImageFont.FreeTypeFont:
+    """
+    Loads a font once per (style, size) and process. `style` is "bold",
+    "regular" or the path of a .ttf/.otf file, which falls back to regular.
+    """
+    for path in FONT_PATHS.get(style) or [style] + FONT_PATHS["regular"]:
+        if not path:
+            continue
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size)
+
+
+def text_width(text: str, font: ImageFont.FreeTypeFont) -> float:
+    return _MEASURE.textlength(text, font=font)
+
+
+def line_height(font: ImageFont.FreeTypeFont, spacing: float = 1.2) -> int:
+    ascent, descent = font.getmetrics()
+    return int((ascent + descent) * spacing)
+
+
+def wrap_text(text: str, font: ImageFont.FreeTypeFont, max_width: int) -> List[str]:
+    """
+    Breaks text into lines no wider than max_width, greedily by word. A word
+    wider than the line on its own is put on a line by itself.
+    """
+    lines, current = [], ""
+    for word in text.split():
+        candidate = f"{current} {word}".strip()
+        if current and text_width(candidate, font) > max_width:
+            lines.append(current)
+            current = word
+        else:
+            current = candidate
+    if current:
+        lines.append(current)
+    return lines
+
+
+def fit_text(
+    text: str,
+    style: str,
+    max_width: int,
+    max_height: int,
+    max_size: int,
+    min_size: int = 14,
+    max_lines: Optional[int] = None,
+) -> Tuple[ImageFont.FreeTypeFont, List[str]]:
+    """
+    Finds the largest font size at which the wrapped text fits the box, by
+    binary search over sizes. At min_size the text is used as is, and the last
+    line is ellipsized if max_lines is exceeded.
+    """
+    def layout(size):
+        font = load_font(style, size)
+        lines = wrap_text(text, font, max_width)
+        fits = (
+            len(lines) * line_height(font) <= max_height
+            and all(text_width(line, font) <= max_width for line in lines)
+            and (max_lines is None or len(lines) <= max_lines)
+        )
+        return font, lines, fits
+
+    low, high = min_size, max(min_size, max_size)
+    best = None
+    while low <= high:
+        size = (low + high) // 2
+        font, lines, fits = layout(size)
+        if fits:
+            best = (font, lines)
+            low = size + 1
+        else:
+            high = size - 1
+    if best:
+        return best
+
+    font, lines, _ = layout(min_size)
+    if max_lines is not None and len(lines) > max_lines:
+        lines = lines[:max_lines]
+        lines[-1] = lines[-1].rstrip(".,;:") + "…"
+    return font, lines
+
+
+def relative_luminance(rgb) -> float:
+    """WCAG relative luminance of an sRGB color, 0 (black) to 1 (white)."""
+    def channel(value):
+        value /= 255
+        return value / 12.92 if value <= 0.03928 else ((value + 0.055) / 1.055) ** 2.4
+    r, g, b = (channel(v) for v in rgb[:3])
+    return 0.2126 * r + 0.7152 * g + 0.0722 * b
+
+
+def contrast_ratio(a: float, b: float) -> float:
+    """WCAG contrast ratio between two relative luminances."""
+    lighter, darker = max(a, b), min(a, b)
+    return (lighter + 0.05) / (darker + 0.05)
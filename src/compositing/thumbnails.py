@@ -0,0 +1,113 @@
+import hashlib
+import io
+import json
+from functools import lru_cache
+from typing import List, Tuple
+
+from PIL import Image, ImageColor, ImageDraw, ImageOps
+
+from .text import fit_text, line_height, text_width
+
+FORMATS = {
+    "landscape": (1280, 720),
+    "vertical": (1080, 1920),
+}
+JPEG_QUALITY = 90
+
+# Decoded backgrounds, kept per worker so every variant of one image decodes it once.
+_backgrounds = {}
+MAX_CACHED_BACKGROUNDS = 8
+
+
+def _background(background_png: bytes) -> str:
+    """Decodes a background once per worker and returns its cache key."""
+    key = hashlib.sha1(background_png).hexdigest()
+    if key not in _backgrounds:
+        if len(_backgrounds) >= MAX_CACHED_BACKGROUNDS:
+            _backgrounds.pop(next(iter(_backgrounds)))
+        _backgrounds[key] = Image.open(io.BytesIO(background_png)).convert("RGB")
+    return key
+
+
+@lru_cache(maxsize=64)
+def _fitted_background(background_key: str, size: Tuple[int, int]) -> Image.Image:
+    return ImageOps.fit(_backgrounds[background_key], size, method=Image.LANCZOS, centering=(0.5, 0.4))
+
+
+@lru_cache(maxsize=64)
+def _scrim(template_json: str, size: Tuple[int, int]) -> Image.Image:
+    """The template's translucent gradient layer for one output size, built once per worker."""
+    template = json.loads(template_json)
+    if template["scrim"] == "none":
+        return Image.new("RGBA", size, (0, 0, 0, 0))
+
+    width, height = size
+    if template["scrim"] == "bottom" or height > width:
+        # Darkest at the bottom edge; vertical outputs always put their title low.
+        alpha = Image.linear_gradient("L").resize(size)
+    else:
+        # Darkest at the left edge, behind a left-hand title.
+        alpha = ImageOps.mirror(Image.linear_gradient("L").rotate(90)).resize(size)
+    alpha = alpha.point(lambda value: int(value * template["scrim_opacity"]))
+    layer = Image.new("RGBA", size, ImageColor.getrgb(template["scrim_color"]) + (0,))
+    layer.putalpha(alpha)
+    return layer
+
+
+def _render(background_key: str, title: str, template: dict, template_json: str, output_format: str) -> bytes:
+    size = FORMATS[output_format]
+    width, height = size
+    area = template["vertical_safe_area" if output_format == "vertical" else "landscape_safe_area"]
+    left, top = int(area["left"] * width), int(area["top"] * height)
+    right, bottom = max(left + 1, int(area["right"] * width)), max(top + 1, int(area["bottom"] * height))
+
+    image = _fitted_background(background_key, size).convert("RGBA")
+    image = Image.alpha_composite(image, _scrim(template_json, size))
+
+    text = title.upper() if template["uppercase"] else title
+    font, lines = fit_text(
+        text, template["title_font"],
+        max_width=right - left,
+        max_height=bottom - top,
+        max_size=template["max_font_size"] * max(size) // 1280,
+        min_size=24,
+        max_lines=template["max_lines"],
+    )
+    step = line_height(font, spacing=1.05)
+    block_height = step * len(lines)
+    # Landscape titles are centered vertically in the safe area; vertical ones hang from its top.
+    y = top + (bottom - top - block_height) // 2 if output_format == "landscape" else top
+
+    draw = ImageDraw.Draw(image)
+    stroke = int(font.size * template["stroke_width"])
+    if template["accent_color"]:
+        bar = max(4, font.size // 10)
+        bar_x = left if template["align"] == "left" else (width - font.size * 2) // 2
+        draw.rectangle((bar_x, y - bar * 3, bar_x + font.size * 2, y - bar * 2), fill=template["accent_color"])
+
+    for line in lines:
+        line_width = text_width(line, font)
+        x = left if template["align"] == "left" else left + (right - left - line_width) / 2
+        draw.text(
+            (x, y), line, font=font, fill=template["title_color"],
+            stroke_width=stroke, stroke_fill=template["stroke_color"],
+        )
+        y += step
+
+    output = io.BytesIO()
+    image.convert("RGB").save(output, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+def render_thumbnails(background_png: bytes, jobs: List[Tuple[str, dict, str]]) -> List[bytes]:
+    """
+    Renders (title, template spec, format) jobs over one background and returns
+    JPEG bytes for each. Runs in a render worker; the decoded background, the
+    resized backgrounds, the template scrims and the fonts are cached there.
+    """
+    background_key = _background(background_png)
+    results = []
+    for title, template, output_format in jobs:
+        template_json = json.dumps(template, sort_keys=True)
+        results.append(_render(background_key, title, template, template_json, output_format))
+    return results
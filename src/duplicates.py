@@ -0,0 +1,213 @@
+import asyncio
+import json
+import os
+from collections import defaultdict
+from typing import DefaultDict, Dict, Optional
+
+import numpy as np
+from google.cloud import storage
+
+from .database import db
+from .fingerprint import FingerprintIndex, fingerprint_seconds
+from .transcript_index import TranscriptIndex
+from .transcript_search import search_index_store
+from .vector_index import vector_index_store
+from .topics import topic_clusterer
+
+DUPLICATE_DETECTION_ENABLED = os.getenv("DUPLICATE_DETECTION_ENABLED", "true").lower() == "true"
+# Videos are only matched against others in the same scope: their owner's, or the
+# auto-ingested channel's.
+CHANNEL_SCOPE = "channel"
+
+
+def fingerprint_scope(video_data: dict) -> str:
+    return video_data.get("user_id") or CHANNEL_SCOPE
+
+
+class FingerprintStore:
+    """
+    Saves each video's audio fingerprint to GCS (fingerprints/<video_id>.fp, raw
+    little-endian uint32) and keeps an in-memory FingerprintIndex per scope,
+    loaded lazily from the scope's saved fingerprints and extended as videos
+    are fingerprinted.
+    """
+
+    def __init__(self, bucket_name: str):
+        self.bucket_name = bucket_name
+        self.storage_client = storage.Client()
+        self._indexes: Dict[str, FingerprintIndex] = {}
+        self._locks: DefaultDict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    async def _download(self, gcs_uri: str) -> np.ndarray:
+        blob = self.storage_client.bucket(self.bucket_name).blob(gcs_uri.replace(f"gs://{self.bucket_name}/", ""))
+        return np.frombuffer(await asyncio.to_thread(blob.download_as_bytes), dtype="<u4").astype(np.uint32)
+
+    async def _index(self, scope: str) -> FingerprintIndex:
+        async with self._locks[scope]:
+            if scope not in self._indexes:
+                index = FingerprintIndex()
+                docs = [
+                    doc.to_dict()
+                    async for doc in db.collection("videos").where("fingerprint_scope", "==", scope).stream()
+                ]
+                docs = [data for data in docs if data.get("audio_fingerprint_gcs_uri")]
+                fingerprints = await asyncio.gather(*(self._download(data["audio_fingerprint_gcs_uri"]) for data in docs))
+                for data, fingerprint in zip(docs, fingerprints):
+                    index.add(data["video_id"], fingerprint)
+                print(f"   Loaded {len(docs)} audio fingerprint(s) for scope {scope}.")
+                self._indexes[scope] = index
+            return self._indexes[scope]
+
+    async def find_duplicate(self, scope: str, video_id: str, fingerprint: np.ndarray) -> Optional[dict]:
+        """Returns the best match for `fingerprint` among the scope's other videos, or None."""
+        index = await self._index(scope)
+        while match := await asyncio.to_thread(index.match, fingerprint, video_id):
+            # Another instance may have deleted the matched video since this index was loaded.
+            if (await db.collection("videos").document(match["video_id"]).get()).exists:
+                return match
+            index.remove(match["video_id"])
+        return None
+
+    async def add(self, scope: str, video_id: str, fingerprint: np.ndarray):
+        """Saves a video's fingerprint and adds it to its scope's index."""
+        blob_path = f"fingerprints/{video_id}.fp"
+        blob = self.storage_client.bucket(self.bucket_name).blob(blob_path)
+        await asyncio.to_thread(
+            blob.upload_from_string, fingerprint.astype("<u4").tobytes(), "application/octet-stream"
+        )
+        await db.collection("videos").document(video_id).update({
+            "audio_fingerprint_gcs_uri": f"gs://{self.bucket_name}/{blob_path}",
+            "fingerprint_scope": scope,
+            "audio_duration_seconds": round(fingerprint_seconds(fingerprint), 2),
+        })
+        index = await self._index(scope)
+        index.add(video_id, fingerprint)
+
+    async def remove(self, scope: str, video_id: str):
+        """Drops a deleted video from its scope's index, if that index is loaded."""
+        if index := self._indexes.get(scope):
+            index.remove(video_id)
+
+
+def _shift(start: float, end: float, offset: float, duration: float):
+    """Maps a [start, end] span of the source onto the new video, or None if it falls outside it."""
+    start, end = start - offset, end - offset
+    if end <= 0 or start >= duration:
+        return None
+    return max(start, 0.0), min(end, duration)
+
+
+def shift_transcript(transcript_json: dict, offset: float, duration: float) -> dict:
+    segments = []
+    for segment in transcript_json.get("segments") or []:
+        if span := _shift(segment["start"], segment["end"], offset, duration):
+            segments.append({**segment, "start": round(span[0], 3), "end": round(span[1], 3)})
+    full_transcript = " ".join(segment["text"].strip() for segment in segments).strip()
+    if not transcript_json.get("segments"):
+        # Untimed transcripts cannot be trimmed, so they are reused whole.
+        full_transcript = transcript_json.get("full_transcript", "")
+    return {**transcript_json, "full_transcript": full_transcript, "segments": segments}
+
+
+def shift_structured_data(structured_data: dict, offset: float, duration: float) -> dict:
+    shifted = dict(structured_data)
+    candidates = []
+    for candidate in structured_data.get("shorts_candidates") or []:
+        if span := _shift(candidate["start_time"], candidate["end_time"], offset, duration):
+            candidates.append({**candidate, "start_time": round(span[0], 2), "end_time": round(span[1], 2)})
+    shifted["shorts_candidates"] = candidates
+    return shifted
+
+
+async def reuse_duplicate(video_id: str, video_data: dict, bucket_name: str) -> dict:
+    """
+    Copies the transcript, analysis and marketing copy of the video that
+    `video_data["duplicate_of"]` names onto this video, with every timestamp
+    moved by the match offset and anything outside this video's length dropped.
+    Also copies the source's search and vector index entries, so nothing is
+    re-embedded. Returns the Firestore fields that were written.
+    """
+    duplicate_of = video_data["duplicate_of"]
+    source_id = duplicate_of["video_id"]
+    offset = duplicate_of["offset_seconds"]
+    duration = video_data.get("audio_duration_seconds") or float("inf")
+
+    source_doc = await db.collection("videos").document(source_id).get()
+    if not source_doc.exists:
+        raise ValueError("The matching video no longer exists.")
+    source = source_doc.to_dict()
+    if not source.get("transcript_gcs_uri"):
+        raise ValueError("The matching video has no transcript to reuse.")
+
+    bucket = storage.Client().bucket(bucket_name)
+
+    def blob_for(gcs_uri: str):
+        return bucket.blob(gcs_uri.replace(f"gs://{bucket_name}/", ""))
+
+    async def upload(path: str, data: str, content_type: str) -> str:
+        await asyncio.to_thread(bucket.blob(path).upload_from_string, data, content_type)
+        return f"gs://{bucket_name}/{path}"
+
+    transcript = shift_transcript(
+        json.loads(await asyncio.to_thread(blob_for(source["transcript_gcs_uri"]).download_as_text)), offset, duration
+    )
+    fields = {
+        "transcript_gcs_uri": await upload(f"transcripts/{video_id}_transcript.json", json.dumps(transcript, indent=2), "application/json"),
+        "reused_from": {"video_id": source_id, "offset_seconds": offset},
+    }
+    if transcript["segments"]:
+        fields["transcript_index_gcs_uri"] = await upload(
+            f"transcripts/{video_id}_index.json",
+            json.dumps(TranscriptIndex.from_segments(transcript["segments"]).to_dict()),
+            "application/json",
+        )
+    if source.get("highlight_windows"):
+        fields["highlight_windows"] = [
+            {**window, "start": round(span[0], 2), "end": round(span[1], 2)}
+            for window in source["highlight_windows"]
+            if (span := _shift(window["start"], window["end"], offset, duration))
+        ]
+    if source.get("structured_data"):
+        structured_data = shift_structured_data(source["structured_data"], offset, duration)
+        fields["structured_data"] = structured_data
+        fields["analysis_gcs_uri"] = await upload(
+            f"analyses/{video_id}_analysis.json", json.dumps(structured_data, indent=2), "application/json"
+        )
+    if source.get("marketing_copy"):
+        fields["marketing_copy"] = source["marketing_copy"]
+    if source.get("substack_gcs_uri"):
+        path = f"substack_posts/{video_id}_substack.md"
+        await asyncio.to_thread(bucket.copy_blob, blob_for(source["substack_gcs_uri"]), bucket, path)
+        fields["substack_gcs_uri"] = f"gs://{bucket_name}/{path}"
+        if source.get("substack_hook"):
+            fields["substack_hook"] = source["substack_hook"]
+
+    await db.collection("videos").document(video_id).update(fields)
+
+    if user_id := video_data.get("user_id"):
+        try:
+            await search_index_store.add_video(user_id, video_id, video_data.get("video_title"), transcript["segments"] or [
+                {"start": 0.0, "end": 0.0, "text": transcript["full_transcript"]}
+            ])
+            source_items, source_vectors = (await vector_index_store.load(user_id)).video_items(source_id)
+            items, rows = [], []
+            for i, item in enumerate(source_items):
+                if item.get("start") is not None and item.get("end") is not None:
+                    span = _shift(item["start"], item["end"], offset, duration)
+                    if span is None:
+                        continue
+                    item = {**item, "start": round(span[0], 2), "end": round(span[1], 2)}
+                items.append({**item, "video_title": video_data.get("video_title")})
+                rows.append(i)
+            if items:
+                await vector_index_store.add_video(user_id, video_id, items, source_vectors[rows], f"reused:{source_id}")
+                await topic_clusterer.add_video(user_id, video_id)
+        except Exception as e:
+            print(f"   ⚠️ Could not copy index entries from {source_id} to {video_id}: {e}")
+
+    print(f"   ♻️ Reused transcript, analysis and copy of {source_id} for {video_id} (offset {offset}s).")
+    return fields
+
+
+# Global instance of the FingerprintStore
+fingerprint_store = FingerprintStore(os.getenv("GCS_BUCKET_NAME"))
@@ -1,11 +1,13 @@
 from collections import defaultdict
 import asyncio
-from typing import Callable, DefaultDict, Type, List
+from typing import Callable, DefaultDict, Type, List, Set
 from .event_base import Event
 
 class EventBus:
     def __init__(self):
         self.handlers: DefaultDict[Type[Event], List[Callable]] = defaultdict(list)
+        # Keeps background publishes alive until they finish.
+        self._background: Set[asyncio.Task] = set()
 
     def subscribe(self, event_type: Type[Event], handler: Callable):
         self.handlers[event_type].append(handler)
@@ -18,5 +20,12 @@ class EventBus:
             for handler in self.handlers[event_type]:
                 await handler(event)
 
+    def publish_in_background(self, event: Event) -> asyncio.Task:
+        """Publishes an event without waiting for its handlers, e.g. for batch-mode pipelines."""
+        task = asyncio.create_task(self.publish(event))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
 # Global instance of the EventBus
 event_bus = EventBus() 
\ No newline at end of file
@@ -0,0 +1,154 @@
+import os
+from typing import Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Sub-fingerprints in the style of Haitsma & Kalker: every hop, 32 bits give the
+# sign of the change over time of the energy differences between 33 adjacent,
+# log-spaced bands. The bits survive re-encoding, resampling and level changes.
+FRAME_SECONDS = 0.37
+HOP_SECONDS = 0.05
+MIN_BAND_HZ = 300
+MAX_BAND_HZ = 2000
+BANDS = 33
+FRAMES_PER_CHUNK = 2048
+
+# Lookups use the top KEY_BITS bits of each sub-fingerprint, which match exactly
+# far more often than all 32 bits do between two encodings of the same audio.
+KEY_BITS = 20
+# Matches must agree on at least this fraction of bits (1 - bit error rate) over
+# the overlap, and the overlap must cover this fraction of the shorter video.
+MATCH_MIN_SIMILARITY = float(os.getenv("FINGERPRINT_MIN_SIMILARITY", "0.75"))
+MATCH_MIN_COVERAGE = float(os.getenv("FINGERPRINT_MIN_COVERAGE", "0.8"))
+# Keys this common (silence, hum) carry no information and are not looked up.
+MAX_KEY_POSTINGS = 200
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def audio_fingerprint(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Returns the uint32 sub-fingerprints of mono float samples, one per HOP_SECONDS."""
+    frame = int(FRAME_SECONDS * sample_rate)
+    hop = int(HOP_SECONDS * sample_rate)
+    if len(samples) < frame + 2 * hop:
+        return np.empty(0, dtype=np.uint32)
+
+    frames_view = sliding_window_view(samples, frame)[::hop]
+    n_fft = 1 << (frame - 1).bit_length()
+    edges = np.round(np.geomspace(MIN_BAND_HZ, MAX_BAND_HZ, BANDS + 1) * n_fft / sample_rate).astype(int)
+    taper = np.hanning(frame).astype(np.float32)
+
+    energies = np.empty((len(frames_view), BANDS), dtype=np.float64)
+    for start in range(0, len(frames_view), FRAMES_PER_CHUNK):
+        chunk = slice(start, min(start + FRAMES_PER_CHUNK, len(frames_view)))
+        power = np.abs(np.fft.rfft(frames_view[chunk] * taper, n=n_fft, axis=1)) ** 2
+        cumulative = np.concatenate((np.zeros((len(power), 1)), np.cumsum(power, axis=1)), axis=1)
+        energies[chunk] = cumulative[:, edges[1:]] - cumulative[:, edges[:-1]]
+
+    band_differences = energies[:, :-1] - energies[:, 1:]
+    bits = (band_differences[1:] - band_differences[:-1]) > 0
+    return np.packbits(bits, axis=1).view(">u4").ravel().astype(np.uint32)
+
+
+def fingerprint_seconds(fingerprint: np.ndarray) -> float:
+    return len(fingerprint) * HOP_SECONDS
+
+
+def similarity(a: np.ndarray, b: np.ndarray, offset: int) -> tuple:
+    """
+    Compares `b` to `a` with b's frame i aligned to a's frame i + offset.
+    Returns (1 - bit error rate, overlapping frames).
+    """
+    a_start, b_start = max(offset, 0), max(-offset, 0)
+    overlap = min(len(a) - a_start, len(b) - b_start)
+    if overlap <= 0:
+        return 0.0, 0
+    differing = np.bitwise_xor(a[a_start:a_start + overlap], b[b_start:b_start + overlap])
+    errors = int(_POPCOUNT[differing.view(np.uint8)].sum(dtype=np.int64))
+    return 1 - errors / (32 * overlap), overlap
+
+
+class FingerprintIndex:
+    """
+    An in-memory lookup from sub-fingerprint keys to (video, frame) positions,
+    kept as sorted parallel arrays. A query votes for the (video, offset) pairs
+    its keys agree on; the best-voted pair is then verified on all 32 bits.
+    """
+
+    def __init__(self):
+        self.video_ids: list = []
+        self.fingerprints: dict = {}
+        self._keys = np.empty(0, dtype=np.uint32)
+        self._videos = np.empty(0, dtype=np.int32)
+        self._frames = np.empty(0, dtype=np.int32)
+
+    def __contains__(self, video_id: str) -> bool:
+        return video_id in self.fingerprints
+
+    def add(self, video_id: str, fingerprint: np.ndarray):
+        if video_id in self.fingerprints:
+            return
+        self.fingerprints[video_id] = fingerprint
+        self.video_ids.append(video_id)
+        keys = np.concatenate([self._keys, fingerprint >> (32 - KEY_BITS)])
+        videos = np.concatenate([self._videos, np.full(len(fingerprint), len(self.video_ids) - 1, dtype=np.int32)])
+        frames = np.concatenate([self._frames, np.arange(len(fingerprint), dtype=np.int32)])
+        order = np.argsort(keys, kind="stable")
+        self._keys, self._videos, self._frames = keys[order], videos[order], frames[order]
+
+    def remove(self, video_id: str):
+        """Drops a video's postings. Its slot in video_ids is left empty so the others keep their numbers."""
+        if video_id not in self.fingerprints:
+            return
+        position = self.video_ids.index(video_id)
+        del self.fingerprints[video_id]
+        self.video_ids[position] = None
+        keep = self._videos != position
+        self._keys, self._videos, self._frames = self._keys[keep], self._videos[keep], self._frames[keep]
+
+    def match(self, fingerprint: np.ndarray, exclude_video_id: Optional[str] = None) -> Optional[dict]:
+        """
+        Returns the indexed video that `fingerprint` best matches, as
+        {video_id, offset_seconds, similarity, coverage}, or None if no match
+        clears the thresholds. A positive offset means the new video starts that
+        many seconds into the matched one.
+        """
+        if not len(fingerprint) or not len(self._keys):
+            return None
+        query_keys = fingerprint >> (32 - KEY_BITS)
+        lo = np.searchsorted(self._keys, query_keys, side="left")
+        hi = np.searchsorted(self._keys, query_keys, side="right")
+        counts = hi - lo
+        useful = (counts > 0) & (counts <= MAX_KEY_POSTINGS)
+        if not useful.any():
+            return None
+
+        # Expand every (query frame, posting) pair without a Python loop.
+        query_frames = np.repeat(np.flatnonzero(useful), counts[useful])
+        starts = np.repeat(lo[useful], counts[useful])
+        within = np.arange(len(starts)) - np.repeat(np.cumsum(counts[useful]) - counts[useful], counts[useful])
+        postings = starts + within
+        videos = self._videos[postings].astype(np.int64)
+        offsets = self._frames[postings].astype(np.int64) - query_frames
+
+        excluded = self.video_ids.index(exclude_video_id) if exclude_video_id in self.fingerprints else -1
+        keep = videos != excluded
+        if not keep.any():
+            return None
+        pairs, votes = np.unique(np.stack([videos[keep], offsets[keep]], axis=1), axis=0, return_counts=True)
+
+        # Verify the few best-voted alignments on every bit.
+        for video, offset in pairs[np.argsort(-votes)[:5]]:
+            video_id = self.video_ids[video]
+            indexed = self.fingerprints[video_id]
+            score, overlap = similarity(indexed, fingerprint, int(offset))
+            coverage = overlap / min(len(indexed), len(fingerprint))
+            if score >= MATCH_MIN_SIMILARITY and coverage >= MATCH_MIN_COVERAGE:
+                return {
+                    "video_id": video_id,
+                    "offset_seconds": round(int(offset) * HOP_SECONDS, 2),
+                    "similarity": round(score, 3),
+                    "coverage": round(coverage, 3),
+                }
+        return None
@@ -0,0 +1,188 @@
+import os
+from typing import List, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Frame-level analysis: 40 ms frames every 20 ms, pitch searched between 75 and 400 Hz.
+FRAME_SECONDS = 0.04
+FRAME_HOP_SECONDS = 0.02
+MIN_PITCH_HZ = 75
+MAX_PITCH_HZ = 400
+# Frames are analyzed in chunks to bound the memory used by the FFTs.
+FRAMES_PER_CHUNK = 2048
+
+# Candidate windows: a Short-sized span, evaluated every WINDOW_HOP_SECONDS. On videos
+# too short to fit a full shortlist of them, windows shrink (down to MIN_WINDOW_SECONDS)
+# and are evaluated more often.
+WINDOW_SECONDS = float(os.getenv("HIGHLIGHT_WINDOW_SECONDS", "45"))
+WINDOW_HOP_SECONDS = float(os.getenv("HIGHLIGHT_WINDOW_HOP_SECONDS", "10"))
+MIN_WINDOW_SECONDS = float(os.getenv("HIGHLIGHT_MIN_WINDOW_SECONDS", "15"))
+SHORTLIST_SIZE = int(os.getenv("HIGHLIGHT_SHORTLIST_SIZE", "8"))
+
+# How much each window feature (as a z-score across the video) contributes to its score.
+FEATURE_WEIGHTS = {
+    "loudness_db": 1.0,
+    "pitch_variation": 1.0,
+    "speech_rate": 0.5,
+    "reaction_energy": 1.5,
+}
+
+
+def frame_features(samples: np.ndarray, sample_rate: int) -> dict:
+    """
+    Computes per-frame loudness (dB), pitch (Hz, NaN when unvoiced) and spectral
+    flatness for mono float samples in [-1, 1].
+    """
+    frame = int(FRAME_SECONDS * sample_rate)
+    hop = int(FRAME_HOP_SECONDS * sample_rate)
+    if len(samples) < frame:
+        empty = np.empty(0, dtype=np.float32)
+        return {"times": empty, "loudness_db": empty, "pitch_hz": empty, "flatness": empty}
+
+    frames_view = sliding_window_view(samples, frame)[::hop]
+    n_frames = len(frames_view)
+    n_fft = 1 << (2 * frame - 1).bit_length()
+    min_lag = sample_rate // MAX_PITCH_HZ
+    max_lag = sample_rate // MIN_PITCH_HZ
+    taper = np.hanning(frame).astype(np.float32)
+
+    rms = np.empty(n_frames, dtype=np.float32)
+    pitch = np.full(n_frames, np.nan, dtype=np.float32)
+    flatness = np.empty(n_frames, dtype=np.float32)
+
+    for start in range(0, n_frames, FRAMES_PER_CHUNK):
+        chunk = slice(start, min(start + FRAMES_PER_CHUNK, n_frames))
+        frames = frames_view[chunk] * taper
+        rms[chunk] = np.sqrt(np.mean(frames ** 2, axis=1))
+
+        power = np.abs(np.fft.rfft(frames, n=n_fft, axis=1)) ** 2
+        # Autocorrelation via the power spectrum; its strongest peak in the
+        # plausible lag range gives the pitch period of voiced frames.
+        autocorr = np.fft.irfft(power, axis=1)[:, :max_lag + 1]
+        lag_range = autocorr[:, min_lag:]
+        best = np.argmax(lag_range, axis=1)
+        peak = lag_range[np.arange(len(best)), best]
+        voiced = peak > 0.3 * np.maximum(autocorr[:, 0], 1e-12)
+        pitch[chunk] = np.where(voiced, sample_rate / (best + min_lag), np.nan)
+
+        # Flat (noise-like) spectra are typical of applause and laughter.
+        spectrum = power[:, 1:] + 1e-12
+        flatness[chunk] = np.exp(np.mean(np.log(spectrum), axis=1)) / np.mean(spectrum, axis=1)
+
+    loudness_db = 20 * np.log10(rms + 1e-6)
+    silent = loudness_db < np.percentile(loudness_db, 20)
+    pitch[silent] = np.nan
+    times = (np.arange(n_frames) * hop + frame / 2) / sample_rate
+    return {"times": times, "loudness_db": loudness_db, "pitch_hz": pitch, "flatness": flatness}
+
+
+def _window_sums(values: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """Sums `values` over the frame index ranges [lo, hi) with a cumulative sum."""
+    cumulative = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    return cumulative[hi] - cumulative[lo]
+
+
+def _speech_rate(starts: np.ndarray, ends: np.ndarray, segments: List[dict], features: dict) -> np.ndarray:
+    """
+    Words per second in each window. Segment word counts are spread evenly over
+    each segment's duration. Without timed segments, the rate of loudness peaks
+    (roughly syllables) is used instead.
+    """
+    if segments:
+        seg_starts = np.array([s["start"] for s in segments], dtype=np.float64)
+        seg_ends = np.array([s["end"] for s in segments], dtype=np.float64)
+        seg_words = np.array([len(s.get("text", "").split()) for s in segments], dtype=np.float64)
+        durations = np.maximum(seg_ends - seg_starts, 1e-3)
+        overlap = np.clip(
+            np.minimum(seg_ends[None, :], ends[:, None]) - np.maximum(seg_starts[None, :], starts[:, None]), 0, None
+        )
+        return (overlap / durations * seg_words).sum(axis=1) / (ends - starts)
+
+    loudness = features["loudness_db"]
+    envelope = np.convolve(loudness, np.ones(5) / 5, mode="same")
+    peaks = (envelope[1:-1] > envelope[:-2]) & (envelope[1:-1] >= envelope[2:]) & (envelope[1:-1] > np.median(envelope))
+    peak_times = features["times"][1:-1][peaks]
+    return (np.searchsorted(peak_times, ends) - np.searchsorted(peak_times, starts)) / (ends - starts)
+
+
+def window_features(features: dict, segments: Optional[List[dict]] = None, top_n: int = SHORTLIST_SIZE) -> dict:
+    """
+    Aggregates frame features into overlapping candidate windows, sized so that
+    `top_n` of them fit side by side where the video is long enough.
+    """
+    times = features["times"]
+    duration = float(times[-1]) if len(times) else 0.0
+    window = min(WINDOW_SECONDS, max(duration / max(top_n, 1), MIN_WINDOW_SECONDS), duration)
+    hop = min(WINDOW_HOP_SECONDS, max(window / 4, FRAME_HOP_SECONDS))
+    starts = np.arange(0.0, max(duration - window, 0.0) + 1e-6, hop)
+    ends = starts + window
+    lo = np.searchsorted(times, starts)
+    hi = np.maximum(np.searchsorted(times, ends), lo + 1)
+    counts = hi - lo
+
+    loudness = features["loudness_db"]
+    pitch = features["pitch_hz"]
+    voiced = ~np.isnan(pitch)
+    semitones = np.where(voiced, 12 * np.log2(np.where(voiced, pitch, 1.0)), 0.0)
+    voiced_counts = np.maximum(_window_sums(voiced, lo, hi), 1)
+    pitch_mean = _window_sums(semitones, lo, hi) / voiced_counts
+    pitch_variance = np.maximum(_window_sums(semitones ** 2, lo, hi) / voiced_counts - pitch_mean ** 2, 0)
+
+    # Loud, noise-like frames well above the typical level suggest laughter or applause.
+    reaction = (features["flatness"] > 0.3) & (loudness > np.median(loudness) + 6)
+
+    return {
+        "start": starts,
+        "end": ends,
+        "loudness_db": _window_sums(loudness, lo, hi) / counts,
+        "pitch_variation": np.sqrt(pitch_variance),
+        "speech_rate": _speech_rate(starts, ends, segments or [], features),
+        "reaction_energy": _window_sums(reaction, lo, hi) / counts,
+    }
+
+
+def rank_highlights(
+    samples: np.ndarray,
+    sample_rate: int,
+    segments: Optional[List[dict]] = None,
+    top_n: int = SHORTLIST_SIZE,
+) -> List[dict]:
+    """
+    Scores every candidate window of the audio and returns the `top_n` best
+    non-overlapping ones (half-overlapping ones on videos too short for that),
+    best first.
+    """
+    features = frame_features(samples, sample_rate)
+    if not len(features["times"]):
+        return []
+    windows = window_features(features, segments, top_n)
+
+    score = np.zeros(len(windows["start"]))
+    for name, weight in FEATURE_WEIGHTS.items():
+        values = windows[name]
+        spread = values.std()
+        if spread > 0:
+            score += weight * (values - values.mean()) / spread
+
+    shortlist, chosen = [], set()
+    # Windows may not overlap; if that leaves too few on a short video, a second
+    # pass admits windows sharing up to half their length with a chosen one.
+    for max_overlap in (0.0, 0.5):
+        for i in np.argsort(-score):
+            if len(shortlist) >= top_n:
+                break
+            start, end = windows["start"][i], windows["end"][i]
+            allowed = max_overlap * (end - start)
+            if i in chosen or any(
+                min(end, picked["end"]) - max(start, picked["start"]) > allowed + 1e-6 for picked in shortlist
+            ):
+                continue
+            chosen.add(i)
+            shortlist.append({
+                "start": round(float(start), 2),
+                "end": round(float(end), 2),
+                "score": round(float(score[i]), 3),
+                **{name: round(float(windows[name][i]), 3) for name in FEATURE_WEIGHTS},
+            })
+    return sorted(shortlist, key=lambda window: -window["score"])
@@ -0,0 +1,96 @@
+import asyncio
+import os
+from collections import defaultdict
+from typing import DefaultDict, Dict, List, Tuple
+
+from .registry import imagen_models
+from .scheduler import BACKGROUND, INTERACTIVE, imagen_scheduler
+
+# Imagen returns at most this many images per request.
+MAX_IMAGES_PER_CALL = int(os.getenv("IMAGEN_MAX_IMAGES_PER_CALL", "4"))
+# Requests for the same model and prompt that arrive within this window share calls.
+COALESCE_SECONDS = float(os.getenv("IMAGEN_COALESCE_SECONDS", "0.25"))
+
+
+class ImageBatcher:
+    """
+    Turns requests for images into as few Imagen calls as possible. Requests for
+    the same (model, prompt) that arrive within COALESCE_SECONDS of each other are
+    served by shared calls with number_of_images > 1, and a single request for
+    several images of one prompt is split into calls of MAX_IMAGES_PER_CALL.
+
+    Imagen has no multi-prompt request, so different prompts always mean
+    different calls. Calls go through the ImagenScheduler, in the interactive
+    lane if any request they serve is interactive.
+    """
+
+    def __init__(self):
+        # (model_name, prompt) -> [(count, future, lane), ...] waiting for the next flush
+        self._pending: DefaultDict[Tuple[str, str], list] = defaultdict(list)
+        self._timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+        self._flushes = set()
+        self.calls = 0
+        self.images = 0
+
+    def metrics(self) -> dict:
+        return {
+            "calls": self.calls,
+            "images": self.images,
+            "images_per_call": round(self.images / self.calls, 2) if self.calls else None,
+        }
+
+    async def generate(self, model_name: str, prompt: str, count: int = 1, lane: str = BACKGROUND) -> List[bytes]:
+        """
+        Returns up to `count` PNG images for `prompt`. Fewer are returned when
+        Imagen filters some out.
+        """
+        key = (model_name, prompt)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key].append((count, future, lane))
+
+        if sum(requested for requested, _, _ in self._pending[key]) >= MAX_IMAGES_PER_CALL:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = asyncio.get_running_loop().call_later(COALESCE_SECONDS, self._flush, key)
+        return await future
+
+    def _flush(self, key: Tuple[str, str]):
+        if timer := self._timers.pop(key, None):
+            timer.cancel()
+        requests = self._pending.pop(key, [])
+        if requests:
+            task = asyncio.create_task(self._run(key, requests))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _run(self, key: Tuple[str, str], requests: list):
+        model_name, prompt = key
+        total = sum(count for count, _, _ in requests)
+        lane = INTERACTIVE if any(lane == INTERACTIVE for _, _, lane in requests) else BACKGROUND
+        sizes = [min(MAX_IMAGES_PER_CALL, total - start) for start in range(0, total, MAX_IMAGES_PER_CALL)]
+        model = imagen_models.get(model_name)
+        if len(requests) > 1 or len(sizes) > 1:
+            print(f"     - Imagen: {total} image(s) for {len(requests)} request(s) in {len(sizes)} call(s)")
+
+        results = await asyncio.gather(
+            *(imagen_scheduler.run(lane, model.generate_images, prompt=prompt, number_of_images=size) for size in sizes),
+            return_exceptions=True,
+        )
+        self.calls += len(sizes)
+        images = [image._image_bytes for result in results if not isinstance(result, BaseException) for image in result.images]
+        self.images += len(images)
+        errors = [result for result in results if isinstance(result, BaseException)]
+
+        # Hand out images in request order; if every call failed, so do the requests.
+        for count, future, _ in requests:
+            if future.done():
+                continue
+            if not images and errors:
+                future.set_exception(errors[0])
+            else:
+                future.set_result(images[:count])
+                images = images[count:]
+
+
+# Global instance of the ImageBatcher
+image_batcher = ImageBatcher()
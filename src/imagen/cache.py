@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import List
+
+from google.cloud import firestore, storage
+
+from ..compositing.derivatives import derivative_path
+from ..database import db
+
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "true").lower() == "true"
+CACHE_COLLECTION = "image_cache"
+# Most images kept per key; a request for more than this always generates new ones.
+MAX_IMAGES_PER_KEY = int(os.getenv("IMAGE_CACHE_MAX_PER_PROMPT", "8"))
+MEMORY_ENTRIES = 512
+
+
+def cache_key(model_name: str, prompt: str, params: dict = None, user_id: str = None) -> str:
+    payload = json.dumps({"model": model_name, "prompt": prompt.strip(), "params": params or {}, "user": user_id}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ImageCache:
+    """
+    Maps (user, model, prompt, params) to images already in GCS, so the same
+    prompt is not sent to Imagen again. Entries live in Firestore
+    (image_cache/<key>) behind an in-memory LRU. Objects deleted since (e.g.
+    with their video) are dropped from the entry when a lookup finds them
+    missing. A hit is copied to the requesting video's own path with `claim`,
+    so videos never share objects and deleting one cannot break another.
+    """
+
+    def __init__(self, bucket_name: str):
+        self.bucket_name = bucket_name
+        self.storage_client = storage.Client()
+        self._memory: "OrderedDict[str, list]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, key: str, images: list):
+        self._memory[key] = images
+        self._memory.move_to_end(key)
+        while len(self._memory) > MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+
+    async def _exists(self, gcs_uri: str) -> bool:
+        blob = self.storage_client.bucket(self.bucket_name).blob(gcs_uri.replace(f"gs://{self.bucket_name}/", ""))
+        return await asyncio.to_thread(blob.exists)
+
+    async def lookup(self, model_name: str, prompt: str, count: int, params: dict = None, user_id: str = None) -> List[dict]:
+        """Returns up to `count` cached images ({gcs_uri, derivatives}) for the prompt."""
+        if not IMAGE_CACHE_ENABLED:
+            return []
+        key = cache_key(model_name, prompt, params, user_id)
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            images = self._memory[key]
+        else:
+            doc = await db.collection(CACHE_COLLECTION).document(key).get()
+            images = (doc.to_dict() or {}).get("images", []) if doc.exists else []
+
+        candidates = images[:count]
+        present = await asyncio.gather(*(self._exists(image["gcs_uri"]) for image in candidates))
+        found = [image for image, exists in zip(candidates, present) if exists]
+        if len(found) < len(candidates):
+            missing = {image["gcs_uri"] for image, exists in zip(candidates, present) if not exists}
+            images = [image for image in images if image["gcs_uri"] not in missing]
+            await db.collection(CACHE_COLLECTION).document(key).set({"images": images}, merge=True)
+        self._remember(key, images)
+
+        self.hits += len(found)
+        self.misses += count - len(found)
+        return found
+
+    async def add(self, model_name: str, prompt: str, images: List[dict], params: dict = None, user_id: str = None):
+        """Records newly generated images for the prompt."""
+        if not IMAGE_CACHE_ENABLED or not images:
+            return
+        key = cache_key(model_name, prompt, params, user_id)
+        doc_ref = db.collection(CACHE_COLLECTION).document(key)
+        doc = await doc_ref.get()
+        cached = (doc.to_dict() or {}).get("images", []) if doc.exists else []
+        cached = (cached + [{"gcs_uri": image["gcs_uri"], "derivatives": image.get("derivatives") or {}} for image in images])[-MAX_IMAGES_PER_KEY:]
+        await doc_ref.set({
+            "model": model_name,
+            "prompt": prompt,
+            "params": params or {},
+            "user_id": user_id,
+            "images": cached,
+            "updated_at": firestore.SERVER_TIMESTAMP,
+        })
+        self._remember(key, cached)
+
+    async def claim(self, image: dict, destination_path: str) -> dict:
+        """
+        Copies a cached image and its derivatives to `destination_path` (an
+        object path in the bucket) and returns the copy as {gcs_uri, derivatives}.
+        """
+        bucket = self.storage_client.bucket(self.bucket_name)
+
+        async def copy(gcs_uri: str, path: str) -> str:
+            source = bucket.blob(gcs_uri.replace(f"gs://{self.bucket_name}/", ""))
+            await asyncio.to_thread(bucket.copy_blob, source, bucket, path)
+            return f"gs://{self.bucket_name}/{path}"
+
+        entries = [
+            (variant, image_format, entry)
+            for variant, formats in (image.get("derivatives") or {}).items()
+            for image_format, entry in formats.items()
+        ]
+        gcs_uri, *copied = await asyncio.gather(
+            copy(image["gcs_uri"], destination_path),
+            *(copy(entry["gcs_uri"], derivative_path(destination_path, variant, image_format)) for variant, image_format, entry in entries),
+        )
+        derivatives: dict = {}
+        for (variant, image_format, entry), uri in zip(entries, copied):
+            derivatives.setdefault(variant, {})[image_format] = {**entry, "gcs_uri": uri}
+        return {"gcs_uri": gcs_uri, "derivatives": derivatives}
+
+    def metrics(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 3) if total else None}
+
+
+# Global instance of the ImageCache
+image_cache = ImageCache(os.getenv("GCS_BUCKET_NAME"))
@@ -0,0 +1,61 @@
+import asyncio
+import os
+import threading
+from typing import Dict, Iterable
+
+import vertexai
+from vertexai.preview.vision_models import ImageGenerationModel
+
+DEFAULT_IMAGEN_MODEL = os.getenv("IMAGEN_MODEL_NAME") or "imagegeneration@006"
+# Extra models to load at startup, e.g. the ones offered for on-demand generation.
+PRELOAD_IMAGEN_MODELS = [name.strip() for name in os.getenv("IMAGEN_PRELOAD_MODELS", "").split(",") if name.strip()]
+
+
+class ImagenModelRegistry:
+    """
+    Loads each Imagen model once per process and hands out the shared instance.
+    Vertex AI is initialized on first use from GOOGLE_CLOUD_PROJECT and GCP_REGION,
+    unless `init` was called with explicit values first.
+    """
+
+    def __init__(self):
+        self._models: Dict[str, ImageGenerationModel] = {}
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def init(self, project_id: str = None, location: str = None):
+        with self._lock:
+            self._init(project_id, location)
+
+    def _init(self, project_id: str = None, location: str = None):
+        if not self._initialized:
+            vertexai.init(
+                project=project_id or os.getenv("GOOGLE_CLOUD_PROJECT"),
+                location=location or os.getenv("GCP_REGION"),
+            )
+            self._initialized = True
+
+    def get(self, model_name: str = None) -> ImageGenerationModel:
+        """Returns the loaded model, loading it on first use. Defaults to IMAGEN_MODEL_NAME."""
+        model_name = model_name or DEFAULT_IMAGEN_MODEL
+        model = self._models.get(model_name)
+        if model is None:
+            with self._lock:
+                if model_name not in self._models:
+                    self._init()
+                    print(f"   Loading Imagen model: {model_name}")
+                    self._models[model_name] = ImageGenerationModel.from_pretrained(model_name)
+                model = self._models[model_name]
+        return model
+
+    async def warm(self, model_names: Iterable[str] = ()):
+        """Loads the default model, any preloaded ones and `model_names` ahead of the first request."""
+        names = dict.fromkeys(name for name in [DEFAULT_IMAGEN_MODEL, *PRELOAD_IMAGEN_MODELS, *model_names] if name)
+        await asyncio.gather(*(asyncio.to_thread(self.get, name) for name in names))
+
+    def loaded(self) -> list:
+        return list(self._models)
+
+
+# Global instance of the ImagenModelRegistry
+imagen_models = ImagenModelRegistry()
@@ -0,0 +1,138 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+
+from google.api_core import exceptions as google_exceptions
+
+# Size the token bucket to the project's Imagen quota (requests per minute per model/region).
+REQUESTS_PER_MINUTE = float(os.getenv("IMAGEN_REQUESTS_PER_MINUTE", "60"))
+BURST = int(os.getenv("IMAGEN_BURST", "5"))
+MAX_CONCURRENCY = int(os.getenv("IMAGEN_MAX_CONCURRENCY", "8"))
+MAX_RETRIES = int(os.getenv("IMAGEN_MAX_RETRIES", "5"))
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+# Lanes in the order they are served.
+LANES = (INTERACTIVE, BACKGROUND)
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    if isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+        return True
+    return getattr(error, "code", None) == 429 or "429" in str(error) or "Quota exceeded" in str(error)
+
+
+class ImagenScheduler:
+    """
+    Admits every Imagen call in the process. A token bucket keeps the call rate
+    within the quota, and the number of calls in flight is adapted AIMD-style:
+    it grows by one per window of successful calls, halves on a 429, and the
+    throttled call is retried with backoff. Waiting interactive calls (users
+    clicking "generate image") are always admitted before background ones.
+    """
+
+    def __init__(self, requests_per_minute: float, burst: int, max_concurrency: int):
+        self.rate = requests_per_minute / 60
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(self.max_concurrency)
+        self.active = 0
+        self._updated = time.monotonic()
+        self._lanes: Dict[str, Deque[asyncio.Future]] = {lane: deque() for lane in LANES}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.stats = {"calls": 0, "throttled": 0, "retries": 0, "wait_seconds": {lane: 0.0 for lane in LANES}}
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        for lane in LANES:
+            waiters = self._lanes[lane]
+            while waiters:
+                future = waiters.popleft()
+                if not future.done():
+                    return future
+        return None
+
+    def _dispatch(self):
+        self._refill()
+        while self.active < int(self.limit) and self.tokens >= 1:
+            future = self._next_waiter()
+            if future is None:
+                return
+            self.tokens -= 1
+            self.active += 1
+            future.set_result(None)
+
+        waiting = any(not future.done() for waiters in self._lanes.values() for future in waiters)
+        if waiting and self.active < int(self.limit) and self._timer is None:
+            # Out of tokens: come back when the next one is due.
+            delay = (1 - self.tokens) / self.rate if self.rate > 0 else 1.0
+            self._timer = asyncio.get_running_loop().call_later(max(delay, 0.01), self._wake)
+
+    def _wake(self):
+        self._timer = None
+        self._dispatch()
+
+    async def _acquire(self, lane: str):
+        future = asyncio.get_running_loop().create_future()
+        self._lanes[lane].append(future)
+        started = time.monotonic()
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release(throttled=False)
+            raise
+        self.stats["wait_seconds"][lane] += time.monotonic() - started
+
+    def _release(self, throttled: bool):
+        self.active -= 1
+        if throttled:
+            self.limit = max(1.0, self.limit / 2)
+            self.tokens = min(self.tokens, 0.0)
+        else:
+            self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+        self._dispatch()
+
+    async def run(self, lane: str, fn: Callable, *args, **kwargs):
+        """Runs a blocking Imagen call in a thread once admitted, retrying on 429s."""
+        for attempt in range(MAX_RETRIES + 1):
+            await self._acquire(lane if lane in self._lanes else BACKGROUND)
+            try:
+                result = await asyncio.to_thread(fn, *args, **kwargs)
+            except Exception as e:
+                throttled = is_rate_limited(e)
+                self._release(throttled)
+                if not throttled or attempt == MAX_RETRIES:
+                    raise
+                self.stats["throttled"] += 1
+                self.stats["retries"] += 1
+                backoff = min(60.0, 2 ** attempt) * (0.5 + random.random())
+                print(f"     - Imagen quota hit ({lane}); concurrency now {int(self.limit)}, retrying in {backoff:.1f}s")
+                await asyncio.sleep(backoff)
+                continue
+            self.stats["calls"] += 1
+            self._release(throttled=False)
+            return result
+
+    def metrics(self) -> dict:
+        return {
+            "concurrency_limit": round(self.limit, 2),
+            "active": self.active,
+            "waiting": {lane: sum(not future.done() for future in waiters) for lane, waiters in self._lanes.items()},
+            "tokens": round(self.tokens, 2),
+            **self.stats,
+            "wait_seconds": {lane: round(seconds, 2) for lane, seconds in self.stats["wait_seconds"].items()},
+        }
+
+
+# Global instance of the ImagenScheduler
+imagen_scheduler = ImagenScheduler(REQUESTS_PER_MINUTE, BURST, MAX_CONCURRENCY)
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import traceback
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+from .database import db
+from .quotas import QuotaExceededError
+from .status_channel import StatusChannel
+
+JOBS_COLLECTION = "jobs"
+# Job documents carry an expires_at this far out, for a Firestore TTL policy to delete them.
+JOB_RETENTION_HOURS = int(os.getenv("JOB_RETENTION_HOURS", "24"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+# A job's work: called with a progress(fraction, message) callback, returns the JSON-able result.
+Progress = Callable[[float, str], Awaitable[None]]
+JobFn = Callable[[Progress], Awaitable[dict]]
+
+
+class JobStore:
+    """
+    Runs long on-demand operations (clip encoding, image generation) in the
+    background so their endpoints can answer 202 with a job id right away.
+    Each job's state, progress and result live in Firestore (jobs/<job_id>),
+    so any instance can answer for it; progress updates are also pushed to
+    the SSE listeners on the instance running the job.
+    """
+
+    def __init__(self):
+        self.channel = StatusChannel()
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def _ref(self, job_id: str):
+        return db.collection(JOBS_COLLECTION).document(job_id)
+
+    async def submit(self, kind: str, fn: JobFn, user_id: Optional[str] = None, video_id: Optional[str] = None) -> dict:
+        """Records a queued job, starts it, and returns the job document."""
+        now = datetime.now(timezone.utc)
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "kind": kind,
+            "user_id": user_id,
+            "video_id": video_id,
+            "status": QUEUED,
+            "progress": 0.0,
+            "message": "Queued",
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "expires_at": now + timedelta(hours=JOB_RETENTION_HOURS),
+        }
+        await self._ref(job["job_id"]).set(job)
+        task = asyncio.create_task(self._run(job["job_id"], kind, fn))
+        self._tasks[job["job_id"]] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job["job_id"], None))
+        print(f"🧾 Job {job['job_id']} ({kind}) queued.")
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        doc = await self._ref(job_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    async def _update(self, job_id: str, **fields):
+        fields["updated_at"] = datetime.now(timezone.utc)
+        await self._ref(job_id).update(fields)
+        self.channel.publish(job_id, {"job_id": job_id, **fields})
+
+    async def _run(self, job_id: str, kind: str, fn: JobFn):
+        async def progress(fraction: float, message: str):
+            await self._update(job_id, progress=round(min(max(fraction, 0.0), 1.0), 3), message=message)
+
+        try:
+            await self._update(job_id, status=RUNNING, message="Started")
+            result = await fn(progress)
+            await self._update(job_id, status=SUCCEEDED, progress=1.0, message="Done", result=result)
+            print(f"✅ Job {job_id} ({kind}) succeeded.")
+        except Exception as e:
+            if isinstance(e, HTTPException):
+                error = {"status_code": e.status_code, "detail": e.detail}
+            elif isinstance(e, QuotaExceededError):
+                error = {"status_code": 429, "detail": str(e), "resource": e.resource, "retry_after": e.retry_after}
+            else:
+                print(f"❌ Job {job_id} ({kind}) failed: {e}\n{traceback.format_exc()}")
+                error = {"status_code": 500, "detail": "An internal error occurred while running the job."}
+            try:
+                await self._update(job_id, status=FAILED, message="Failed", error=error)
+            except Exception as update_error:
+                print(f"❌ Could not record the failure of job {job_id}: {update_error}")
+
+
+def job_response(job: dict) -> dict:
+    """The body of a 202 answer: the job id and where to follow it."""
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "status_url": f"/api/jobs/{job['job_id']}",
+        "events_url": f"/api/jobs/{job['job_id']}/events",
+    }
+
+
+# Global instance of the JobStore
+job_store = JobStore()
@@ -0,0 +1,243 @@
+import abc
+import asyncio
+import dataclasses
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from google.cloud import storage
+
+from .routing import generative_model
+
+# Requests are collected for up to LLM_BATCH_FLUSH_SECONDS (or until
+# LLM_BATCH_MAX_SIZE requests are waiting for one model) before a job is submitted.
+BATCH_BACKEND = os.getenv("LLM_BATCH_BACKEND", "vertex")
+BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", "200"))
+BATCH_FLUSH_SECONDS = float(os.getenv("LLM_BATCH_FLUSH_SECONDS", "300"))
+BATCH_POLL_SECONDS = float(os.getenv("LLM_BATCH_POLL_SECONDS", "60"))
+
+
+@dataclass
+class BatchRequest:
+    key: str
+    model_name: str
+    prompt: str
+    generation_config: dict
+    future: asyncio.Future = field(repr=False)
+
+
+@dataclass
+class BatchResponse:
+    """The result of one batched request. Mirrors the `.text` of an interactive response."""
+    text: str
+    usage_metadata: Optional[dict] = None
+
+
+def _generation_config_dict(generation_config) -> dict:
+    """Converts a GenerationConfig (or dict) into the REST field names batch input uses."""
+    if generation_config is None:
+        return {}
+    if dataclasses.is_dataclass(generation_config):
+        generation_config = dataclasses.asdict(generation_config)
+    config = {}
+    for name, value in generation_config.items():
+        if value is None:
+            continue
+        head, *rest = name.split("_")
+        config[head + "".join(part.title() for part in rest)] = value
+    return config
+
+
+class BatchBackend(abc.ABC):
+    """Runs a list of requests for one model and returns their results keyed by request key."""
+
+    @abc.abstractmethod
+    async def run(self, model_name: str, requests: List[BatchRequest]) -> Dict[str, BatchResponse]:
+        """Runs the requests and returns each one's response under its key."""
+
+
+class LocalBatchBackend(BatchBackend):
+    """
+    A stand-in for the provider batch API that runs each request as an ordinary
+    call. Used for tests and local development (LLM_BATCH_BACKEND=local).
+    """
+
+    def __init__(self, max_concurrency: int = 4):
+        self.max_concurrency = max_concurrency
+
+    async def run(self, model_name: str, requests: List[BatchRequest]) -> Dict[str, BatchResponse]:
+        model = generative_model(model_name)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_one(request: BatchRequest):
+            async with semaphore:
+                response = await model.generate_content_async(request.prompt, generation_config=request.generation_config)
+                return request.key, BatchResponse(text=response.text, usage_metadata=response.usage_metadata)
+
+        return dict(await asyncio.gather(*(run_one(request) for request in requests)))
+
+
+class VertexBatchBackend(BatchBackend):
+    """
+    Submits requests as a Vertex AI Gemini batch prediction job. Input and output
+    JSONL files live under gs://<bucket>/batch_jobs/<job id>/.
+    """
+
+    def __init__(self, bucket_name: str, project_id: str = None, location: str = None, poll_seconds: float = BATCH_POLL_SECONDS):
+        self.bucket_name = bucket_name
+        self.project_id = project_id
+        self.location = location
+        self.poll_seconds = poll_seconds
+        self.storage_client = storage.Client()
+
+    async def run(self, model_name: str, requests: List[BatchRequest]) -> Dict[str, BatchResponse]:
+        import vertexai
+        from vertexai.batch_prediction import BatchPredictionJob
+
+        vertexai.init(project=self.project_id, location=self.location)
+        job_prefix = f"batch_jobs/{uuid.uuid4()}"
+        bucket = self.storage_client.bucket(self.bucket_name)
+
+        lines = [
+            json.dumps({
+                "key": request.key,
+                "request": {
+                    "contents": [{"role": "user", "parts": [{"text": request.prompt}]}],
+                    "generationConfig": _generation_config_dict(request.generation_config),
+                },
+            })
+            for request in requests
+        ]
+        input_blob = bucket.blob(f"{job_prefix}/input.jsonl")
+        await asyncio.to_thread(input_blob.upload_from_string, "\n".join(lines), "application/jsonl")
+
+        job = await asyncio.to_thread(
+            BatchPredictionJob.submit,
+            source_model=model_name,
+            input_dataset=f"gs://{self.bucket_name}/{job_prefix}/input.jsonl",
+            output_uri_prefix=f"gs://{self.bucket_name}/{job_prefix}/output",
+        )
+        print(f"   📦 Submitted batch job {job.resource_name} with {len(requests)} request(s) for {model_name}.")
+
+        started = time.monotonic()
+        while not job.has_ended:
+            await asyncio.sleep(self.poll_seconds)
+            await asyncio.to_thread(job.refresh)
+        if not job.has_succeeded:
+            raise RuntimeError(f"Batch job {job.resource_name} failed: {job.error}")
+        print(f"   📦 Batch job {job.resource_name} finished in {time.monotonic() - started:.0f}s.")
+
+        return await self._read_results(job.output_location, requests)
+
+    async def _read_results(self, output_location: str, requests: List[BatchRequest]) -> Dict[str, BatchResponse]:
+        # Results are matched on the echoed key, falling back to the prompt text.
+        keys_by_prompt = {request.prompt: request.key for request in requests}
+        output_prefix = output_location.replace(f"gs://{self.bucket_name}/", "")
+        blobs = await asyncio.to_thread(lambda: list(self.storage_client.list_blobs(self.bucket_name, prefix=output_prefix)))
+
+        results = {}
+        for blob in blobs:
+            if not blob.name.endswith(".jsonl"):
+                continue
+            for line in (await asyncio.to_thread(blob.download_as_text)).splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                key = record.get("key") or keys_by_prompt.get(
+                    record["request"]["contents"][0]["parts"][0]["text"]
+                )
+                candidates = record.get("response", {}).get("candidates") or []
+                if not key or not candidates:
+                    continue
+                text = "".join(part.get("text", "") for part in candidates[0]["content"]["parts"])
+                results[key] = BatchResponse(text=text, usage_metadata=record["response"].get("usageMetadata"))
+        return results
+
+
+class BatchCollector:
+    """
+    Collects non-interactive LLM requests from many videos and runs them as
+    batch jobs, one per model. Callers simply await `submit`.
+    """
+
+    def __init__(self, backend: BatchBackend, max_batch_size: int = BATCH_MAX_SIZE, flush_seconds: float = BATCH_FLUSH_SECONDS):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.flush_seconds = flush_seconds
+        self.pending: Dict[str, List[BatchRequest]] = {}
+        self._flush_timers: Dict[str, asyncio.Task] = {}
+        self._jobs: set = set()
+
+    async def submit(self, model_name: str, prompt: str, generation_config=None) -> BatchResponse:
+        request = BatchRequest(
+            key=str(uuid.uuid4()),
+            model_name=model_name,
+            prompt=prompt,
+            generation_config=generation_config,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        queue = self.pending.setdefault(model_name, [])
+        queue.append(request)
+
+        if len(queue) >= self.max_batch_size:
+            self._flush(model_name)
+        elif model_name not in self._flush_timers:
+            self._flush_timers[model_name] = asyncio.create_task(self._flush_later(model_name))
+        return await request.future
+
+    async def _flush_later(self, model_name: str):
+        await asyncio.sleep(self.flush_seconds)
+        self._flush_timers.pop(model_name, None)
+        self._flush(model_name)
+
+    def _flush(self, model_name: str):
+        if timer := self._flush_timers.pop(model_name, None):
+            if timer is not asyncio.current_task():
+                timer.cancel()
+        requests = self.pending.pop(model_name, [])
+        if requests:
+            job = asyncio.create_task(self._run(model_name, requests))
+            self._jobs.add(job)
+            job.add_done_callback(self._jobs.discard)
+
+    async def _run(self, model_name: str, requests: List[BatchRequest]):
+        try:
+            results = await self.backend.run(model_name, requests)
+        except Exception as e:
+            print(f"❌ Batch job for {model_name} failed: {e}")
+            for request in requests:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+
+        for request in requests:
+            if request.future.done():
+                continue
+            if request.key in results:
+                request.future.set_result(results[request.key])
+            else:
+                request.future.set_exception(RuntimeError(f"Batch job returned no result for request {request.key}."))
+
+
+def _create_backend() -> BatchBackend:
+    if BATCH_BACKEND == "local":
+        return LocalBatchBackend()
+    return VertexBatchBackend(
+        bucket_name=os.getenv("GCS_BUCKET_NAME"),
+        project_id=os.getenv("GOOGLE_CLOUD_PROJECT"),
+        location=os.getenv("GCP_REGION"),
+    )
+
+
+_batch_collector: Optional[BatchCollector] = None
+
+
+def get_batch_collector() -> BatchCollector:
+    """Returns the process-wide BatchCollector, creating it on first use."""
+    global _batch_collector
+    if _batch_collector is None:
+        _batch_collector = BatchCollector(_create_backend())
+    return _batch_collector
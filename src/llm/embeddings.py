@@ -0,0 +1,32 @@
+import asyncio
+import os
+from typing import List
+
+import google.generativeai as genai
+import numpy as np
+
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "models/text-embedding-004")
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "768"))
+# The embeddings API accepts at most this many texts per request.
+EMBED_BATCH_SIZE = 100
+
+
+async def embed_texts(texts: List[str], task_type: str = "retrieval_document") -> np.ndarray:
+    """
+    Embeds `texts` and returns them as unit-length float32 rows, so cosine
+    similarity is a plain dot product. Use task_type="retrieval_query" for
+    search queries.
+    """
+    vectors = []
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        result = await asyncio.to_thread(
+            genai.embed_content,
+            model=EMBEDDING_MODEL_NAME,
+            content=texts[start:start + EMBED_BATCH_SIZE],
+            task_type=task_type,
+            output_dimensionality=EMBEDDING_DIMENSIONS,
+        )
+        vectors.extend(result["embedding"])
+
+    array = np.asarray(vectors, dtype=np.float32).reshape(len(texts), EMBEDDING_DIMENSIONS)
+    return array / np.maximum(np.linalg.norm(array, axis=1, keepdims=True), 1e-12)
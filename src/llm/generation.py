@@ -0,0 +1,128 @@
+import json
+import os
+import re
+import time
+from typing import Iterable, Optional
+
+from .batch import get_batch_collector
+from .hedging import get_hedger
+from .routing import generative_model, record_latency
+from .usage import record_usage, usage_from_response
+from ..status_channel import status_channel
+
+# When enabled, calls that name `stream_fields` stream their output and forward
+# partial values of those JSON string fields to the video's SSE listeners.
+STREAMING_ENABLED = os.getenv("LLM_STREAMING_ENABLED", "true").lower() == "true"
+
+
+async def generate_content(
+    model_name: str,
+    prompt: str,
+    *,
+    stage: str,
+    input_tokens: int = 0,
+    generation_config=None,
+    video_id: Optional[str] = None,
+    stream_fields: Iterable[str] = (),
+    batch: bool = False,
+):
+    """
+    Runs a Gemini call for a pipeline stage.
+
+    Interactive calls go through the stage's hedger and feed the router's latency
+    stats. With `batch=True` the request is queued for the next batch job instead,
+    which is slower but cheaper per request; use it only when nobody is waiting.
+
+    The returned response is fully resolved either way, so `response.text` is the
+    same whether the call was streamed, batched or neither. Token usage is
+    recorded against `video_id` when one is given.
+    """
+    started = time.monotonic()
+    if batch:
+        response = await get_batch_collector().submit(model_name, prompt, generation_config)
+    else:
+        model = generative_model(model_name)
+        hedger = get_hedger(stage)
+        stream_fields = tuple(stream_fields)
+        async with record_latency(model_name, input_tokens):
+            if STREAMING_ENABLED and video_id and stream_fields:
+                response = await _generate_streamed(model, prompt, hedger, stage, generation_config, video_id, stream_fields)
+            else:
+                response = await hedger.call(
+                    lambda: model.generate_content_async(prompt, generation_config=generation_config)
+                )
+
+    if video_id:
+        prompt_tokens, output_tokens = usage_from_response(response)
+        await record_usage(
+            video_id, stage, model_name,
+            input_tokens=prompt_tokens, output_tokens=output_tokens, seconds=time.monotonic() - started,
+        )
+    return response
+
+
+async def _generate_streamed(model, prompt, hedger, stage, generation_config, video_id, stream_fields):
+    async def open_stream():
+        response = await model.generate_content_async(prompt, generation_config=generation_config, stream=True)
+        chunks = response.__aiter__()
+        return response, chunks, await chunks.__anext__()
+
+    # With streaming, the hedge decision is made on time to first chunk.
+    response, chunks, chunk = await hedger.call(open_stream)
+
+    text = ""
+    published = {}
+    while True:
+        text += _chunk_text(chunk)
+        for field in stream_fields:
+            value = partial_string_field(text, field)
+            if value and value != published.get(field):
+                published[field] = value
+                status_channel.publish(video_id, {"stage": stage, "field": field, "text": value})
+        try:
+            chunk = await chunks.__anext__()
+        except StopAsyncIteration:
+            break
+    return response
+
+
+def _chunk_text(chunk) -> str:
+    try:
+        return chunk.text
+    except ValueError:
+        # Chunks without text parts (e.g. the final finish-reason chunk) raise on `.text`.
+        return ""
+
+
+_DANGLING_UNICODE_ESCAPE = re.compile(r"\\u[0-9a-fA-F]{0,3}$")
+
+
+def partial_string_field(text: str, field: str) -> Optional[str]:
+    """
+    Extracts the value of a top-level JSON string field from a possibly
+    incomplete JSON document, e.g. '{"summary": "The video expl' -> 'The video expl'.
+    """
+    match = re.search(r'"%s"\s*:\s*"' % re.escape(field), text)
+    if not match:
+        return None
+
+    raw = text[match.end():]
+    escaped = False
+    end = None
+    for i, char in enumerate(raw):
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == '"':
+            end = i
+            break
+
+    body = raw if end is None else raw[:end]
+    if escaped:
+        body = body[:-1]
+    body = _DANGLING_UNICODE_ESCAPE.sub("", body)
+    try:
+        return json.loads(f'"{body}"', strict=False)
+    except json.JSONDecodeError:
+        return None
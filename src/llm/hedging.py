@@ -0,0 +1,145 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Hedging is opt-in. When enabled, a duplicate request is sent once the original
+# has been outstanding longer than LLM_HEDGE_PERCENTILE of recent latencies.
+HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_WINDOW_SIZE = int(os.getenv("LLM_HEDGE_WINDOW_SIZE", "200"))
+
+
+class LatencyWindow:
+    """A rolling window of recent call latencies, in seconds."""
+
+    def __init__(self, size: int = HEDGE_WINDOW_SIZE):
+        self._samples = deque(maxlen=size)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Returns the nearest-rank percentile, or None if no samples exist."""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+        return ordered[rank]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class Hedger:
+    """
+    Sends a duplicate of a slow request and keeps whichever answer arrives first.
+
+    The hedge delay is the configured percentile of this hedger's own recent
+    latencies, so each stage learns its own threshold. Until enough samples have
+    been observed, calls are passed through without hedging.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        enabled: bool = HEDGING_ENABLED,
+        percentile: float = HEDGE_PERCENTILE,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+        window_size: int = HEDGE_WINDOW_SIZE,
+    ):
+        self.name = name
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.latencies = LatencyWindow(window_size)
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """Returns how long to wait before hedging, or None to never hedge."""
+        if not self.enabled or len(self.latencies) < self.min_samples:
+            return None
+        return self.latencies.percentile(self.percentile)
+
+    async def call(self, factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        Runs `factory()` and, if it is still outstanding after the hedge delay,
+        runs it a second time. The first successful result wins and the other
+        request is cancelled.
+        """
+        self.calls += 1
+        delay = self.hedge_delay()
+        primary_started = time.monotonic()
+        primary = asyncio.ensure_future(factory())
+
+        if delay is None:
+            result = await primary
+            self.latencies.record(time.monotonic() - primary_started)
+            return result
+
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if primary in done:
+                result = primary.result()
+                self.latencies.record(time.monotonic() - primary_started)
+                return result
+
+            print(f"   ⏱️ {self.name}: request still outstanding after {delay:.1f}s. Sending hedge request.")
+            self.hedged += 1
+            hedge_started = time.monotonic()
+            hedge = asyncio.ensure_future(factory())
+            pending.add(hedge)
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled() or task.exception() is not None:
+                        continue
+                    if task is hedge:
+                        self.hedge_wins += 1
+                        self.latencies.record(time.monotonic() - hedge_started)
+                        # The primary took at least this long. Leaving it out would keep
+                        # only the fast answers, pull the percentile down, and hedge ever more.
+                        self.latencies.record(time.monotonic() - primary_started)
+                    else:
+                        self.latencies.record(time.monotonic() - primary_started)
+                    return task.result()
+
+            # Both requests failed; surface the original request's error.
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def metrics(self) -> dict:
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedge_rate": self.hedged / self.calls if self.calls else 0.0,
+            "win_rate": self.hedge_wins / self.hedged if self.hedged else 0.0,
+            "hedge_delay_seconds": self.hedge_delay(),
+            "samples": len(self.latencies),
+        }
+
+
+_hedgers: Dict[str, Hedger] = {}
+
+
+def get_hedger(stage: str) -> Hedger:
+    """Returns the process-wide hedger for a pipeline stage."""
+    if stage not in _hedgers:
+        _hedgers[stage] = Hedger(stage)
+    return _hedgers[stage]
+
+
+def hedging_metrics() -> dict:
+    """Returns hedge rate and win rate for every stage that has made a call."""
+    return {stage: hedger.metrics() for stage, hedger in _hedgers.items()}
@@ -0,0 +1,161 @@
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from statistics import median
+from typing import Dict, Optional
+
+import google.generativeai as genai
+
+from .hedging import LatencyWindow
+
+FAST_MODEL_NAME = os.getenv("GEMINI_FAST_MODEL_NAME", "gemini-1.5-flash-latest")
+
+
+@dataclass
+class StagePolicy:
+    """
+    Routing policy for one stage.
+
+    Inputs of at least `pro_above_tokens` tokens go to the high-capability model.
+    Below that, the cheapest model whose predicted latency meets `slo_seconds` wins.
+    """
+    pro_above_tokens: float
+    slo_seconds: float
+
+
+# Defaults. Each value can be overridden with LLM_ROUTE_<STAGE>_PRO_ABOVE_TOKENS
+# and LLM_ROUTE_<STAGE>_SLO_SECONDS; GEMINI_MODEL_<STAGE> pins a stage to one model.
+DEFAULT_POLICIES = {
+    # Video input has no text token count, so transcription always uses the pro model.
+    "transcription": StagePolicy(pro_above_tokens=0, slo_seconds=600),
+    "analysis": StagePolicy(pro_above_tokens=8000, slo_seconds=120),
+    "copywriting": StagePolicy(pro_above_tokens=30000, slo_seconds=90),
+    "image_prompts": StagePolicy(pro_above_tokens=float("inf"), slo_seconds=15),
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) for routing decisions."""
+    return len(text or "") // 4
+
+
+def _model_cost(model_name: str) -> float:
+    """Relative cost per token. Flash-class models are the cheap tier."""
+    return 1.0 if "flash" in model_name else 4.0
+
+
+class ModelStats:
+    """Observed latencies for one model."""
+
+    def __init__(self, window_size: int = 200):
+        self.latencies = LatencyWindow(window_size)
+        self._seconds_per_ktok = deque(maxlen=window_size)
+        self.calls = 0
+
+    def record(self, input_tokens: int, seconds: float):
+        self.calls += 1
+        self.latencies.record(seconds)
+        self._seconds_per_ktok.append(seconds / max(input_tokens, 1000) * 1000)
+
+    def predict(self, input_tokens: int) -> Optional[float]:
+        """Predicts latency for an input size, or None when there is no data yet."""
+        if not self._seconds_per_ktok:
+            return None
+        return median(self._seconds_per_ktok) * max(input_tokens, 1000) / 1000
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "p50_seconds": self.latencies.percentile(50),
+            "p95_seconds": self.latencies.percentile(95),
+            "median_seconds_per_1k_tokens": median(self._seconds_per_ktok) if self._seconds_per_ktok else None,
+        }
+
+
+class ModelRouter:
+    """Picks a Gemini model per stage from input size, latency SLO and cost."""
+
+    def __init__(self, fast_model_name: str = FAST_MODEL_NAME):
+        self.fast_model_name = fast_model_name
+        self.enabled = os.getenv("LLM_ROUTING_ENABLED", "true").lower() == "true"
+        self.policies: Dict[str, StagePolicy] = {}
+        self.overrides: Dict[str, str] = {}
+        for stage, default in DEFAULT_POLICIES.items():
+            prefix = f"LLM_ROUTE_{stage.upper()}"
+            self.policies[stage] = StagePolicy(
+                pro_above_tokens=float(os.getenv(f"{prefix}_PRO_ABOVE_TOKENS", default.pro_above_tokens)),
+                slo_seconds=float(os.getenv(f"{prefix}_SLO_SECONDS", default.slo_seconds)),
+            )
+            if override := os.getenv(f"GEMINI_MODEL_{stage.upper()}"):
+                self.overrides[stage] = override
+        self.stats: Dict[str, ModelStats] = {}
+        self.decisions: Dict[str, Dict[str, int]] = {}
+
+    def choose(self, stage: str, input_tokens: int, default_model: str) -> str:
+        """
+        Returns the model to use for a call. `default_model` is the configured
+        GEMINI_MODEL_NAME and is treated as the high-capability tier.
+        """
+        if stage in self.overrides:
+            model_name = self.overrides[stage]
+        elif not self.enabled or not self.fast_model_name or stage not in self.policies:
+            model_name = default_model
+        else:
+            model_name = self._route(self.policies[stage], input_tokens, default_model)
+
+        stage_decisions = self.decisions.setdefault(stage, {})
+        stage_decisions[model_name] = stage_decisions.get(model_name, 0) + 1
+        return model_name
+
+    def _route(self, policy: StagePolicy, input_tokens: int, default_model: str) -> str:
+        if input_tokens >= policy.pro_above_tokens:
+            return default_model
+
+        candidates = sorted({default_model, self.fast_model_name}, key=_model_cost)
+        predictions = {name: self._stats_for(name).predict(input_tokens) for name in candidates}
+        for name in candidates:
+            if predictions[name] is None or predictions[name] <= policy.slo_seconds:
+                return name
+        # Nothing meets the SLO, so take whichever is predicted to be fastest.
+        return min(candidates, key=lambda name: predictions[name])
+
+    def _stats_for(self, model_name: str) -> ModelStats:
+        if model_name not in self.stats:
+            self.stats[model_name] = ModelStats()
+        return self.stats[model_name]
+
+    def record(self, model_name: str, input_tokens: int, seconds: float):
+        """Records an observed call latency for a model."""
+        self._stats_for(model_name).record(input_tokens, seconds)
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "overrides": self.overrides,
+            "decisions": self.decisions,
+            "models": {name: stats.to_dict() for name, stats in self.stats.items()},
+        }
+
+
+@asynccontextmanager
+async def record_latency(model_name: str, input_tokens: int):
+    """Records the latency of the wrapped call with the model router if it succeeds."""
+    started = time.monotonic()
+    yield
+    model_router.record(model_name, input_tokens, time.monotonic() - started)
+
+
+_generative_models: Dict[str, genai.GenerativeModel] = {}
+
+
+def generative_model(model_name: str) -> genai.GenerativeModel:
+    """Returns a cached GenerativeModel for a model name."""
+    if model_name not in _generative_models:
+        _generative_models[model_name] = genai.GenerativeModel(model_name=model_name)
+    return _generative_models[model_name]
+
+
+# Global instance of the ModelRouter
+model_router = ModelRouter()
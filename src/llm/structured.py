@@ -0,0 +1,132 @@
+import json
+import re
+from collections import Counter
+from typing import Dict, Type, TypeVar, get_args, get_origin
+
+from pydantic import BaseModel, ValidationError
+
+M = TypeVar("M", bound=BaseModel)
+
+_CODE_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_TIMESTAMP = re.compile(r"^(?:(\d+):)?(\d+):(\d+(?:\.\d+)?)$")
+
+
+class StructuredOutputError(ValueError):
+    """Raised when a model response cannot be parsed or repaired into the expected schema."""
+
+
+# Parse outcomes per model name: "ok", "repaired" or "failed".
+_parse_stats: Dict[str, Counter] = {}
+
+
+def parse_stats() -> dict:
+    """Returns parse outcome counts per model."""
+    return {model_name: dict(counts) for model_name, counts in _parse_stats.items()}
+
+
+def parse_structured(text: str, schema: Type[M], model_name: str) -> M:
+    """
+    Parses a JSON response into `schema`, repairing minor issues locally instead
+    of regenerating. Raises StructuredOutputError if the response is unusable.
+    """
+    counts = _parse_stats.setdefault(model_name, Counter())
+    repaired = False
+
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        repaired = True
+        try:
+            data = json.loads(_repair_json_text(text), strict=False)
+        except json.JSONDecodeError as e:
+            counts["failed"] += 1
+            raise StructuredOutputError(f"Response is not valid JSON: {e}") from e
+
+    # Some responses wrap the object in a single-element list.
+    if isinstance(data, list) and len(data) == 1 and isinstance(data[0], dict):
+        data, repaired = data[0], True
+    if not isinstance(data, dict):
+        counts["failed"] += 1
+        raise StructuredOutputError(f"Expected a JSON object, got {type(data).__name__}.")
+
+    try:
+        result = schema.model_validate(data)
+    except ValidationError:
+        repaired = True
+        try:
+            result = schema.model_validate(_repair_fields(data, schema))
+        except ValidationError as e:
+            counts["failed"] += 1
+            raise StructuredOutputError(f"Response does not match {schema.__name__}: {e}") from e
+
+    result = _unescape_newlines(result)
+    counts["repaired" if repaired else "ok"] += 1
+    if repaired:
+        print(f"   🔧 Repaired malformed {schema.__name__} response from {model_name}.")
+    return result
+
+
+def _repair_json_text(text: str) -> str:
+    """Strips code fences and surrounding prose, and drops trailing commas."""
+    text = _CODE_FENCE.sub("", text.strip())
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        text = text[start:end + 1]
+    return _TRAILING_COMMA.sub(r"\1", text)
+
+
+def _parse_timestamp(value):
+    """Converts "1:23" or "01:02:03.5" style timestamps into seconds."""
+    if isinstance(value, str) and (match := _TIMESTAMP.match(value.strip())):
+        hours, minutes, seconds = match.groups()
+        return int(hours or 0) * 3600 + int(minutes) * 60 + float(seconds)
+    return value
+
+
+def _repair_fields(data: dict, schema: Type[BaseModel]) -> dict:
+    """
+    Coerces fields into the shapes `schema` expects. Items of nested model lists
+    that still fail validation are dropped rather than failing the whole response.
+    """
+    repaired = dict(data)
+    for name, field in schema.model_fields.items():
+        if name not in repaired:
+            continue
+        value = repaired[name]
+        annotation = field.annotation
+
+        if annotation is str:
+            if isinstance(value, list):
+                repaired[name] = "\n".join(str(v) for v in value)
+            elif isinstance(value, dict):
+                repaired[name] = "\n\n".join(str(v) for v in value.values())
+        elif annotation is float:
+            repaired[name] = _parse_timestamp(value)
+        elif get_origin(annotation) is list:
+            item_type = get_args(annotation)[0]
+            if not isinstance(value, list):
+                value = [value] if value else []
+            if item_type is str:
+                repaired[name] = [str(v) for v in value if v is not None]
+            elif isinstance(item_type, type) and issubclass(item_type, BaseModel):
+                items = []
+                for item in value:
+                    if not isinstance(item, dict):
+                        continue
+                    try:
+                        items.append(item_type.model_validate(_repair_fields(item, item_type)))
+                    except ValidationError:
+                        print(f"   Dropping invalid {item_type.__name__} from response.")
+                repaired[name] = items
+    return repaired
+
+
+def _unescape_newlines(result: M) -> M:
+    """Turns literal "\\n" sequences left by double-escaping into real newlines."""
+    updates = {
+        name: value.replace("\\n", "\n")
+        for name, value in result.__dict__.items()
+        if isinstance(value, str) and "\\n" in value
+    }
+    return result.model_copy(update=updates) if updates else result
@@ -0,0 +1,125 @@
+import os
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from google.cloud import firestore
+
+from ..database import db
+from ..quotas import quota_manager
+
+# Per-(day, user) rollups live in this collection, one document per pair, and
+# per-video totals under the video doc's `usage` field. Both are keyed
+# stage -> model -> counters.
+USAGE_COLLECTION = "usage_rollups"
+
+# Approximate list prices in USD, used only to estimate cost in usage reports.
+# (input, output) per million tokens, matched on the model name.
+TOKEN_PRICES_PER_MILLION = {
+    "flash": (0.075, 0.30),
+    "pro": (1.25, 5.00),
+}
+IMAGE_PRICE = float(os.getenv("IMAGEN_PRICE_PER_IMAGE", "0.04"))
+
+# video_id -> user_id, so each call does not need to read the video doc.
+_video_owners: Dict[str, str] = {}
+
+
+def usage_from_response(response) -> Tuple[int, int]:
+    """Returns (input_tokens, output_tokens) from a Gemini response, or zeros if it has no usage metadata."""
+    metadata = getattr(response, "usage_metadata", None)
+    if not metadata:
+        return 0, 0
+    if isinstance(metadata, dict):
+        # Batch prediction output uses the REST field names.
+        return int(metadata.get("promptTokenCount") or 0), int(metadata.get("candidatesTokenCount") or 0)
+    return int(getattr(metadata, "prompt_token_count", 0) or 0), int(getattr(metadata, "candidates_token_count", 0) or 0)
+
+
+async def _owner_of(video_id: str) -> str:
+    if video_id not in _video_owners:
+        doc = await db.collection("videos").document(video_id).get()
+        user_id = (doc.to_dict() or {}).get("user_id") if doc.exists else None
+        _video_owners[video_id] = user_id or "unknown"
+    return _video_owners[video_id]
+
+
+async def record_usage(
+    video_id: str,
+    stage: str,
+    model_name: str,
+    *,
+    input_tokens: int = 0,
+    output_tokens: int = 0,
+    images: int = 0,
+    seconds: Optional[float] = None,
+):
+    """
+    Adds one model call's usage to the video doc and to the day's rollup for
+    the video's owner, and charges the tokens to the owner's daily quota.
+    Failures are logged and never fail the pipeline.
+    """
+    counters = {
+        "calls": firestore.Increment(1),
+        "input_tokens": firestore.Increment(input_tokens),
+        "output_tokens": firestore.Increment(output_tokens),
+        "images": firestore.Increment(images),
+    }
+    if seconds is not None:
+        counters["seconds"] = firestore.Increment(round(seconds, 3))
+
+    try:
+        user_id = await _owner_of(video_id)
+        day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        await db.collection("videos").document(video_id).set(
+            {"usage": {stage: {model_name: counters}}}, merge=True
+        )
+        await db.collection(USAGE_COLLECTION).document(f"{day}_{user_id}").set(
+            {"day": day, "user_id": user_id, "stages": {stage: {model_name: counters}}}, merge=True
+        )
+        if user_id != "unknown":
+            await quota_manager.charge(user_id, "tokens", input_tokens + output_tokens)
+    except Exception as e:
+        print(f"   ⚠️ Could not record usage for {video_id} ({stage}, {model_name}): {e}")
+
+
+def estimate_cost(model_name: str, counters: dict) -> float:
+    """Estimates the USD cost of a model's usage counters."""
+    if "imag" in model_name:
+        return counters.get("images", 0) * IMAGE_PRICE
+    for family, (input_price, output_price) in TOKEN_PRICES_PER_MILLION.items():
+        if family in model_name:
+            return (
+                counters.get("input_tokens", 0) * input_price
+                + counters.get("output_tokens", 0) * output_price
+            ) / 1_000_000
+    return 0.0
+
+
+def summarize_usage(usage_by_stage: dict) -> dict:
+    """
+    Totals a stage -> model -> counters mapping per stage and per model, with
+    estimated cost, so the stages that dominate cost and latency stand out.
+    """
+    totals = {"by_stage": {}, "by_model": {}, "estimated_cost_usd": 0.0}
+    for stage, models in usage_by_stage.items():
+        for model_name, counters in models.items():
+            cost = estimate_cost(model_name, counters)
+            for bucket in (
+                totals["by_stage"].setdefault(stage, {}),
+                totals["by_model"].setdefault(model_name, {}),
+            ):
+                for name, value in counters.items():
+                    bucket[name] = bucket.get(name, 0) + value
+                bucket["estimated_cost_usd"] = bucket.get("estimated_cost_usd", 0.0) + cost
+            totals["estimated_cost_usd"] += cost
+    return totals
+
+
+def merge_usage(target: dict, usage_by_stage: dict) -> dict:
+    """Adds one stage -> model -> counters mapping into another."""
+    for stage, models in usage_by_stage.items():
+        for model_name, counters in models.items():
+            bucket = target.setdefault(stage, {}).setdefault(model_name, {})
+            for name, value in counters.items():
+                bucket[name] = bucket.get(name, 0) + value
+    return target
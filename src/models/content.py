@@ -0,0 +1,120 @@
+from typing import Iterable, List, Type
+
+from pydantic import BaseModel, create_model
+
+
+class ShortsCandidate(BaseModel):
+    """A segment of the video that could stand alone as a YouTube Short."""
+    suggested_title: str
+    start_time: float
+    end_time: float
+    reason: str = ""
+    transcript_snippet: str = ""
+
+
+class StructuredData(BaseModel):
+    """The AnalysisAgent's output, stored as `structured_data` on the video doc."""
+    key_themes: List[str] = []
+    summary: str
+    bullet_summary: List[str] = []
+    meaningful_quotes: List[str] = []
+    call_to_action: str = ""
+    shorts_candidates: List[ShortsCandidate] = []
+
+
+class TranscriptSegment(BaseModel):
+    """A timed stretch of the transcript, in seconds from the start of the video."""
+    start: float
+    end: float
+    text: str
+
+
+class TimedTranscript(BaseModel):
+    """The TranscriptionAgent's output when the model returns timestamps."""
+    segments: List[TranscriptSegment] = []
+
+
+class MarketingCopy(BaseModel):
+    """The CopywriterAgent's output. `substack_article` is stored in GCS, not Firestore."""
+    facebook_post: str
+    email_newsletter: str
+    substack_article: str
+
+
+# Response schemas passed to Gemini so that it emits JSON in exactly these shapes.
+# They mirror the pydantic models above in the OpenAPI subset the API accepts.
+SHORTS_CANDIDATE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "suggested_title": {"type": "STRING"},
+        "start_time": {"type": "NUMBER"},
+        "end_time": {"type": "NUMBER"},
+        "reason": {"type": "STRING"},
+        "transcript_snippet": {"type": "STRING"},
+    },
+    "required": ["suggested_title", "start_time", "end_time", "reason", "transcript_snippet"],
+}
+
+STRUCTURED_DATA_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "key_themes": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "summary": {"type": "STRING"},
+        "bullet_summary": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "meaningful_quotes": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "call_to_action": {"type": "STRING"},
+        "shorts_candidates": {"type": "ARRAY", "items": SHORTS_CANDIDATE_SCHEMA},
+    },
+    "required": ["key_themes", "summary", "bullet_summary", "meaningful_quotes", "call_to_action", "shorts_candidates"],
+}
+
+TIMED_TRANSCRIPT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "segments": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "start": {"type": "NUMBER"},
+                    "end": {"type": "NUMBER"},
+                    "text": {"type": "STRING"},
+                },
+                "required": ["start", "end", "text"],
+            },
+        },
+    },
+    "required": ["segments"],
+}
+
+MARKETING_COPY_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "facebook_post": {"type": "STRING"},
+        "email_newsletter": {"type": "STRING"},
+        "substack_article": {"type": "STRING"},
+    },
+    "required": ["facebook_post", "email_newsletter", "substack_article"],
+}
+
+
+def field_subset(model: Type[BaseModel], fields: Iterable[str]) -> Type[BaseModel]:
+    """Returns a pydantic model with only the given fields of `model`, for partial regeneration."""
+    fields = list(fields)
+    unknown = [name for name in fields if name not in model.model_fields]
+    if unknown:
+        raise ValueError(f"Unknown {model.__name__} fields: {', '.join(unknown)}")
+    return create_model(
+        f"{model.__name__}Fields",
+        **{name: (model.model_fields[name].annotation, ...) for name in fields},
+    )
+
+
+def schema_subset(schema: dict, fields: Iterable[str]) -> dict:
+    """Returns a response schema restricted to the given top-level properties."""
+    fields = list(fields)
+    return {
+        "type": "OBJECT",
+        "properties": {name: schema["properties"][name] for name in fields},
+        "required": fields,
+    }
@@ -0,0 +1,150 @@
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+from google.cloud import firestore
+
+from .database import db
+
+# Daily per-user budgets. A limit of -1 means unlimited.
+DEFAULT_LIMITS = {
+    "tokens": int(os.getenv("QUOTA_DAILY_TOKENS", "2000000")),
+    "images": int(os.getenv("QUOTA_DAILY_IMAGES", "50")),
+    "ffmpeg_seconds": int(os.getenv("QUOTA_DAILY_FFMPEG_SECONDS", "1800")),
+}
+QUOTAS_ENABLED = os.getenv("QUOTAS_ENABLED", "true").lower() == "true"
+
+USAGE_COLLECTION = "quota_usage"
+OVERRIDES_COLLECTION = "quota_overrides"
+
+
+class QuotaExceededError(Exception):
+    """Raised when admitting work would take a user over their daily budget."""
+
+    def __init__(self, resource: str, limit: int, used: float, retry_after: int):
+        super().__init__(f"Daily {resource} quota exceeded ({used:g} of {limit} used).")
+        self.resource = resource
+        self.limit = limit
+        self.used = used
+        self.retry_after = retry_after
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def _seconds_until_reset() -> int:
+    now = datetime.now(timezone.utc)
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return int((midnight - now).total_seconds()) + 1
+
+
+class QuotaManager:
+    """
+    Tracks per-user daily usage of tokens, images and ffmpeg-seconds in Firestore
+    and checks it before on-demand work is admitted. Work without an owning user
+    (e.g. auto-ingested channel videos) is not budgeted.
+
+    Images and ffmpeg-seconds are reserved up front in a transaction, so
+    concurrent requests cannot overshoot the budget. Tokens are not known until a
+    call finishes, so they are charged afterwards (for every Gemini call on the
+    user's videos) and checked against the budget on admission.
+    """
+
+    def _usage_ref(self, user_id: str, day: str):
+        return db.collection(USAGE_COLLECTION).document(f"{user_id}_{day}")
+
+    async def limits(self, user_id: str) -> dict:
+        """Returns the user's daily limits, with any admin overrides applied."""
+        doc = await db.collection(OVERRIDES_COLLECTION).document(user_id).get()
+        overrides = (doc.to_dict() or {}) if doc.exists else {}
+        return {resource: overrides.get(resource, default) for resource, default in DEFAULT_LIMITS.items()}
+
+    async def set_overrides(self, user_id: str, overrides: dict):
+        """Sets admin overrides for a user's limits. A value of None removes that override."""
+        await db.collection(OVERRIDES_COLLECTION).document(user_id).set(
+            {resource: firestore.DELETE_FIELD if limit is None else limit for resource, limit in overrides.items()},
+            merge=True,
+        )
+
+    async def status(self, user_id: str) -> dict:
+        """Returns today's limit, usage and remaining budget per resource."""
+        limits = await self.limits(user_id)
+        doc = await self._usage_ref(user_id, _today()).get()
+        usage = (doc.to_dict() or {}) if doc.exists else {}
+        return {
+            "day": _today(),
+            "resets_in_seconds": _seconds_until_reset(),
+            "resources": {
+                resource: {
+                    "limit": limit,
+                    "used": usage.get(resource, 0),
+                    "remaining": None if limit < 0 else max(limit - usage.get(resource, 0), 0),
+                }
+                for resource, limit in limits.items()
+            },
+        }
+
+    async def check(self, user_id: str, resource: str, amount: float = 0):
+        """Raises QuotaExceededError if `amount` more of `resource` would exceed the user's budget."""
+        if not QUOTAS_ENABLED or not user_id:
+            return
+        limit = (await self.limits(user_id))[resource]
+        if limit < 0:
+            return
+        doc = await self._usage_ref(user_id, _today()).get()
+        used = (doc.to_dict() or {}).get(resource, 0) if doc.exists else 0
+        if used + amount > limit:
+            raise QuotaExceededError(resource, limit, used, _seconds_until_reset())
+
+    async def reserve(self, user_id: str, resource: str, amount: float):
+        """Atomically checks and charges `amount` of `resource`, or raises QuotaExceededError."""
+        if not QUOTAS_ENABLED or not user_id:
+            return
+        limit = (await self.limits(user_id))[resource]
+        day = _today()
+        ref = self._usage_ref(user_id, day)
+
+        @firestore.async_transactional
+        async def reserve_in_transaction(transaction):
+            snapshot = await ref.get(transaction=transaction)
+            used = (snapshot.to_dict() or {}).get(resource, 0) if snapshot.exists else 0
+            if 0 <= limit < used + amount:
+                raise QuotaExceededError(resource, limit, used, _seconds_until_reset())
+            transaction.set(ref, {"user_id": user_id, "day": day, resource: used + amount}, merge=True)
+
+        await reserve_in_transaction(db.transaction())
+
+    async def charge(self, user_id: str, resource: str, amount: float):
+        """Adds usage that has already happened, without checking the budget."""
+        if not amount or not user_id:
+            return
+        day = _today()
+        await self._usage_ref(user_id, day).set(
+            {"user_id": user_id, "day": day, resource: firestore.Increment(amount)}, merge=True
+        )
+
+    async def refund(self, user_id: str, resource: str, amount: float):
+        """Gives back budget taken by `reserve` for work that did not use it."""
+        if QUOTAS_ENABLED:
+            await self.charge(user_id, resource, -amount)
+
+    @asynccontextmanager
+    async def reservation(self, user_id: str, resource: str, amount: float):
+        """Reserves budget for a block of work and refunds it if the work fails."""
+        await self.reserve(user_id, resource, amount)
+        try:
+            yield
+        except BaseException:
+            await self.refund(user_id, resource, amount)
+            raise
+
+
+async def video_owner(video_id: str) -> str | None:
+    """Returns the user_id that owns a video, for endpoints that only know the video."""
+    doc = await db.collection("videos").document(video_id).get()
+    return (doc.to_dict() or {}).get("user_id") if doc.exists else None
+
+
+# Global instance of the QuotaManager
+quota_manager = QuotaManager()
@@ -1,15 +1,106 @@
 import os
 import shutil
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from ..imagen.batching import image_batcher
+from ..imagen.cache import image_cache
+from ..imagen.scheduler import imagen_scheduler
+from ..llm.hedging import hedging_metrics
+from ..llm.routing import model_router
+from ..llm.structured import parse_stats
+from ..llm.usage import USAGE_COLLECTION, merge_usage, summarize_usage
+from ..quotas import quota_manager
+from ..database import db
+from ..warmup import warm_up
+from .auth import require_admin
 
 router = APIRouter(
     tags=["admin"],
 )
 
+class QuotaOverrides(BaseModel):
+    # Daily limits for a user; -1 means unlimited and null removes the override.
+    tokens: int | None = None
+    images: int | None = None
+    ffmpeg_seconds: int | None = None
+
 @router.get("/health")
 async def health_check():
-    return {"status": "ok"}
+    """
+    Readiness for Cloud Run's startup probe: 503 while the agents warm up, then
+    200 with the warm-up result and each component's init time. A degraded
+    instance still serves traffic, as the app did before warm-up was tracked.
+    """
+    return JSONResponse(status_code=200 if warm_up.finished else 503, content=warm_up.status())
+
+@router.get("/api/metrics/llm")
+async def llm_metrics(admin: dict = Depends(require_admin)):
+    """
+    Reports per-stage LLM call metrics: hedge rate and hedge win rate, model
+    routing decisions and observed latencies per model, structured-output
+    parse outcomes per model, and Imagen images per call, admission waits per
+    lane, 429s, the current adaptive concurrency limit and image cache hits.
+    """
+    return {
+        "hedging": hedging_metrics(),
+        "routing": model_router.metrics(),
+        "structured_output": parse_stats(),
+        "imagen": {**image_batcher.metrics(), "scheduler": imagen_scheduler.metrics(), "cache": image_cache.metrics()},
+    }
+
+@router.get("/api/admin/usage")
+async def usage_report(day: str = None, user_id: str = None, admin: dict = Depends(require_admin)):
+    """
+    Reports Gemini token and Imagen image usage from the daily rollups, optionally
+    filtered by day (YYYY-MM-DD) and user, with totals and estimated cost per stage and model.
+    """
+    query = db.collection(USAGE_COLLECTION)
+    if day:
+        query = query.where("day", "==", day)
+    if user_id:
+        query = query.where("user_id", "==", user_id)
+
+    rollups = []
+    combined = {}
+    async for doc in query.stream():
+        rollup = doc.to_dict()
+        merge_usage(combined, rollup.get("stages", {}))
+        rollups.append({
+            "day": rollup.get("day"),
+            "user_id": rollup.get("user_id"),
+            "usage": rollup.get("stages", {}),
+            "totals": summarize_usage(rollup.get("stages", {})),
+        })
+    rollups.sort(key=lambda rollup: (rollup["day"] or "", rollup["user_id"] or ""))
+    return {"rollups": rollups, "totals": summarize_usage(combined)}
+
+@router.get("/api/admin/usage/videos/{video_id}")
+async def video_usage(video_id: str, admin: dict = Depends(require_admin)):
+    """
+    Reports the token and image usage recorded for one video, per stage and model.
+    """
+    doc = await db.collection("videos").document(video_id).get()
+    if not doc.exists:
+        raise HTTPException(status_code=404, detail="Video not found.")
+    usage = doc.to_dict().get("usage", {})
+    return {"video_id": video_id, "usage": usage, "totals": summarize_usage(usage)}
+
+@router.get("/api/admin/quotas/{user_id}")
+async def get_user_quota(user_id: str, admin: dict = Depends(require_admin)):
+    """
+    Returns a user's daily limits (with overrides applied), usage and remaining budget.
+    """
+    return await quota_manager.status(user_id)
+
+@router.put("/api/admin/quotas/{user_id}")
+async def set_user_quota(user_id: str, overrides: QuotaOverrides, admin: dict = Depends(require_admin)):
+    """
+    Overrides a user's daily limits. Only the fields present in the body are changed.
+    """
+    await quota_manager.set_overrides(user_id, overrides.model_dump(exclude_unset=True))
+    return await quota_manager.status(user_id)
 
 @router.post("/api/cleanup-cache")
 async def cleanup_cache(request: Request):
@@ -9,6 +9,7 @@ from jose import JWTError, jwt
 from fastapi.security import OAuth2PasswordBearer
 
 from ..database import db
+from ..quotas import quota_manager
 from ..security import encrypt_data, decrypt_data
 from ..auth.authentication import create_access_token, JWT_SECRET_KEY, ALGORITHM
 
@@ -84,6 +85,17 @@ async def get_current_user_from_query(token: str):
     user_data['uid'] = user_id
     return user_data
 
+# Comma-separated emails of users allowed to call admin endpoints.
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
+
+async def require_admin(current_user: dict = Depends(get_current_user)):
+    """
+    Dependency for admin-only endpoints. Allows users whose email is listed in ADMIN_EMAILS.
+    """
+    if (current_user.get("email") or "").lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required.")
+    return current_user
+
 @router.get("/api/user/me", response_model=User)
 async def get_user_me(current_user: dict = Depends(get_current_user)):
     """
@@ -91,6 +103,14 @@ async def get_user_me(current_user: dict = Depends(get_current_user)):
     """
     return current_user
 
+@router.get("/api/quota")
+async def get_quota(current_user: dict = Depends(get_current_user)):
+    """
+    Returns the current user's daily limits, usage and remaining budget for
+    tokens, images and ffmpeg-seconds.
+    """
+    return await quota_manager.status(current_user.get("uid"))
+
 @router.post("/api/auth/google/login")
 async def google_login(request: GoogleLoginRequest):
     """
@@ -4,13 +4,16 @@ import shutil
 import tempfile
 import uuid
 import yt_dlp
-from fastapi import APIRouter, Request, HTTPException
+from fastapi import APIRouter, Depends, Request, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from google.cloud import storage
 
 from ..database import db
 from ..video_processing import create_vertical_clip
+from ..quotas import quota_manager
+from ..jobs import job_store, job_response
+from .auth import get_current_user
 
 router = APIRouter(
     prefix="/api/video/{video_id}",
@@ -26,28 +29,35 @@ class DeleteClipRequest(BaseModel):
     short_index: int
     clip_url: str
 
-@router.post("/create-clip")
-async def create_clip_endpoint(video_id: str, clip_request: ClipRequest, request: Request):
+@router.post("/create-clip", status_code=202)
+async def create_clip_endpoint(video_id: str, clip_request: ClipRequest, request: Request, current_user: dict = Depends(get_current_user)):
     """
-    Creates, crops, and uploads a short video clip from the original video.
-    Caches the downloaded source video in memory to avoid redundant downloads.
+    Starts a job that creates, crops, and uploads a short video clip from the
+    original video, and returns its id (see /api/jobs). The job's result is
+    {"clip_url"}. The downloaded source video is cached to avoid redundant downloads.
     """
-    try:
-        video_cache = request.app.state.video_cache
+    video_cache = request.app.state.video_cache
+    video_doc_ref = db.collection("videos").document(video_id)
+    doc = await video_doc_ref.get()
+    if not doc.exists:
+        return JSONResponse(status_code=404, content={"message": "Video not found"})
+
+    video_data = doc.to_dict()
+    if video_data.get("user_id") != current_user.get("uid"):
+        raise HTTPException(status_code=403, detail="User not authorized to modify this video.")
+    video_url = video_data.get("video_url")
+    if not video_cache.get(video_id) and not video_url:
+        return JSONResponse(status_code=404, content={"message": "Video URL not found in document."})
+
+    # ffmpeg time is budgeted by the length of the clip it encodes.
+    owner_id = video_data.get("user_id")
+    clip_seconds = max(clip_request.end_time - clip_request.start_time, 0)
+    await quota_manager.check(owner_id, "ffmpeg_seconds", clip_seconds)
+
+    async def create_clip(progress):
         input_path = video_cache.get(video_id)
-
         if not input_path:
-            video_doc_ref = db.collection("videos").document(video_id)
-            doc = await video_doc_ref.get()
-            if not doc.exists:
-                return JSONResponse(status_code=404, content={"message": "Video not found"})
-            
-            video_data = doc.to_dict()
-            video_url = video_data.get("video_url")
-
-            if not video_url:
-                return JSONResponse(status_code=404, content={"message": "Video URL not found in document."})
-
+            await progress(0.05, "Downloading the source video")
             tmpdir = tempfile.mkdtemp(prefix="channel_video_cache_")
             print(f"Downloading video: {video_url} to cache directory {tmpdir}")
             ydl_opts = {
@@ -67,14 +77,17 @@ async def create_clip_endpoint(video_id: str, clip_request: ClipRequest, request
         output_filename = f"clip_{video_id}_{uuid.uuid4()}.mp4"
         output_path = os.path.join(output_dir, output_filename)
         
-        await asyncio.to_thread(
-            create_vertical_clip,
-            input_path=input_path,
-            output_path=output_path,
-            start_time=clip_request.start_time,
-            end_time=clip_request.end_time
-        )
-
+        await progress(0.4, "Encoding the clip")
+        async with quota_manager.reservation(owner_id, "ffmpeg_seconds", clip_seconds):
+            await asyncio.to_thread(
+                create_vertical_clip,
+                input_path=input_path,
+                output_path=output_path,
+                start_time=clip_request.start_time,
+                end_time=clip_request.end_time
+            )
+
+        await progress(0.85, "Uploading the clip")
         gcs_bucket_name = os.getenv("GCS_BUCKET_NAME")
         storage_client = storage.Client()
         bucket = storage_client.bucket(gcs_bucket_name)
@@ -86,22 +99,21 @@ async def create_clip_endpoint(video_id: str, clip_request: ClipRequest, request
 
         print(f"Uploaded clip to: {blob.public_url}")
 
-        doc = await db.collection("videos").document(video_id).get()
+        doc = await video_doc_ref.get()
         if doc.exists:
             video_data = doc.to_dict()
             if 'structured_data' in video_data and 'shorts_candidates' in video_data['structured_data']:
                 if clip_request.short_index < len(video_data['structured_data']['shorts_candidates']):
                     video_data['structured_data']['shorts_candidates'][clip_request.short_index]['generated_clip_url'] = blob.public_url
-                    await db.collection("videos").document(video_id).set(video_data)
+                    await video_doc_ref.set(video_data)
                     print(f"Saved clip URL to Firestore for short index {clip_request.short_index}")
 
         os.remove(output_path)
 
-        return JSONResponse(status_code=200, content={"clip_url": blob.public_url})
+        return {"clip_url": blob.public_url}
 
-    except Exception as e:
-        print(f"Error creating clip for {video_id}: {e}")
-        return JSONResponse(status_code=500, content={"message": "Internal server error"})
+    job = await job_store.submit("create_clip", create_clip, user_id=owner_id, video_id=video_id)
+    return JSONResponse(status_code=202, content=job_response(job))
 
 @router.post("/delete-clip")
 async def delete_clip_endpoint(video_id: str, delete_request: DeleteClipRequest):
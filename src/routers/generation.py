@@ -8,7 +8,13 @@ from fastapi import Depends
 from datetime import datetime, timezone
 
 from ..database import db
-from ..agents.visuals import VisualsAgent
+from ..agents.visuals import VisualsAgent, get_visuals_agent as get_shared_visuals_agent
+from ..quotas import quota_manager, video_owner, QuotaExceededError
+from ..jobs import job_store, job_response
+from ..compositing.derivatives import accepted_formats, pick_derivative
+from ..compositing.templates import ThumbnailTemplate, template_store
+from ..compositing.thumbnails import FORMATS as THUMBNAIL_FORMATS
+from .auth import get_current_user
 
 router = APIRouter(
     tags=["generation"],
@@ -28,77 +34,89 @@ class RegeneratePromptsRequest(BaseModel):
 class PromptRequest(BaseModel):
     prompt: str
     model_name: str | None = None
+    new_variation: bool = False
 
 class OnDemandImageRequest(BaseModel):
     prompt: str
     model_name: str | None = None
+    new_variation: bool = False
 
 class GeneratePromptsRequest(BaseModel):
     context: str
 
+class CompositeThumbnailRequest(BaseModel):
+    source_gcs_uri: str = Field(..., description="An image of this video to use as the background.")
+    title: str | None = Field(None, description="Defaults to the video's title; pass a Short's title for Shorts.")
+    template: str | None = Field(None, description="Defaults to the user's default template.")
+    formats: list[str] = list(THUMBNAIL_FORMATS)
+
 # This is a simplification. You'd likely have a shared storage client.
 storage_client = storage.Client()
 bucket_name = os.environ.get("GCS_BUCKET_NAME")
 
-def get_visuals_agent():
-    gcp_project_id = os.getenv("GOOGLE_CLOUD_PROJECT")
-    gcp_region = os.getenv("GCP_REGION")
-    gcs_bucket_name = os.getenv("GCS_BUCKET_NAME")
-    gemini_api_key = os.getenv("GEMINI_API_KEY")
-    imagen_model_name = os.getenv("IMAGEN_MODEL_NAME", "imagegeneration@006")
-    gemini_model_name = os.getenv("GEMINI_MODEL_NAME")
-
-    if not all([gcp_project_id, gcp_region, gcs_bucket_name, gemini_api_key, gemini_model_name]):
-        raise HTTPException(status_code=500, detail="Missing critical environment variables for VisualsAgent.")
-
-    visuals_agent = VisualsAgent(
-        project_id=gcp_project_id, 
-        location=gcp_region, 
-        bucket_name=gcs_bucket_name, 
-        api_key=gemini_api_key, 
-        model_name=imagen_model_name,
-        gemini_model_name=gemini_model_name
-    )
-    return visuals_agent
-
-@router.post("/regenerate-image")
-async def regenerate_image(request: RegenerateImageRequest):
+def _signed_url(gcs_uri: str) -> str:
+    blob = storage_client.bucket(bucket_name).blob(gcs_uri.replace(f"gs://{bucket_name}/", ""))
+    return blob.generate_signed_url(version="v4", expiration=3600, method="GET")
+
+def get_visuals_agent() -> VisualsAgent:
+    try:
+        return get_shared_visuals_agent()
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/regenerate-image", status_code=202)
+async def regenerate_image(request: RegenerateImageRequest, current_user: dict = Depends(get_current_user)):
     """
-    Generates a new image from a prompt and adds it to the video's record.
+    Starts a job that generates a new image from a prompt and adds it to the
+    video's record. The job's result is {"new_image_url"}.
     """
     print(f" regenerating image for video {request.video_id} with prompt: {request.prompt[:30]}...")
     video_doc_ref = db.collection("videos").document(request.video_id)
+    doc = await video_doc_ref.get()
+    if not doc.exists:
+        raise HTTPException(status_code=404, detail="Video not found.")
+    owner_id = doc.to_dict().get("user_id")
+    if owner_id != current_user.get("uid"):
+        raise HTTPException(status_code=403, detail="User not authorized to modify this video.")
+    await quota_manager.check(owner_id, "images", 1)
+    visuals_agent = get_visuals_agent()
 
-    try:
-        visuals_agent = get_visuals_agent()
-
-        new_image_url = await visuals_agent._generate_and_upload_image(
-            prompt=request.prompt,
-            video_id=request.video_id,
-            index=99,
-            diversity_options={
-                "gender": request.diversity_gender,
-                "ethnicity": request.diversity_ethnicity,
-                "ability": request.diversity_ability,
-            }
-        )
+    async def regenerate(progress):
+        try:
+            await progress(0.1, "Generating the image")
+            async with quota_manager.reservation(owner_id, "images", 1):
+                image = await visuals_agent._generate_and_upload_image(
+                    prompt=request.prompt,
+                    video_id=request.video_id,
+                    index=99,
+                    new_variation=True,
+                )
+                if not image:
+                    raise Exception("Image generation returned no image.")
+            new_image_url = image["gcs_uri"]
 
-        await video_doc_ref.update({
-            "image_urls": firestore.ArrayUnion([new_image_url])
-        })
+            await video_doc_ref.update({
+                "image_urls": firestore.ArrayUnion([new_image_url])
+            })
 
-        print(f"   Successfully generated and saved new image: {new_image_url}")
-        return JSONResponse(status_code=200, content={"new_image_url": new_image_url})
+            print(f"   Successfully generated and saved new image: {new_image_url}")
+            return {"new_image_url": new_image_url}
 
-    except Exception as e:
-        print(f"❌ Image Regeneration Error: {e}")
-        await video_doc_ref.update({"status": "visuals_failed", "error": f"Regeneration failed: {e}"})
-        return JSONResponse(status_code=500, content={"message": "An internal error occurred during image regeneration."})
+        except QuotaExceededError:
+            raise
+        except Exception as e:
+            print(f"❌ Image Regeneration Error: {e}")
+            await video_doc_ref.update({"status": "visuals_failed", "error": f"Regeneration failed: {e}"})
+            raise HTTPException(status_code=500, detail="An internal error occurred during image regeneration.")
 
-@router.post("/regenerate-prompts")
-async def regenerate_prompts(request: RegeneratePromptsRequest):
+    job = await job_store.submit("regenerate_image", regenerate, user_id=owner_id, video_id=request.video_id)
+    return JSONResponse(status_code=202, content=job_response(job))
+
+@router.post("/regenerate-prompts", status_code=202)
+async def regenerate_prompts(request: RegeneratePromptsRequest, current_user: dict = Depends(get_current_user)):
     """
-    API endpoint to regenerate image prompts for a video.
+    Starts a job that regenerates image prompts for a video. The job's result
+    is {"new_prompts"}.
     """
     video_doc_ref = db.collection("videos").document(request.video_id)
     doc = await video_doc_ref.get()
@@ -107,42 +125,53 @@ async def regenerate_prompts(request: RegeneratePromptsRequest):
         return JSONResponse(status_code=404, content={"message": "Video not found"})
 
     video_data = doc.to_dict()
+    if video_data.get("user_id") != current_user.get("uid"):
+        raise HTTPException(status_code=403, detail="User not authorized to modify this video.")
     structured_data = video_data.get("structured_data")
     substack_gcs_uri = video_data.get("substack_gcs_uri")
     if not structured_data:
         return JSONResponse(status_code=400, content={"message": "Analysis data (structured_data) not found."})
 
+    await quota_manager.check(video_data.get("user_id"), "tokens")
     visuals_agent = get_visuals_agent()
     
-    try:
-        new_prompts = await visuals_agent._generate_image_prompts(structured_data, substack_gcs_uri)
+    async def regenerate(progress):
+        try:
+            await progress(0.1, "Writing new prompts")
+            new_prompts = await visuals_agent._generate_image_prompts(request.video_id, structured_data, substack_gcs_uri)
 
-        await video_doc_ref.update({
-            "image_prompts": firestore.ArrayUnion(new_prompts)
-        })
+            await video_doc_ref.update({
+                "image_prompts": firestore.ArrayUnion(new_prompts)
+            })
 
-        print(f"   ✅ Successfully generated and saved {len(new_prompts)} new prompts.")
-        return JSONResponse(status_code=200, content={"new_prompts": new_prompts})
+            print(f"   ✅ Successfully generated and saved {len(new_prompts)} new prompts.")
+            return {"new_prompts": new_prompts}
 
-    except Exception as e:
-        print(f"❌ Prompt Regeneration Error: {e}")
-        return JSONResponse(status_code=500, content={"message": "An internal error occurred during prompt regeneration."})
+        except Exception as e:
+            print(f"❌ Prompt Regeneration Error: {e}")
+            raise HTTPException(status_code=500, detail="An internal error occurred during prompt regeneration.")
+
+    job = await job_store.submit("regenerate_prompts", regenerate, user_id=video_data.get("user_id"), video_id=request.video_id)
+    return JSONResponse(status_code=202, content=job_response(job))
 
 @router.post("/api/video/{video_id}/generate-thumbnail")
 async def generate_thumbnail_on_demand(video_id: str, prompt_request: PromptRequest, request: Request):
     """API endpoint to generate a single thumbnail on-demand."""
-    visuals_agent = request.app.state.visuals_agent
-    if not visuals_agent:
-        return JSONResponse(status_code=500, content={"message": "Visuals agent not initialized."})
+    visuals_agent = get_visuals_agent()
     
     try:
-        new_thumbnail = await visuals_agent.generate_single_image_from_prompt(
-            video_id, 
-            prompt_request.prompt,
-            model_name=prompt_request.model_name
-        )
-        if not new_thumbnail:
-            raise Exception("Image generation failed.")
+        owner_id = await video_owner(video_id)
+        async with quota_manager.reservation(owner_id, "images", 1):
+            new_thumbnail = await visuals_agent.generate_single_image_from_prompt(
+                video_id, 
+                prompt_request.prompt,
+                model_name=prompt_request.model_name,
+                new_variation=prompt_request.new_variation,
+            )
+            if not new_thumbnail:
+                raise Exception("Image generation failed.")
+        if new_thumbnail.get("cached"):
+            await quota_manager.refund(owner_id, "images", 1)
 
         video_doc_ref = db.collection("videos").document(video_id)
         await video_doc_ref.update({
@@ -151,6 +180,8 @@ async def generate_thumbnail_on_demand(video_id: str, prompt_request: PromptRequ
         
         return JSONResponse(content={"thumbnail": new_thumbnail}, status_code=201)
 
+    except QuotaExceededError:
+        raise
     except Exception as e:
         print(f"On-demand thumbnail generation failed: {e}")
         return JSONResponse(status_code=500, content={"message": str(e)})
@@ -171,46 +202,46 @@ async def generate_prompts_for_video(video_id: str, request: GeneratePromptsRequ
         if not structured_data:
             raise ValueError("Structured data not found, cannot generate prompts.")
 
-        prompts = await agent._generate_image_prompts(structured_data, substack_gcs_uri)
+        await quota_manager.check(video_data.get("user_id"), "tokens")
+        prompts = await agent._generate_image_prompts(video_id, structured_data, substack_gcs_uri)
         return {"prompts": prompts}
+    except QuotaExceededError:
+        raise
     except Exception as e:
         print(f"On-demand prompt generation failed: {e}")
         return JSONResponse(status_code=500, content={"message": str(e)})
 
 @router.post("/video/{video_id}/generate-image")
-async def generate_on_demand_image(video_id: str, request: OnDemandImageRequest, agent: VisualsAgent = Depends(get_visuals_agent)):
+async def generate_on_demand_image(video_id: str, request: OnDemandImageRequest, http_request: Request, agent: VisualsAgent = Depends(get_visuals_agent)):
     """
     On-demand, generates a single image for a video based on a user-provided prompt.
     """
     if not request.prompt:
         raise HTTPException(status_code=400, detail="Prompt cannot be empty.")
+    owner_id = await video_owner(video_id)
     
     try:
         print(f"   Using on-demand model: {request.model_name}")
-        image_data = await agent.generate_single_image_from_prompt(
-            video_id,
-            request.prompt,
-            model_name=request.model_name
-        )
+        async with quota_manager.reservation(owner_id, "images", 1):
+            image_data = await agent.generate_single_image_from_prompt(
+                video_id,
+                request.prompt,
+                model_name=request.model_name,
+                new_variation=request.new_variation,
+            )
+        if image_data and image_data.get("cached"):
+            await quota_manager.refund(owner_id, "images", 1)
         if image_data and "gcs_uri" in image_data:
             gcs_uri = image_data["gcs_uri"]
             
-            # Convert the GCS URI to a signed URL for the frontend
-            blob_name = gcs_uri.replace(f"gs://{bucket_name}/", "")
-            bucket = storage_client.bucket(bucket_name)
-            blob = bucket.blob(blob_name)
-
-            signed_url = blob.generate_signed_url(
-                version="v4",
-                expiration=3600, # 1 hour
-                method="GET",
-            )
+            # Convert the GCS URI to a signed URL for the frontend, preferring a preview-sized derivative
+            signed_url = _signed_url(pick_derivative(image_data, "preview", accepted_formats(http_request.headers.get("accept"))) or gcs_uri)
             
             # Save the permanent GCS URI to Firestore for later use
             video_doc_ref = db.collection("videos").document(video_id)
             await video_doc_ref.update({
                 "on_demand_thumbnails": firestore.ArrayUnion([
-                    {"prompt": request.prompt, "gcs_uri": gcs_uri, "model": request.model_name, "created_at": datetime.now(timezone.utc)}
+                    {"prompt": request.prompt, "gcs_uri": gcs_uri, "derivatives": image_data.get("derivatives") or {}, "model": request.model_name, "created_at": datetime.now(timezone.utc)}
                 ])
             })
 
@@ -227,6 +258,60 @@ async def generate_on_demand_image(video_id: str, request: OnDemandImageRequest,
             return response_data
 
         raise HTTPException(status_code=500, detail="Image generation failed.")
+    except QuotaExceededError:
+        raise
     except Exception as e:
         print(f"On-demand thumbnail generation failed: {e}")
-        raise HTTPException(status_code=500, detail=f"An error occurred: {e}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}") 
+@router.get("/thumbnail-templates")
+async def list_thumbnail_templates(current_user: dict = Depends(get_current_user)):
+    """Lists the built-in thumbnail templates and the current user's own."""
+    templates = await template_store.list(current_user.get("uid"))
+    default = (await template_store.get(current_user.get("uid"))).name
+    return {"templates": [template.model_dump() for template in templates], "default": default}
+
+@router.put("/thumbnail-templates/{name}")
+async def save_thumbnail_template(name: str, template: ThumbnailTemplate, make_default: bool = False, current_user: dict = Depends(get_current_user)):
+    """Creates or replaces one of the current user's thumbnail templates."""
+    template.name = name
+    await template_store.save(current_user.get("uid"), template, make_default=make_default)
+    return {"template": template.model_dump()}
+
+@router.post("/video/{video_id}/composite-thumbnail", status_code=201)
+async def composite_thumbnail(video_id: str, body: CompositeThumbnailRequest, agent: VisualsAgent = Depends(get_visuals_agent), current_user: dict = Depends(get_current_user)):
+    """
+    Renders a video's title over one of its images with a thumbnail template,
+    in each requested format (landscape 1280x720, vertical 1080x1920). No new
+    image is generated, so this does not count against the image quota.
+    """
+    if unknown := [f for f in body.formats if f not in THUMBNAIL_FORMATS]:
+        raise HTTPException(status_code=400, detail=f"Unknown formats: {', '.join(unknown)}. Use {', '.join(THUMBNAIL_FORMATS)}.")
+    if not body.source_gcs_uri.startswith(f"gs://{bucket_name}/images/{video_id}_"):
+        raise HTTPException(status_code=400, detail="The source image must be one of this video's images.")
+
+    doc = await db.collection("videos").document(video_id).get()
+    if not doc.exists:
+        raise HTTPException(status_code=404, detail="Video not found")
+    video_data = doc.to_dict()
+    if video_data.get("user_id") != current_user.get("uid"):
+        raise HTTPException(status_code=403, detail="User not authorized to modify this video.")
+    try:
+        template = await template_store.get(video_data.get("user_id"), body.template)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Template '{body.template}' not found.")
+
+    try:
+        composite = await agent.composite_thumbnail(
+            video_id, body.source_gcs_uri, body.title or video_data.get("video_title", ""), template, body.formats
+        )
+    except Exception as e:
+        print(f"Thumbnail compositing failed: {e}")
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+
+    await db.collection("videos").document(video_id).update({
+        "composited_thumbnails": firestore.ArrayUnion([{**composite, "created_at": datetime.now(timezone.utc)}])
+    })
+    composite["composite_urls"] = {
+        output_format: _signed_url(uri) for output_format, uri in composite["composites"].items()
+    }
+    return composite
@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse
+from fastapi.security import OAuth2PasswordBearer
+from sse_starlette.sse import EventSourceResponse
+
+from ..jobs import FINISHED, job_store
+from .auth import get_current_user_from_query
+from .videos import serialize_firestore_doc
+
+router = APIRouter(
+    prefix="/api/jobs",
+    tags=["jobs"],
+)
+
+# Jobs recorded without a user are readable by their id alone.
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/google/login", auto_error=False)
+
+# How often the event stream re-reads a job that may be running on another instance.
+POLL_SECONDS = 5
+
+
+async def _authorized_job(job_id: str, token: str | None) -> dict:
+    """Returns the job, or raises 404 if it does not exist and 403 if it is someone else's."""
+    job = await job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if job.get("user_id"):
+        current_user = await get_current_user_from_query(token)
+        if current_user.get("uid") != job["user_id"]:
+            raise HTTPException(status_code=403, detail="Not authorized to view this job.")
+    return job
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, token: str | None = Depends(optional_oauth2_scheme)):
+    """Returns a job's status, progress and, once finished, its result or error."""
+    job = await _authorized_job(job_id, token)
+    return JSONResponse(status_code=200, content=serialize_firestore_doc(job))
+
+
+@router.get("/{job_id}/events")
+async def stream_job(request: Request, job_id: str, token: str | None = None):
+    """
+    Streams a job's progress as SSE "message" events until it finishes. The
+    first event is the whole job; later ones carry the fields that changed,
+    and the last one has the result or error.
+    """
+    async def event_generator():
+        queue = job_store.channel.subscribe(job_id)
+        try:
+            job = await _authorized_job(job_id, token)
+            yield {"event": "message", "data": json.dumps(serialize_firestore_doc(job))}
+
+            while job.get("status") not in FINISHED:
+                if await request.is_disconnected():
+                    break
+                try:
+                    update = await asyncio.wait_for(queue.get(), timeout=POLL_SECONDS)
+                    job.update(update)
+                    yield {"event": "message", "data": json.dumps(serialize_firestore_doc(update))}
+                except asyncio.TimeoutError:
+                    # No pushed updates: the job may be running elsewhere, so read it again.
+                    latest = await job_store.get(job_id)
+                    if latest is None:
+                        break
+                    if latest.get("updated_at") != job.get("updated_at"):
+                        job = latest
+                        yield {"event": "message", "data": json.dumps(serialize_firestore_doc(job))}
+        except HTTPException as e:
+            yield {"event": "error", "data": json.dumps({"status": "error", "message": e.detail})}
+        except Exception as e:
+            print(f"Error in job stream for {job_id}: {e}")
+            yield {"event": "error", "data": json.dumps({"status": "error", "message": "An internal error occurred on the stream."})}
+        finally:
+            job_store.channel.unsubscribe(job_id, queue)
+
+    return EventSourceResponse(event_generator())
@@ -0,0 +1,46 @@
+import asyncio
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+
+from ..topics import topic_clusterer
+from .auth import get_current_user
+
+router = APIRouter(
+    prefix="/api/topics",
+    tags=["topics"],
+)
+
+# Re-clustering jobs running in the background.
+_recluster_jobs = set()
+
+@router.get("")
+async def get_topics(current_user: dict = Depends(get_current_user)):
+    """Returns the current user's topic clusters, with labels and member videos."""
+    state = await topic_clusterer.get(current_user.get("uid"))
+    if state is None:
+        return JSONResponse(content={"status": "not_clustered", "clusters": []})
+    return JSONResponse(content={
+        "status": state.get("status"),
+        "clusters": state.get("clusters", []),
+        "updated_at": state["updated_at"].isoformat() if state.get("updated_at") else None,
+        "clustered_at": state["clustered_at"].isoformat() if state.get("clustered_at") else None,
+    })
+
+@router.post("/recluster", status_code=202)
+async def recluster_topics(current_user: dict = Depends(get_current_user)):
+    """
+    Starts a batch job that re-clusters all of the current user's videos from scratch.
+    Poll GET /api/topics until its status is 'ready'.
+    """
+    user_id = current_user.get("uid")
+
+    async def run():
+        try:
+            await topic_clusterer.recluster(user_id)
+        except Exception as e:
+            print(f"Error re-clustering topics for user {user_id}: {e}")
+
+    task = asyncio.create_task(run())
+    _recluster_jobs.add(task)
+    task.add_done_callback(_recluster_jobs.discard)
+    return JSONResponse(status_code=202, content={"message": "Re-clustering started.", "status": "running"})
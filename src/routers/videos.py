@@ -1,9 +1,8 @@
 import asyncio
 import json
 import os
-from datetime import datetime, timedelta
-import tempfile
-import uuid
+from datetime import datetime
+from collections import OrderedDict
 
 from fastapi import APIRouter, Depends, Request, HTTPException, status, Query
 from fastapi.responses import JSONResponse
@@ -17,10 +16,20 @@ from ..database import db
 from ..agents.ingestion import get_video_id
 from ..events import NewVideoDetected, TranscriptReady, ContentAnalysisComplete, CopyReady, IngestedVideo
 from ..event_bus import event_bus
+from ..status_channel import status_channel
+from ..llm.structured import StructuredOutputError
+from ..quotas import quota_manager
+from ..jobs import job_store, job_response
 from ..security import decrypt_data, encrypt_data
 from .auth import get_current_user, get_current_user_from_query
-from ..video_processing import create_vertical_clip
-from ..agents.visuals import VisualsAgent
+from ..transcript_index import TranscriptIndex
+from ..transcript_search import search_index_store
+from ..vector_index import vector_index_store
+from ..topics import topic_clusterer
+from ..compositing.derivatives import accepted_formats, pick_derivative
+from ..duplicates import fingerprint_store, reuse_duplicate
+from ..llm.embeddings import embed_texts
+from ..agents.visuals import get_visuals_agent
 
 router = APIRouter()
 
@@ -53,6 +62,24 @@ def serialize_firestore_doc(doc):
 
     return convert(doc)
 
+def _image_urls(image: dict, accepted: set, variant: str = "preview", full_variant: str | None = "full") -> dict:
+    """
+    Signed URLs for an image's smallest suitable derivative: `image_url` at the
+    display size and, if asked for, `full_image_url` for full-size viewing.
+    Images without derivatives fall back to the original.
+    """
+    urls = {"image_url": _get_signed_url(pick_derivative(image, variant, accepted) or image.get("gcs_uri"))}
+    if full_variant:
+        full_uri = pick_derivative(image, full_variant, accepted)
+        urls["full_image_url"] = _get_signed_url(full_uri) if full_uri else urls["image_url"]
+    return urls
+
+def _composite_urls(thumbnail: dict) -> dict:
+    """Signed URLs for a thumbnail's composited formats, if it has any."""
+    if not thumbnail.get("composites"):
+        return {}
+    return {"composite_urls": {name: _get_signed_url(uri) for name, uri in thumbnail["composites"].items()}}
+
 def _get_signed_url(gcs_uri: str) -> str:
     """Converts a GCS URI to a signed URL."""
     if not gcs_uri or not bucket_name:
@@ -79,20 +106,34 @@ class IngestUrlRequest(BaseModel):
 class RetriggerRequest(BaseModel):
     video_id: str
     stage: str # e.g., "transcription", "analysis", "copywriting", "visuals"
+    execution_mode: str = "interactive" # or "batch" for backfills that nobody is waiting on
+
+class BackfillRequest(BaseModel):
+    video_ids: list[str]
+    stage: str
+
+class RegenerateFieldsRequest(BaseModel):
+    target: str # "structured_data" or "marketing_copy"
+    fields: list[str] # e.g., ["email_newsletter"] or ["shorts_candidates"]
 
 class GeneratePromptsRequest(BaseModel):
     context: str
 
+class DuplicateDecisionRequest(BaseModel):
+    action: str # "reuse" the matching upload's artifacts, or "process" this video anyway
+
 class GenerateImageRequest(BaseModel):
     prompt: str
     model_name: str = "imagegeneration@006" # default model
+    new_variation: bool = False # skip the image cache and always generate a new image
 
 @router.post("/api/ingest-url")
-async def ingest_url(request: IngestUrlRequest, current_user: dict = Depends(get_current_user)):
+async def ingest_url(request: IngestUrlRequest, http_request: Request, current_user: dict = Depends(get_current_user)):
     """
     API endpoint to manually trigger ingestion. Uses the user's credentials.
     Requires our internal JWT authentication.
     """
+    await quota_manager.check(current_user.get("uid"), "tokens")
     try:
         user_id = current_user.get("uid")
         print(f"Request received from authenticated user: {user_id}")
@@ -128,10 +169,18 @@ async def ingest_url(request: IngestUrlRequest, current_user: dict = Depends(get
             if image_urls := video_data.get("image_urls"):
                 video_data["image_urls"] = [_get_signed_url(url) for url in image_urls if url]
             
+            # Dashboard cards only show small previews, so these use the card-sized variant.
+            accepted = accepted_formats(http_request.headers.get("accept"))
+            if thumbnails := video_data.get("generated_thumbnails"):
+                video_data["generated_thumbnails"] = [
+                    {**thumb, **_image_urls(thumb, accepted, "card", None)}
+                    for thumb in thumbnails if thumb.get("gcs_uri")
+                ]
+
             if on_demand_thumbs := video_data.get("on_demand_thumbnails"):
                 video_data["on_demand_thumbnails"] = [
-                    {**thumb, "image_url": _get_signed_url(thumb["image_url"])}
-                    for thumb in on_demand_thumbs if thumb.get("image_url")
+                    {**thumb, **_image_urls(thumb, accepted, "card", None)}
+                    for thumb in on_demand_thumbs if thumb.get("gcs_uri")
                 ]
             
             print(json.dumps(video_data, indent=2))
@@ -148,7 +197,7 @@ async def ingest_url(request: IngestUrlRequest, current_user: dict = Depends(get
                 storage_client = storage.Client()
                 bucket = storage_client.bucket(bucket_name)
 
-                gcs_uri_fields = ["transcript_gcs_uri", "analysis_gcs_uri", "substack_gcs_uri"]
+                gcs_uri_fields = ["transcript_gcs_uri", "transcript_index_gcs_uri", "analysis_gcs_uri", "substack_gcs_uri"]
                 
                 for field in gcs_uri_fields:
                     if gcs_uri := video_data.get(field):
@@ -235,6 +284,7 @@ async def get_status(video_id: str):
 @router.get("/api/stream-status/{video_id}")
 async def stream_status(request: Request, video_id: str, token: str):
     async def event_generator():
+        partial_queue = None
         try:
             # First, authenticate the user from the token.
             current_user = await get_current_user_from_query(token)
@@ -253,6 +303,8 @@ async def stream_status(request: Request, video_id: str, token: str):
                 return
 
             # If we've gotten this far, user is auth'd and auth'z. Start the stream.
+            # Partial LLM output arrives on the status channel between document polls.
+            partial_queue = status_channel.subscribe(video_id)
             while True:
                 if await request.is_disconnected():
                     print(f"Client disconnected from {video_id} stream.")
@@ -272,8 +324,15 @@ async def stream_status(request: Request, video_id: str, token: str):
                 
                 yield { "event": "message", "data": json.dumps(data) }
                 
-                # We can increase the sleep time slightly to reduce the frequency of reads
-                await asyncio.sleep(2)
+                # Forward partial output until the next document poll is due.
+                loop = asyncio.get_running_loop()
+                next_poll = loop.time() + 2
+                while (remaining := next_poll - loop.time()) > 0:
+                    try:
+                        partial = await asyncio.wait_for(partial_queue.get(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    yield { "event": "partial", "data": json.dumps(partial) }
 
         except HTTPException as e:
             # Catch auth exceptions and send a proper SSE error
@@ -284,6 +343,8 @@ async def stream_status(request: Request, video_id: str, token: str):
             traceback.print_exc()
             yield { "event": "error", "data": json.dumps({"status": "error", "message": "An internal error occurred on the stream."}) }
         finally:
+            if partial_queue is not None:
+                status_channel.unsubscribe(video_id, partial_queue)
             print(f"Closing SSE stream for {video_id}.")
 
     return EventSourceResponse(event_generator())
@@ -297,6 +358,9 @@ async def re_trigger(request: RetriggerRequest, current_user: dict = Depends(get
     user_id = current_user.get("uid")
     video_id = request.video_id
     stage = request.stage.lower()
+    execution_mode = request.execution_mode.lower()
+    if execution_mode not in ("interactive", "batch"):
+        raise HTTPException(status_code=400, detail=f"Invalid execution mode '{request.execution_mode}'.")
     
     video_doc_ref = db.collection("videos").document(video_id)
     doc = await video_doc_ref.get()
@@ -308,6 +372,7 @@ async def re_trigger(request: RetriggerRequest, current_user: dict = Depends(get
 
     if video_data.get("user_id") != user_id:
         raise HTTPException(status_code=403, detail="User not authorized to re-trigger this video.")
+    await quota_manager.check(user_id, "tokens")
 
     # --- Smart Re-trigger Logic ---
     if stage == "ingestion":
@@ -332,6 +397,7 @@ async def re_trigger(request: RetriggerRequest, current_user: dict = Depends(get
             "gcs_uri": gcs_uri_to_preserve, # The preserved URI
             "status": "ingested",
             "status_message": "Smart restart initiated. Awaiting transcription.",
+            "execution_mode": execution_mode,
             "created_at": video_data.get("created_at", firestore.SERVER_TIMESTAMP),
             "updated_at": firestore.SERVER_TIMESTAMP,
         })
@@ -343,7 +409,7 @@ async def re_trigger(request: RetriggerRequest, current_user: dict = Depends(get
             user_id=user_id,
             video_title=video_data.get("video_title")
         )
-        await event_bus.publish(event)
+        await _publish_for_mode(event, execution_mode)
         print(f"   Smart restart complete. Published IngestedVideo event for {video_id}.")
         return JSONResponse(content={"message": "Smart restart successful. The pipeline will now run from the beginning using the existing video file."})
 
@@ -364,6 +430,7 @@ async def re_trigger(request: RetriggerRequest, current_user: dict = Depends(get
         await video_doc_ref.update({
             "status": "pending_transcription_rerun",
             "status_message": "Re-triggering transcription.",
+            "execution_mode": execution_mode,
             "transcript_gcs_uri": firestore.DELETE_FIELD
         })
 
@@ -381,6 +448,7 @@ async def re_trigger(request: RetriggerRequest, current_user: dict = Depends(get
         await video_doc_ref.update({
             "status": "pending_analysis_rerun",
             "status_message": "Re-triggering content analysis.",
+            "execution_mode": execution_mode,
             "structured_data": firestore.DELETE_FIELD
         })
 
@@ -398,6 +466,7 @@ async def re_trigger(request: RetriggerRequest, current_user: dict = Depends(get
         await video_doc_ref.update({
             "status": "pending_copywriting_rerun",
             "status_message": "Re-triggering copywriting.",
+            "execution_mode": execution_mode,
             "marketing_copy": firestore.DELETE_FIELD,
             "substack_gcs_uri": firestore.DELETE_FIELD
         })
@@ -415,6 +484,7 @@ async def re_trigger(request: RetriggerRequest, current_user: dict = Depends(get
         await video_doc_ref.update({
             "status": "pending_visuals_rerun",
             "status_message": "Re-triggering visuals generation.",
+            "execution_mode": execution_mode,
             "image_gcs_uris": firestore.DELETE_FIELD,
             "on_demand_thumbnails": firestore.DELETE_FIELD
         })
@@ -422,9 +492,134 @@ async def re_trigger(request: RetriggerRequest, current_user: dict = Depends(get
     else:
         raise HTTPException(status_code=400, detail=f"Invalid stage '{stage}' specified for re-trigger.")
 
-    await event_bus.publish(event)
+    await _publish_for_mode(event, execution_mode)
     return JSONResponse(content={"message": f"Successfully re-triggered the '{stage}' stage."})
 
+@router.post("/api/video/{video_id}/duplicate")
+async def resolve_duplicate(video_id: str, request: DuplicateDecisionRequest, current_user: dict = Depends(get_current_user)):
+    """
+    Resolves a video held as a likely re-upload. 'reuse' copies the earlier upload's
+    transcript, analysis and copy (timestamps shifted) and continues with visuals;
+    'process' runs the full pipeline on this video anyway.
+    """
+    if request.action not in ("reuse", "process"):
+        raise HTTPException(status_code=400, detail="'action' must be 'reuse' or 'process'.")
+    video_doc_ref = db.collection("videos").document(video_id)
+    doc = await video_doc_ref.get()
+    if not doc.exists:
+        raise HTTPException(status_code=404, detail="Video not found.")
+    video_data = doc.to_dict()
+    if video_data.get("user_id") and video_data.get("user_id") != current_user.get("uid"):
+        raise HTTPException(status_code=403, detail="User not authorized to modify this video.")
+    if video_data.get("status") != "duplicate_detected" or not video_data.get("duplicate_of"):
+        raise HTTPException(status_code=409, detail="This video is not waiting on a duplicate decision.")
+    execution_mode = video_data.get("execution_mode", "interactive")
+
+    if request.action == "process":
+        await video_doc_ref.update({
+            "duplicate_decision": "process",
+            "status": "pending_transcription_rerun",
+            "status_message": "Processing this upload in full.",
+        })
+        await _publish_for_mode(IngestedVideo(
+            video_id=video_id,
+            gcs_uri=video_data.get("original_video_gcs_uri"),
+            user_id=video_data.get("user_id"),
+            video_title=video_data.get("video_title"),
+        ), execution_mode)
+        return JSONResponse(content={"message": "Processing the video in full."})
+
+    try:
+        fields = await reuse_duplicate(video_id, video_data, bucket_name)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        print(f"Error reusing artifacts for {video_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to reuse the matching video's artifacts.")
+
+    # Continue the pipeline after the last stage the earlier upload completed.
+    video_title = video_data.get("video_title")
+    if fields.get("marketing_copy"):
+        status, event = "copy_generated", CopyReady(video_id=video_id, video_title=video_title)
+    elif fields.get("structured_data"):
+        status, event = "analyzed", ContentAnalysisComplete(
+            video_id=video_id, video_title=video_title, structured_data=fields["structured_data"]
+        )
+    else:
+        status, event = "transcribed", TranscriptReady(
+            video_id=video_id, video_title=video_title, transcript_gcs_uri=fields["transcript_gcs_uri"]
+        )
+    await video_doc_ref.update({
+        "duplicate_decision": "reuse",
+        "status": status,
+        "status_message": f"Reused the earlier upload '{video_data['duplicate_of'].get('video_title')}'.",
+    })
+    await _publish_for_mode(event, execution_mode)
+    return JSONResponse(content={"message": "Reused the matching video's artifacts.", "reused_from": fields["reused_from"]})
+
+# Batch-mode pipelines can wait minutes for their batch job, so they run in the background.
+async def _publish_for_mode(event, execution_mode: str):
+    if execution_mode != "batch":
+        await event_bus.publish(event)
+        return
+    event_bus.publish_in_background(event)
+
+@router.post("/api/backfill")
+async def backfill(request: BackfillRequest, current_user: dict = Depends(get_current_user)):
+    """
+    Re-runs a stage for many videos in batch execution mode. Their Gemini requests
+    are collected into shared batch jobs, so results arrive later but cost less.
+    """
+    results = {}
+    for video_id in request.video_ids:
+        try:
+            await re_trigger(
+                RetriggerRequest(video_id=video_id, stage=request.stage, execution_mode="batch"),
+                current_user,
+            )
+            results[video_id] = "queued"
+        except HTTPException as e:
+            results[video_id] = e.detail
+    return JSONResponse(content={"message": f"Queued {list(results.values()).count('queued')} video(s) for batch backfill.", "results": results})
+
+@router.post("/api/video/{video_id}/regenerate-fields")
+async def regenerate_fields(video_id: str, body: RegenerateFieldsRequest, request: Request, current_user: dict = Depends(get_current_user)):
+    """
+    Regenerates a chosen subset of fields in `structured_data` or `marketing_copy`
+    and merges them into the existing document, leaving every other field as-is.
+    """
+    video_doc_ref = db.collection("videos").document(video_id)
+    doc = await video_doc_ref.get()
+    if not doc.exists:
+        raise HTTPException(status_code=404, detail="Video not found.")
+    if doc.to_dict().get("user_id") != current_user.get("uid"):
+        raise HTTPException(status_code=403, detail="User not authorized to modify this video.")
+    if not body.fields:
+        raise HTTPException(status_code=400, detail="No fields specified for regeneration.")
+    await quota_manager.check(current_user.get("uid"), "tokens")
+
+    agents = {
+        "structured_data": getattr(request.app.state, "analysis_agent", None),
+        "marketing_copy": getattr(request.app.state, "copywriter_agent", None),
+    }
+    if body.target not in agents:
+        raise HTTPException(status_code=400, detail=f"Invalid target '{body.target}'. Use 'structured_data' or 'marketing_copy'.")
+    agent = agents[body.target]
+    if agent is None:
+        raise HTTPException(status_code=503, detail="Generation agents are not initialized.")
+
+    try:
+        updated = await agent.regenerate_fields(video_id, body.fields)
+    except StructuredOutputError as e:
+        raise HTTPException(status_code=502, detail=f"The model returned unusable output: {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error regenerating fields for {video_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to regenerate fields.")
+
+    return JSONResponse(content={"message": f"Regenerated {', '.join(updated)}.", "target": body.target, "updated": updated})
+
 async def delete_gcs_assets(video_data: dict, keep_video: bool = False):
     """Helper function to delete GCS assets associated with a video."""
     bucket_name = os.getenv("GCS_BUCKET_NAME")
@@ -436,23 +631,26 @@ async def delete_gcs_assets(video_data: dict, keep_video: bool = False):
     bucket = storage_client.bucket(bucket_name)
 
     uris_to_delete = []
-    
-    # Add all GCS URIs from the document to the deletion list
-    for key, value in video_data.items():
+
+    def collect(value):
+        # Images carry their derivatives and composites, and quote cards their
+        # backgrounds, nested inside lists and maps, so the whole document is walked.
         if isinstance(value, str) and value.startswith(f"gs://{bucket_name}/"):
-            # If we're keeping the video, don't add its URI to the list
-            if keep_video and key in ["gcs_uri", "original_video_gcs_uri"]:
-                continue
             uris_to_delete.append(value)
-            
-    # Also handle nested URIs, like in the 'on_demand_thumbnails'
-    if on_demand_thumbs := video_data.get("on_demand_thumbnails"):
-        for thumb in on_demand_thumbs:
-            if thumb_uri := thumb.get("gcs_uri"):
-                uris_to_delete.append(thumb_uri)
-
-    # Use a set to avoid deleting the same file multiple times
-    for uri in set(uris_to_delete):
+        elif isinstance(value, dict):
+            for nested in value.values():
+                collect(nested)
+        elif isinstance(value, list):
+            for nested in value:
+                collect(nested)
+
+    collect(video_data)
+    # If we're keeping the video, don't delete it wherever it is referenced
+    if keep_video:
+        kept = {video_data.get(key) for key in ["gcs_uri", "original_video_gcs_uri"]}
+        uris_to_delete = [uri for uri in uris_to_delete if uri not in kept]
+
+    async def delete(uri: str):
         try:
             blob_path = uri.replace(f"gs://{bucket_name}/", "")
             blob = bucket.blob(blob_path)
@@ -462,8 +660,11 @@ async def delete_gcs_assets(video_data: dict, keep_video: bool = False):
         except Exception as e:
             print(f"   Could not delete GCS asset from URI {uri}: {e}")
 
+    # Use a set to avoid deleting the same file multiple times
+    await asyncio.gather(*(delete(uri) for uri in set(uris_to_delete)))
+
 @router.get("/api/videos")
-async def get_videos(current_user: dict = Depends(get_current_user)):
+async def get_videos(request: Request, current_user: dict = Depends(get_current_user)):
     try:
         user_id = current_user.get("uid")
         if not user_id:
@@ -472,6 +673,7 @@ async def get_videos(current_user: dict = Depends(get_current_user)):
         # Fetch documents for the specific user
         videos_ref = db.collection("videos").where("user_id", "==", user_id)
         docs = videos_ref.stream()
+        accepted = accepted_formats(request.headers.get("accept"))
         videos = []
         async for doc in docs:
             video_data = serialize_firestore_doc(doc.to_dict())
@@ -481,10 +683,17 @@ async def get_videos(current_user: dict = Depends(get_current_user)):
             if image_urls := video_data.get("image_urls"):
                 video_data["image_urls"] = [_get_signed_url(url) for url in image_urls if url]
             
+            # Dashboard cards only show small previews, so these use the card-sized variant.
+            if thumbnails := video_data.get("generated_thumbnails"):
+                video_data["generated_thumbnails"] = [
+                    {**thumb, **_image_urls(thumb, accepted, "card", None)}
+                    for thumb in thumbnails if thumb.get("gcs_uri")
+                ]
+
             if on_demand_thumbs := video_data.get("on_demand_thumbnails"):
                 video_data["on_demand_thumbnails"] = [
-                    {**thumb, "image_url": _get_signed_url(thumb["image_url"])}
-                    for thumb in on_demand_thumbs if thumb.get("image_url")
+                    {**thumb, **_image_urls(thumb, accepted, "card", None)}
+                    for thumb in on_demand_thumbs if thumb.get("gcs_uri")
                 ]
 
             videos.append(video_data)
@@ -498,11 +707,13 @@ async def get_videos(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail="Failed to fetch videos.")
 
 @router.get("/api/video/{video_id}")
-async def get_video(video_id: str):
+async def get_video(video_id: str, request: Request):
     """
     Retrieves a single video by its ID.
-    Converts GCS URIs to signed URLs for frontend display.
+    Converts GCS URIs to signed URLs for frontend display, preferring the
+    smallest image derivative in a format the client accepts.
     """
+    accepted = accepted_formats(request.headers.get("accept"))
     video_doc_ref = db.collection("videos").document(video_id)
     doc = await video_doc_ref.get()
     if not doc.exists:
@@ -514,21 +725,25 @@ async def get_video(video_id: str):
     # For generated thumbnails
     if thumbnails := video_data.get("generated_thumbnails"):
         video_data["generated_thumbnails"] = [
-            {**thumb, "image_url": _get_signed_url(thumb.get("gcs_uri"))}
+            {**thumb, **_image_urls(thumb, accepted), **_composite_urls(thumb)}
             for thumb in thumbnails if thumb.get("gcs_uri")
         ]
+
+    # For thumbnails composited on demand
+    if composited := video_data.get("composited_thumbnails"):
+        video_data["composited_thumbnails"] = [{**thumb, **_composite_urls(thumb)} for thumb in composited]
     
     # For quote visuals
     if quotes := video_data.get("quote_visuals"):
         video_data["quote_visuals"] = [
-            {**quote, "image_url": _get_signed_url(quote.get("gcs_uri"))}
+            {**quote, **_image_urls(quote, accepted)}
             for quote in quotes if quote.get("gcs_uri")
         ]
     
     # For on-demand thumbnails (legacy support)
     if on_demand_thumbs := video_data.get("on_demand_thumbnails"):
         video_data["on_demand_thumbnails"] = [
-            {**thumb, "image_url": _get_signed_url(thumb.get("gcs_uri"))}
+            {**thumb, **_image_urls(thumb, accepted)}
             for thumb in on_demand_thumbs if thumb.get("gcs_uri")
         ]
 
@@ -543,23 +758,122 @@ async def get_video(video_id: str):
     # Process generated_thumbnails
     if thumbnails := video_data.get("structured_data", {}).get("generated_thumbnails"):
         for thumb in thumbnails:
-            if gcs_uri := thumb.get("gcs_uri"):
-                thumb["image_url"] = _get_signed_url(gcs_uri)
+            if thumb.get("gcs_uri"):
+                thumb.update(_image_urls(thumb, accepted))
 
     # Process quote_visuals
     if visuals := video_data.get("structured_data", {}).get("quote_visuals"):
         for visual in visuals:
-            if gcs_uri := visual.get("gcs_uri"):
-                visual["image_url"] = _get_signed_url(gcs_uri)
+            if visual.get("gcs_uri"):
+                visual.update(_image_urls(visual, accepted))
 
     # Process on_demand_thumbnails
     if on_demand := video_data.get("structured_data", {}).get("on_demand_thumbnails"):
         for thumb in on_demand:
-            if gcs_uri := thumb.get("gcs_uri"):
-                thumb["image_url"] = _get_signed_url(gcs_uri)
+            if thumb.get("gcs_uri"):
+                thumb.update(_image_urls(thumb, accepted))
     
     return JSONResponse(status_code=200, content={"video": video_data})
 
+# Recently used transcript indexes, keyed by (video_id, index URI), so that
+# repeated range queries for a video don't re-download its index.
+_transcript_indexes = OrderedDict()
+_TRANSCRIPT_INDEX_CACHE_SIZE = 64
+
+async def _load_transcript_index(video_id: str, video_data: dict) -> TranscriptIndex | None:
+    index_uri = video_data.get("transcript_index_gcs_uri")
+    cache_key = (video_id, index_uri or video_data.get("transcript_gcs_uri"))
+    if cache_key in _transcript_indexes:
+        _transcript_indexes.move_to_end(cache_key)
+        return _transcript_indexes[cache_key]
+
+    bucket = storage_client.bucket(bucket_name)
+    if index_uri:
+        blob = bucket.blob(index_uri.replace(f"gs://{bucket_name}/", ""))
+        index = TranscriptIndex.from_dict(json.loads(await asyncio.to_thread(blob.download_as_text)))
+    elif transcript_uri := video_data.get("transcript_gcs_uri"):
+        # Transcripts saved before the index existed are indexed on first use.
+        blob = bucket.blob(transcript_uri.replace(f"gs://{bucket_name}/", ""))
+        segments = json.loads(await asyncio.to_thread(blob.download_as_text)).get("segments") or []
+        if not segments:
+            return None
+        index = TranscriptIndex.from_segments(segments)
+    else:
+        return None
+
+    _transcript_indexes[cache_key] = index
+    if len(_transcript_indexes) > _TRANSCRIPT_INDEX_CACHE_SIZE:
+        _transcript_indexes.popitem(last=False)
+    return index
+
+@router.get("/api/video/{video_id}/transcript")
+async def get_transcript_range(video_id: str, start: float = Query(..., ge=0), end: float = Query(..., ge=0), snap: bool = False):
+    """
+    Returns the exact transcript text and word boundaries for [start, end] seconds.
+    With `snap=true`, the range is first moved to the nearest sentence edges.
+    """
+    if end <= start:
+        raise HTTPException(status_code=400, detail="'end' must be greater than 'start'.")
+    doc = await db.collection("videos").document(video_id).get()
+    if not doc.exists:
+        raise HTTPException(status_code=404, detail="Video not found.")
+
+    index = await _load_transcript_index(video_id, doc.to_dict())
+    if index is None:
+        raise HTTPException(status_code=404, detail="No timed transcript is available for this video.")
+    if snap:
+        start, end = index.snap(start, end)
+    return index.query(start, end)
+
+@router.get("/api/search")
+async def search_transcripts(q: str = Query(..., min_length=1), limit: int = Query(50, ge=1, le=200), current_user: dict = Depends(get_current_user)):
+    """Finds a phrase across the current user's transcripts, with the timestamps of every hit."""
+    try:
+        hits = await search_index_store.search(current_user.get("uid"), q, limit)
+    except Exception as e:
+        print(f"Error searching transcripts: {e}")
+        raise HTTPException(status_code=500, detail="Failed to search transcripts.")
+    return JSONResponse(content={"query": q, "hits": hits})
+
+@router.get("/api/similar")
+async def find_similar(
+    q: str | None = None,
+    video_id: str | None = None,
+    start: float | None = Query(None, ge=0),
+    end: float | None = Query(None, ge=0),
+    kind: list[str] | None = Query(None),
+    k: int = Query(10, ge=1, le=100),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Finds transcript windows, quotes and Shorts candidates similar to a text (`q`)
+    or to a moment of one of the user's videos (`video_id`, `start`, `end`), across
+    all of the user's videos. Results for a moment exclude the video it came from.
+    """
+    user_id = current_user.get("uid")
+    if q:
+        text = q
+    elif video_id and start is not None and end is not None and end > start:
+        doc = await db.collection("videos").document(video_id).get()
+        if not doc.exists or doc.to_dict().get("user_id") != user_id:
+            raise HTTPException(status_code=404, detail="Video not found.")
+        index = await _load_transcript_index(video_id, doc.to_dict())
+        text = index.query(start, end)["text"] if index else ""
+        if not text:
+            raise HTTPException(status_code=404, detail="No transcript text in that range.")
+    else:
+        raise HTTPException(status_code=400, detail="Provide 'q', or 'video_id' with 'start' < 'end'.")
+
+    try:
+        query = (await embed_texts([text], task_type="retrieval_query"))[0]
+        results = await vector_index_store.search(
+            user_id, query, k, kinds=kind, exclude_video_id=None if q else video_id
+        )
+    except Exception as e:
+        print(f"Error finding similar content: {e}")
+        raise HTTPException(status_code=500, detail="Failed to find similar content.")
+    return JSONResponse(content={"query": text, "results": results})
+
 @router.delete("/api/videos/{video_id}")
 async def delete_video(video_id: str, current_user: dict = Depends(get_current_user)):
     """Deletes a video document and all its associated GCS assets."""
@@ -579,6 +893,20 @@ async def delete_video(video_id: str, current_user: dict = Depends(get_current_u
 
     # Delete the Firestore document
     await video_doc_ref.delete()
+    try:
+        await search_index_store.remove_video(user_id, video_id)
+    except Exception as e:
+        print(f"   ⚠️ Could not remove {video_id} from the search index: {e}")
+    try:
+        await vector_index_store.remove_video(user_id, video_id)
+    except Exception as e:
+        print(f"   ⚠️ Could not remove {video_id} from the vector index: {e}")
+    try:
+        await topic_clusterer.remove_video(user_id, video_id)
+    except Exception as e:
+        print(f"   ⚠️ Could not remove {video_id} from its topic cluster: {e}")
+    if scope := video_data.get("fingerprint_scope"):
+        await fingerprint_store.remove(scope, video_id)
     print(f"Successfully deleted video {video_id} and all its assets.")
     
     return JSONResponse(status_code=200, content={"message": f"Successfully deleted video {video_id}."})
@@ -588,35 +916,42 @@ async def generate_prompts(video_id: str, request: GeneratePromptsRequest, curre
     # Implementation of the new generate_prompts endpoint
     return JSONResponse(status_code=200, content={"prompts": ["Prompt 1", "Prompt 2"]})
 
-@router.post("/api/video/{video_id}/generate-image")
-async def generate_image(video_id: str, request: GenerateImageRequest, current_user: dict = Depends(get_current_user)):
+@router.post("/api/video/{video_id}/generate-image", status_code=202)
+async def generate_image(video_id: str, request: GenerateImageRequest, http_request: Request, current_user: dict = Depends(get_current_user)):
     """
-    Generates a single on-demand image for a video.
+    Starts a job that generates a single on-demand image for a video, and
+    returns its id (see /api/jobs). The job's result is the new image.
     """
-    try:
-        # This assumes you have a way to get the agent instance.
-        # This might be a singleton, a dependency injection, etc.
-        # For now, let's assume it's created on the fly (not ideal for prod)
-        agent = VisualsAgent(
-            project_id=os.environ.get("GCP_PROJECT_ID"),
-            location=os.environ.get("GCP_REGION"),
-            bucket_name=os.environ.get("GCS_BUCKET_NAME"),
-            api_key=os.environ.get("GEMINI_API_KEY"),
-            model_name=os.environ.get("IMAGEN_MODEL_NAME"),
-            gemini_model_name=os.environ.get("GEMINI_MODEL_NAME")
-        )
+    user_id = current_user.get("uid")
+    doc = await db.collection("videos").document(video_id).get()
+    if not doc.exists:
+        raise HTTPException(status_code=404, detail="Video not found.")
+    if doc.to_dict().get("user_id") != user_id:
+        raise HTTPException(status_code=403, detail="User not authorized to modify this video.")
+    await quota_manager.check(user_id, "images", 1)
+    agent = get_visuals_agent()
+    accepted = accepted_formats(http_request.headers.get("accept"))
+
+    async def generate(progress):
+        await progress(0.1, "Generating the image")
+        async with quota_manager.reservation(user_id, "images", 1):
+            image_data = await agent.generate_single_image_from_prompt(
+                video_id=video_id,
+                prompt=request.prompt,
+                model_name=request.model_name,
+                new_variation=request.new_variation,
+            )
 
-        image_data = await agent.generate_single_image_from_prompt(
-            video_id=video_id,
-            prompt=request.prompt,
-            model_name=request.model_name
-        )
+            if not image_data or "gcs_uri" not in image_data:
+                raise HTTPException(status_code=500, detail="Failed to generate image or GCS URI missing.")
 
-        if not image_data or "gcs_uri" not in image_data:
-            raise HTTPException(status_code=500, detail="Failed to generate image or GCS URI missing.")
+        if image_data.get("cached"):
+            # Reused images cost nothing, so they don't count against the quota.
+            await quota_manager.refund(user_id, "images", 1)
 
         # Get a signed URL for the newly created image
-        image_data["image_url"] = _get_signed_url(image_data["gcs_uri"])
+        await progress(0.9, "Saving the image")
+        image_data.update(_image_urls(image_data, accepted))
         if not image_data["image_url"]:
              raise HTTPException(status_code=500, detail="Failed to sign the new image URL.")
 
@@ -631,19 +966,17 @@ async def generate_image(video_id: str, request: GenerateImageRequest, current_u
             "on_demand_thumbnails": firestore.ArrayUnion([{
                 "prompt": image_data["prompt"],
                 "gcs_uri": image_data["gcs_uri"],
+                "derivatives": image_data.get("derivatives") or {},
                 "created_at": timestamp
             }])
         })
         
-        # Add the server-generated timestamp and signed url to the response
+        # Add the server-generated timestamp and signed url to the result
         image_data["created_at"] = timestamp.isoformat()
+        return image_data
 
-        return JSONResponse(status_code=200, content=image_data)
-
-    except Exception as e:
-        import traceback
-        print(f"Error in generate-image: {e}\n{traceback.format_exc()}")
-        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+    job = await job_store.submit("generate_image", generate, user_id=user_id, video_id=video_id)
+    return JSONResponse(status_code=202, content=job_response(job))
 
 # This is a duplicate and insecure endpoint. Removing it.
 # @router.post("/api/ingest")
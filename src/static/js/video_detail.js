@@ -14,6 +14,23 @@ document.addEventListener('DOMContentLoaded', () => {
         return (sanitized.substring(0, 80) || 'video_clip');
     }
 
+    function authHeaders() {
+        const token = localStorage.getItem('accessToken');
+        return token ? { 'Authorization': `Bearer ${token}` } : {};
+    }
+
+    async function waitForJob(jobId) {
+        // Polls a background job (see /api/jobs) until it finishes and returns its result.
+        while (true) {
+            const response = await fetch(`/api/jobs/${jobId}`, { headers: authHeaders() });
+            const job = await response.json();
+            if (!response.ok) throw new Error(job.detail || 'Failed to fetch job status');
+            if (job.status === 'succeeded') return job.result;
+            if (job.status === 'failed') throw new Error((job.error && job.error.detail) || 'The job failed');
+            await new Promise(resolve => setTimeout(resolve, 2000));
+        }
+    }
+
     hamburger.addEventListener('click', () => {
         navLinks.classList.toggle('active');
     });
@@ -499,16 +516,18 @@ document.addEventListener('DOMContentLoaded', () => {
             try {
                 const response = await fetch(`/api/video/${videoId}/create-clip`, {
                     method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
+                    headers: {'Content-Type': 'application/json', ...authHeaders()},
                     body: JSON.stringify({ start_time: startTime, end_time: endTime, short_index: index })
                 });
 
                 if (!response.ok) {
                     const errorData = await response.json();
-                    throw new Error(errorData.message || 'Failed to generate clip');
+                    throw new Error(errorData.message || errorData.detail || 'Failed to generate clip');
                 }
 
-                const data = await response.json();
+                // The clip is encoded in a background job; poll it until it finishes.
+                const job = await response.json();
+                const data = await waitForJob(job.job_id);
                 
                 // Get the title for the filename
                 const short = currentVideoData.structured_data.shorts_candidates[index];
@@ -0,0 +1,39 @@
+import asyncio
+from collections import defaultdict
+from typing import DefaultDict, Set
+
+
+class StatusChannel:
+    """
+    Per-video fan-out of transient progress messages (such as partial LLM output)
+    to the SSE listeners of that video. Messages are not persisted; Firestore
+    remains the source of truth for status.
+    """
+
+    def __init__(self, max_queue_size: int = 256):
+        self.max_queue_size = max_queue_size
+        self.subscribers: DefaultDict[str, Set[asyncio.Queue]] = defaultdict(set)
+
+    def subscribe(self, video_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self.subscribers[video_id].add(queue)
+        return queue
+
+    def unsubscribe(self, video_id: str, queue: asyncio.Queue):
+        self.subscribers[video_id].discard(queue)
+        if not self.subscribers[video_id]:
+            del self.subscribers[video_id]
+
+    def has_listeners(self, video_id: str) -> bool:
+        return bool(self.subscribers.get(video_id))
+
+    def publish(self, video_id: str, message: dict):
+        """Delivers a message to every listener, dropping the oldest one for slow listeners."""
+        for queue in self.subscribers.get(video_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+
+# Global instance of the StatusChannel
+status_channel = StatusChannel()
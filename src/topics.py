@@ -0,0 +1,270 @@
+import asyncio
+import os
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import DefaultDict, List, Optional, Tuple
+
+import numpy as np
+
+from .database import db
+from .vector_index import VectorIndex, vector_index_store
+
+TOPICS_COLLECTION = "topic_clusters"
+TOPIC_MAX_CLUSTERS = int(os.getenv("TOPIC_MAX_CLUSTERS", "12"))
+# Once this fraction of a user's videos has been assigned incrementally since the
+# last full run, the next update re-clusters everything.
+TOPIC_RECLUSTER_FRACTION = float(os.getenv("TOPIC_RECLUSTER_FRACTION", "0.25"))
+KMEANS_ITERATIONS = 50
+KMEANS_RESTARTS = 5
+LABEL_THEMES = 3
+
+
+def video_vectors(index: VectorIndex, video_ids: Optional[List[str]] = None) -> Tuple[List[str], np.ndarray]:
+    """
+    Returns one unit vector per video: the average of its mean theme vector and
+    its mean transcript-window vector, so long transcripts don't drown out themes.
+    """
+    wanted = set(video_ids) if video_ids is not None else None
+    ids, groups, rows, weights = [], [], [], []
+    positions, kind_counts = {}, defaultdict(int)
+    for item in index.items:
+        if item["kind"] in ("theme", "transcript") and (wanted is None or item["video_id"] in wanted):
+            kind_counts[(item["video_id"], item["kind"])] += 1
+    for item in index.items:
+        key = (item["video_id"], item["kind"])
+        if key not in kind_counts:
+            continue
+        if item["video_id"] not in positions:
+            positions[item["video_id"]] = len(ids)
+            ids.append(item["video_id"])
+        groups.append(positions[item["video_id"]])
+        rows.append(item["row"])
+        weights.append(1.0 / kind_counts[key])
+
+    vectors = np.zeros((len(ids), index.dim), dtype=np.float32)
+    if rows:
+        np.add.at(vectors, np.array(groups), np.asarray(index.vectors[np.array(rows)]) * np.array(weights, dtype=np.float32)[:, None])
+    return ids, _normalize(vectors)
+
+
+def member_sum(index: VectorIndex, video_ids: List[str]) -> np.ndarray:
+    """Recomputes a cluster's centroid sum from its members' current vectors."""
+    _, vectors = video_vectors(index, video_ids)
+    return vectors.sum(axis=0, dtype=np.float32) if len(vectors) else np.zeros(index.dim, dtype=np.float32)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Clusters unit vectors by cosine similarity, keeping the best of several
+    seeded runs. Returns (labels, centroid sums); the centroid of a cluster is its
+    normalized sum, which lets new members be added later without revisiting the
+    old ones.
+    """
+    runs = [_kmeans_run(vectors, k, np.random.default_rng(seed + run)) for run in range(KMEANS_RESTARTS)]
+    # A sum's norm is the total similarity of its members to their centroid.
+    return max(runs, key=lambda run: np.linalg.norm(run[1], axis=1).sum())
+
+
+def _kmeans_run(vectors: np.ndarray, k: int, rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    n = len(vectors)
+    k = min(k, n)
+
+    # k-means++ seeding on cosine distance.
+    centroids = [vectors[rng.integers(n)]]
+    distance = 1 - vectors @ centroids[0]
+    for _ in range(1, k):
+        weights = np.clip(distance, 0, None) ** 2
+        choice = rng.choice(n, p=weights / weights.sum()) if weights.sum() > 0 else rng.integers(n)
+        centroids.append(vectors[choice])
+        distance = np.minimum(distance, 1 - vectors @ vectors[choice])
+    centroids = np.array(centroids)
+
+    labels = np.full(n, -1)
+    for _ in range(KMEANS_ITERATIONS):
+        similarities = vectors @ centroids.T
+        new_labels = np.argmax(similarities, axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        # Re-seed empty clusters with the point worst served by its centroid.
+        for empty in np.flatnonzero(~sums.any(axis=1)):
+            worst = np.argmin(similarities[np.arange(n), labels])
+            sums[empty] = vectors[worst]
+            labels[worst] = empty
+        centroids = _normalize(sums)
+
+    sums = np.zeros_like(centroids)
+    np.add.at(sums, labels, vectors)
+    return labels, sums
+
+
+def cluster_count(n_videos: int) -> int:
+    return max(1, min(TOPIC_MAX_CLUSTERS, round((n_videos / 2) ** 0.5)))
+
+
+def label_clusters(index: VectorIndex, centroids: np.ndarray, members: List[List[str]]) -> List[List[str]]:
+    """Labels each cluster with the member videos' key themes closest to its centroid."""
+    themes_by_video = defaultdict(list)
+    for item in index.items:
+        if item["kind"] == "theme":
+            themes_by_video[item["video_id"]].append(item)
+
+    labels = []
+    for centroid, video_ids in zip(centroids, members):
+        themes = [theme for video_id in video_ids for theme in themes_by_video[video_id]]
+        if not themes:
+            labels.append([])
+            continue
+        scores = np.asarray(index.vectors[np.array([theme["row"] for theme in themes])]) @ centroid
+        label, seen = [], set()
+        for i in np.argsort(-scores):
+            text = themes[i]["text"].strip()
+            if text.lower() not in seen:
+                seen.add(text.lower())
+                label.append(text)
+            if len(label) == LABEL_THEMES:
+                break
+        labels.append(label)
+    return labels
+
+
+class TopicClusterer:
+    """
+    Clusters each user's videos into channel-level topics from their theme and
+    transcript embeddings, and keeps the clusters current as videos are analyzed.
+
+    State is one Firestore doc per user in `topic_clusters`, holding each
+    cluster's label, members and centroid sum (float32 bytes). New videos join
+    the nearest cluster and nudge its centroid; everything is re-clustered only
+    when enough videos have been placed that way, or on request.
+    """
+
+    def __init__(self):
+        self._locks: DefaultDict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    def _ref(self, user_id: str):
+        return db.collection(TOPICS_COLLECTION).document(user_id)
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        """Returns the user's clusters without their centroids, or None if never clustered."""
+        doc = await self._ref(user_id).get()
+        if not doc.exists:
+            return None
+        state = doc.to_dict()
+        state["clusters"] = [
+            {key: value for key, value in cluster.items() if key != "centroid_sum"} for cluster in state.get("clusters", [])
+        ]
+        return state
+
+    async def recluster(self, user_id: str):
+        """Clusters all of the user's videos from scratch."""
+        async with self._locks[user_id]:
+            await self._recluster(user_id)
+
+    async def _recluster(self, user_id: str):
+        print(f"🗂️ Re-clustering topics for user {user_id}")
+        await self._ref(user_id).set({"status": "running"}, merge=True)
+        try:
+            index = await vector_index_store.load(user_id)
+            video_ids, vectors = await asyncio.to_thread(video_vectors, index)
+            if not video_ids:
+                await self._ref(user_id).set({"status": "ready", "clusters": []})
+                return
+            labels, sums = await asyncio.to_thread(spherical_kmeans, vectors, cluster_count(len(video_ids)))
+            members = [[video_ids[i] for i in np.flatnonzero(labels == c)] for c in range(len(sums))]
+            clusters = [
+                {"id": c, "label": label, "video_ids": member_ids, "centroid_sum": sums[c].astype(np.float32).tobytes()}
+                for c, (label, member_ids) in enumerate(zip(label_clusters(index, _normalize(sums), members), members))
+            ]
+            await self._save(user_id, clusters, video_ids, incremental_assignments=0, full_run=True)
+            print(f"   ✅ Clustered {len(video_ids)} video(s) into {len(clusters)} topic(s).")
+        except Exception:
+            await self._ref(user_id).set({"status": "failed"}, merge=True)
+            raise
+
+    async def add_video(self, user_id: str, video_id: str):
+        """Places a newly analyzed video in its nearest topic, re-clustering if the topics have drifted."""
+        async with self._locks[user_id]:
+            doc = await self._ref(user_id).get()
+            state = doc.to_dict() if doc.exists else {}
+            clusters = state.get("clusters") or []
+            n_videos = sum(len(cluster["video_ids"]) for cluster in clusters) + 1
+            if not clusters or state.get("incremental_assignments", 0) + 1 > TOPIC_RECLUSTER_FRACTION * n_videos:
+                await self._recluster(user_id)
+                return
+
+            index = await vector_index_store.load(user_id)
+            ids, vectors = video_vectors(index, [video_id])
+            if not ids:
+                return
+            for cluster in clusters:
+                if video_id in cluster["video_ids"]:
+                    # Re-analyzed: its old vector is gone, so its old cluster's sum is
+                    # rebuilt without it and it is simply placed again.
+                    cluster["video_ids"].remove(video_id)
+                    cluster["centroid_sum"] = member_sum(index, cluster["video_ids"]).tobytes()
+            sums = np.stack([np.frombuffer(cluster["centroid_sum"], dtype=np.float32) for cluster in clusters])
+            nearest = int(np.argmax(_normalize(sums) @ vectors[0]))
+            sums[nearest] += vectors[0]
+            clusters[nearest]["video_ids"].append(video_id)
+            clusters[nearest]["centroid_sum"] = sums[nearest].tobytes()
+            clusters[nearest]["label"] = label_clusters(index, _normalize(sums[nearest:nearest + 1]), [clusters[nearest]["video_ids"]])[0]
+            await self._save(user_id, clusters, [video_id], incremental_assignments=state.get("incremental_assignments", 0) + 1)
+            print(f"   🗂️ Added {video_id} to topic: {', '.join(clusters[nearest]['label']) or nearest}")
+
+    async def remove_video(self, user_id: str, video_id: str):
+        """Drops a deleted video from its topic and rebuilds that topic's centroid sum without it."""
+        async with self._locks[user_id]:
+            doc = await self._ref(user_id).get()
+            if not doc.exists:
+                return
+            clusters = doc.to_dict().get("clusters") or []
+            for cluster in clusters:
+                if video_id in cluster["video_ids"]:
+                    cluster["video_ids"].remove(video_id)
+                    cluster["size"] = len(cluster["video_ids"])
+                    index = await vector_index_store.load(user_id)
+                    sums = await asyncio.to_thread(member_sum, index, cluster["video_ids"])
+                    cluster["centroid_sum"] = sums.tobytes()
+                    await self._ref(user_id).update({"clusters": clusters})
+                    return
+
+    async def _save(
+        self,
+        user_id: str,
+        clusters: List[dict],
+        changed_video_ids: List[str],
+        incremental_assignments: int,
+        full_run: bool = False,
+    ):
+        now = datetime.now(timezone.utc)
+        state = {
+            "status": "ready",
+            "clusters": [{**cluster, "size": len(cluster["video_ids"])} for cluster in clusters],
+            "incremental_assignments": incremental_assignments,
+            "updated_at": now,
+        }
+        if full_run:
+            state["clustered_at"] = now
+        await self._ref(user_id).set(state, merge=True)
+
+        # Mirror the changed videos' topics onto their docs for the library view.
+        topics = {
+            video_id: {"id": cluster["id"], "label": cluster["label"]}
+            for cluster in clusters for video_id in cluster["video_ids"]
+        }
+        for start in range(0, len(changed_video_ids), 500):
+            batch = db.batch()
+            for video_id in changed_video_ids[start:start + 500]:
+                batch.update(db.collection("videos").document(video_id), {"topic_cluster": topics[video_id]})
+            await batch.commit()
+
+
+# Global instance of the TopicClusterer
+topic_clusterer = TopicClusterer()
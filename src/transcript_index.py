@@ -0,0 +1,135 @@
+import re
+from bisect import bisect_left, bisect_right
+from typing import List, Tuple
+
+_SENTENCE_END = re.compile(r"[.!?…][\"')\]]*$")
+
+
+class TranscriptIndex:
+    """
+    A compact, bisect-searchable index over a timed transcript.
+
+    Words are stored as sorted parallel arrays of start/end times and character
+    offsets into one text string. Word times are spread over each segment in
+    proportion to word length, since the transcript is only timed per segment.
+    Sentence edges come from sentence-final punctuation and segment boundaries.
+    """
+
+    def __init__(
+        self,
+        text: str,
+        word_starts: List[float],
+        word_ends: List[float],
+        word_offsets: List[Tuple[int, int]],
+        sentence_starts: List[float],
+        sentence_ends: List[float],
+    ):
+        self.text = text
+        self.word_starts = word_starts
+        self.word_ends = word_ends
+        self.word_offsets = word_offsets
+        self.sentence_starts = sentence_starts
+        self.sentence_ends = sentence_ends
+
+    @classmethod
+    def from_segments(cls, segments: List[dict]) -> "TranscriptIndex":
+        parts, word_starts, word_ends, word_offsets = [], [], [], []
+        sentence_starts, sentence_ends = set(), set()
+        offset = 0
+
+        for segment in sorted(segments, key=lambda segment: segment["start"]):
+            words = segment["text"].split()
+            if not words:
+                continue
+            # Keep word times monotonic even if segments overlap slightly.
+            start = max(float(segment["start"]), word_ends[-1] if word_ends else 0.0)
+            end = max(float(segment["end"]), start)
+            total_chars = sum(len(word) for word in words)
+            sentence_starts.add(round(start, 3))
+            sentence_ends.add(round(end, 3))
+
+            elapsed = 0
+            at_sentence_start = False
+            for word in words:
+                word_start = start + (end - start) * elapsed / total_chars
+                elapsed += len(word)
+                word_end = start + (end - start) * elapsed / total_chars
+                if at_sentence_start:
+                    sentence_starts.add(round(word_start, 3))
+                at_sentence_start = bool(_SENTENCE_END.search(word))
+                if at_sentence_start:
+                    sentence_ends.add(round(word_end, 3))
+
+                if parts:
+                    parts.append(" ")
+                    offset += 1
+                parts.append(word)
+                word_starts.append(round(word_start, 3))
+                word_ends.append(round(word_end, 3))
+                word_offsets.append((offset, offset + len(word)))
+                offset += len(word)
+
+        return cls("".join(parts), word_starts, word_ends, word_offsets, sorted(sentence_starts), sorted(sentence_ends))
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TranscriptIndex":
+        return cls(
+            data["text"],
+            data["word_starts"],
+            data["word_ends"],
+            [tuple(offsets) for offsets in data["word_offsets"]],
+            data["sentence_starts"],
+            data["sentence_ends"],
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "text": self.text,
+            "word_starts": self.word_starts,
+            "word_ends": self.word_ends,
+            "word_offsets": [list(offsets) for offsets in self.word_offsets],
+            "sentence_starts": self.sentence_starts,
+            "sentence_ends": self.sentence_ends,
+        }
+
+    def __len__(self) -> int:
+        return len(self.word_starts)
+
+    def _word_range(self, start: float, end: float) -> Tuple[int, int]:
+        """Returns the [first, last) indexes of the words that overlap [start, end]."""
+        return bisect_right(self.word_ends, start), bisect_left(self.word_starts, end)
+
+    def query(self, start: float, end: float) -> dict:
+        """Returns the exact text and word boundaries that overlap [start, end]."""
+        first, last = self._word_range(start, end)
+        if first >= last:
+            return {"start": start, "end": end, "text": "", "words": []}
+        return {
+            "start": self.word_starts[first],
+            "end": self.word_ends[last - 1],
+            "text": self.text[self.word_offsets[first][0]:self.word_offsets[last - 1][1]],
+            "words": [
+                {
+                    "word": self.text[self.word_offsets[i][0]:self.word_offsets[i][1]],
+                    "start": self.word_starts[i],
+                    "end": self.word_ends[i],
+                }
+                for i in range(first, last)
+            ],
+        }
+
+    @staticmethod
+    def _nearest(edges: List[float], value: float) -> float:
+        i = bisect_left(edges, value)
+        candidates = edges[max(i - 1, 0):i + 1]
+        return min(candidates, key=lambda edge: abs(edge - value)) if candidates else value
+
+    def snap(self, start: float, end: float) -> Tuple[float, float]:
+        """Moves [start, end] to the nearest sentence start and sentence end."""
+        snapped_start = self._nearest(self.sentence_starts, start)
+        snapped_end = self._nearest(self.sentence_ends, end)
+        if snapped_end <= snapped_start:
+            # The nearest sentence end precedes the start; take the first one after it.
+            i = bisect_right(self.sentence_ends, snapped_start)
+            snapped_end = self.sentence_ends[i] if i < len(self.sentence_ends) else end
+        return snapped_start, snapped_end
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import os
+import re
+import time
+from bisect import bisect_right
+from collections import defaultdict
+from typing import DefaultDict, Dict, List, Optional
+
+from google.api_core.exceptions import PreconditionFailed
+from google.cloud import storage
+
+# How long a cached index is served before its blob is checked for a newer version.
+SEARCH_INDEX_CHECK_SECONDS = float(os.getenv("SEARCH_INDEX_CHECK_SECONDS", "10"))
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class TranscriptSearchIndex:
+    """
+    A positional inverted index over one user's transcripts.
+
+    Each video's segments are tokenized into one position space; `postings`
+    maps a term to the positions it occurs at per video, and each video keeps
+    the first position of every segment so hits can be mapped back to a segment
+    with bisect.
+    """
+
+    def __init__(self, videos: Optional[dict] = None, postings: Optional[dict] = None):
+        # video_id -> {"title", "segments": [[start, end, text], ...], "segment_positions": [...]}
+        self.videos: Dict[str, dict] = videos or {}
+        # term -> video_id -> sorted token positions
+        self.postings: Dict[str, Dict[str, List[int]]] = postings or {}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TranscriptSearchIndex":
+        return cls(data.get("videos"), data.get("postings"))
+
+    def to_dict(self) -> dict:
+        return {"videos": self.videos, "postings": self.postings}
+
+    def copy(self) -> "TranscriptSearchIndex":
+        """A copy that add_video and remove_video can change without touching this index."""
+        return TranscriptSearchIndex(dict(self.videos), {term: dict(videos) for term, videos in self.postings.items()})
+
+    def add_video(self, video_id: str, title: str, segments: List[dict]):
+        """Indexes a video's segments, replacing any earlier version of the video."""
+        self.remove_video(video_id)
+        rows, segment_positions = [], []
+        video_postings: DefaultDict[str, List[int]] = defaultdict(list)
+        position = 0
+        for segment in segments:
+            rows.append([segment.get("start", 0.0), segment.get("end", 0.0), segment["text"]])
+            segment_positions.append(position)
+            for term in tokenize(segment["text"]):
+                video_postings[term].append(position)
+                position += 1
+
+        self.videos[video_id] = {"title": title, "segments": rows, "segment_positions": segment_positions}
+        for term, positions in video_postings.items():
+            self.postings.setdefault(term, {})[video_id] = positions
+
+    def remove_video(self, video_id: str):
+        if self.videos.pop(video_id, None) is None:
+            return
+        for term in list(self.postings):
+            if self.postings[term].pop(video_id, None) is not None and not self.postings[term]:
+                del self.postings[term]
+
+    def search(self, query: str, limit: int = 50) -> List[dict]:
+        """
+        Finds every occurrence of `query` as a phrase. Returns hits as
+        (video_id, start, end, snippet) dicts in video and time order.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        term_postings = [self.postings.get(term, {}) for term in terms]
+        # Rarest term first keeps the candidate set small.
+        video_ids = set(min(term_postings, key=len))
+        for postings in term_postings:
+            video_ids &= postings.keys()
+
+        hits = []
+        for video_id in sorted(video_ids):
+            matches = set(term_postings[0][video_id])
+            for offset, postings in enumerate(term_postings[1:], start=1):
+                matches &= {position - offset for position in postings[video_id]}
+                if not matches:
+                    break
+
+            video = self.videos[video_id]
+            seen_segments = set()
+            for position in sorted(matches):
+                segment_index = bisect_right(video["segment_positions"], position) - 1
+                if segment_index in seen_segments:
+                    continue
+                seen_segments.add(segment_index)
+                start, end, text = video["segments"][segment_index]
+                hits.append({
+                    "video_id": video_id,
+                    "video_title": video["title"],
+                    "start": start,
+                    "end": end,
+                    "snippet": text,
+                })
+                if len(hits) >= limit:
+                    return hits
+        return hits
+
+
+class SearchIndexStore:
+    """
+    Loads, caches and saves per-user search indexes as JSON in GCS
+    (search_indexes/<user_id>.json). Indexes are loaded lazily and reloaded
+    when another instance has written a newer version, which is checked for
+    at most every SEARCH_INDEX_CHECK_SECONDS.
+    """
+
+    def __init__(self, bucket_name: str):
+        self.bucket_name = bucket_name
+        self.storage_client = storage.Client()
+        # user_id -> (GCS generation, index, monotonic time of the last generation check);
+        # generation 0 means the blob does not exist yet.
+        self._cache: Dict[str, tuple] = {}
+        self._locks: DefaultDict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    def _blob(self, user_id: str):
+        return self.storage_client.bucket(self.bucket_name).blob(f"search_indexes/{user_id}.json")
+
+    async def load(self, user_id: str) -> TranscriptSearchIndex:
+        cached = self._cache.get(user_id)
+        if cached and time.monotonic() - cached[2] < SEARCH_INDEX_CHECK_SECONDS:
+            return cached[1]
+
+        bucket = self.storage_client.bucket(self.bucket_name)
+        current = await asyncio.to_thread(bucket.get_blob, f"search_indexes/{user_id}.json")
+        if current is None:
+            # Nothing indexed yet for this user.
+            index = TranscriptSearchIndex()
+            self._cache[user_id] = (0, index, time.monotonic())
+            return index
+
+        if cached and cached[0] == current.generation:
+            self._cache[user_id] = (cached[0], cached[1], time.monotonic())
+            return cached[1]
+        data = await asyncio.to_thread(current.download_as_text)
+        index = TranscriptSearchIndex.from_dict(json.loads(data))
+        self._cache[user_id] = (current.generation, index, time.monotonic())
+        return index
+
+    async def update(self, user_id: str, apply, attempts: int = 3):
+        """
+        Applies `apply(index)` to a copy of the user's index and saves it. The
+        save only succeeds if nobody else saved in between; otherwise it is
+        retried. Searches keep using the cached index until the save succeeds.
+        """
+        async with self._locks[user_id]:
+            for attempt in range(attempts):
+                await self.load(user_id)
+                # Generation 0 means "only if the blob does not exist yet".
+                generation, cached, _ = self._cache[user_id]
+                index = cached.copy()
+                apply(index)
+                blob = self._blob(user_id)
+                try:
+                    await asyncio.to_thread(
+                        blob.upload_from_string,
+                        json.dumps(index.to_dict(), separators=(",", ":")),
+                        "application/json",
+                        if_generation_match=generation,
+                    )
+                except PreconditionFailed:
+                    self._cache.pop(user_id, None)
+                    if attempt == attempts - 1:
+                        raise
+                    continue
+                self._cache[user_id] = (blob.generation, index, time.monotonic())
+                return
+
+    async def add_video(self, user_id: str, video_id: str, title: str, segments: List[dict]):
+        await self.update(user_id, lambda index: index.add_video(video_id, title, segments))
+
+    async def remove_video(self, user_id: str, video_id: str):
+        await self.update(user_id, lambda index: index.remove_video(video_id))
+
+    async def search(self, user_id: str, query: str, limit: int = 50) -> List[dict]:
+        return (await self.load(user_id)).search(query, limit)
+
+
+# Global instance of the SearchIndexStore
+search_index_store = SearchIndexStore(os.getenv("GCS_BUCKET_NAME"))
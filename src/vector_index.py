@@ -0,0 +1,306 @@
+import asyncio
+import json
+import os
+import tempfile
+import uuid
+from collections import defaultdict
+from typing import DefaultDict, Dict, List, Optional
+
+import numpy as np
+from google.api_core.exceptions import PreconditionFailed
+from google.cloud import storage
+
+from .llm.embeddings import EMBEDDING_DIMENSIONS
+
+# Local copies of the per-user index files, memory-mapped for search.
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR") or os.path.join(tempfile.gettempdir(), "vector_indexes")
+# Up to this many candidates are scored exactly; beyond it, LSH signatures pick
+# the VECTOR_ANN_CANDIDATES closest ones to score.
+EXACT_SEARCH_LIMIT = int(os.getenv("VECTOR_EXACT_SEARCH_LIMIT", "5000"))
+ANN_CANDIDATES = int(os.getenv("VECTOR_ANN_CANDIDATES", "500"))
+# GCS caps composite objects at 1024 components and every append adds one, so
+# an index file is rewritten as a plain object once it reaches this many.
+COMPACT_COMPONENTS = int(os.getenv("VECTOR_INDEX_COMPACT_COMPONENTS", "512"))
+
+# Random-hyperplane LSH: each vector gets a 64-bit signature of which side of
+# each plane it falls on, so Hamming distance between signatures approximates
+# the angle between vectors. The planes are seeded so signatures are stable.
+SIGNATURE_BITS = 64
+_PLANES = np.random.default_rng(20240601).standard_normal((SIGNATURE_BITS, EMBEDDING_DIMENSIONS)).astype(np.float32)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+_SIGNATURE_CHUNK = 8192
+
+
+def _signatures(vectors: np.ndarray) -> np.ndarray:
+    """Returns the packed (n, 8) uint8 LSH signatures of `vectors`."""
+    return np.packbits(np.asarray(vectors, dtype=np.float32) @ _PLANES.T > 0, axis=1)
+
+
+class VectorIndex:
+    """
+    One user's embedded items, kept in two append-only files: `vectors.f32`
+    (float32 rows, memory-mapped for search) and `items.jsonl` (one metadata
+    record per item, naming its vector row).
+
+    Re-indexing a video appends a tombstone record that hides the video's
+    earlier items, so neither file is ever rewritten.
+    """
+
+    def __init__(self, directory: str, dim: int = EMBEDDING_DIMENSIONS):
+        self.directory = directory
+        self.dim = dim
+        self.items: List[dict] = []
+        self.rows = np.empty(0, dtype=np.int64)
+        self.fingerprints: Dict[str, str] = {}
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        # Signatures per vector row, including rows hidden by tombstones.
+        self.row_signatures = np.empty((0, SIGNATURE_BITS // 8), dtype=np.uint8)
+
+        os.makedirs(directory, exist_ok=True)
+        records = []
+        if os.path.exists(self.items_path):
+            with open(self.items_path, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        self._map_vectors()
+        self._apply(records)
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.directory, "vectors.f32")
+
+    @property
+    def items_path(self) -> str:
+        return os.path.join(self.directory, "items.jsonl")
+
+    @property
+    def row_count(self) -> int:
+        return len(self.vectors)
+
+    def _map_vectors(self):
+        row_bytes = self.dim * 4
+        rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        if rows:
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        # Only rows added since the last mapping need new signatures.
+        new_signatures = [
+            _signatures(self.vectors[start:min(start + _SIGNATURE_CHUNK, rows)])
+            for start in range(len(self.row_signatures), rows, _SIGNATURE_CHUNK)
+        ]
+        if new_signatures:
+            self.row_signatures = np.concatenate([self.row_signatures, *new_signatures])
+
+    def _apply(self, records: List[dict]):
+        for record in records:
+            if "deleted" in record:
+                self.items = [item for item in self.items if item["video_id"] != record["deleted"]]
+                self.fingerprints.pop(record["deleted"], None)
+            else:
+                self.items.append(record)
+                self.fingerprints[record["video_id"]] = record.get("fingerprint")
+        self.rows = np.array([item["row"] for item in self.items], dtype=np.int64)
+
+    def append(self, vector_bytes: bytes, records: List[dict]):
+        """Appends rows and records that were already written to GCS to the local files."""
+        with open(self.vectors_path, "ab") as f:
+            f.write(vector_bytes)
+        with open(self.items_path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+        self._map_vectors()
+        self._apply(records)
+
+    def video_items(self, video_id: str) -> tuple:
+        """Returns a video's items (without index bookkeeping) and their vectors."""
+        positions = [i for i, item in enumerate(self.items) if item["video_id"] == video_id]
+        items = [
+            {key: value for key, value in self.items[i].items() if key not in ("row", "fingerprint", "video_id")}
+            for i in positions
+        ]
+        vectors = np.asarray(self.vectors[self.rows[positions]]) if positions else np.empty((0, self.dim), dtype=np.float32)
+        return items, vectors
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int = 10,
+        kinds: Optional[List[str]] = None,
+        exclude_video_id: Optional[str] = None,
+    ) -> List[dict]:
+        """Returns the `k` items most similar to the unit-length `query` vector, best first."""
+        candidates = np.arange(len(self.items))
+        if kinds or exclude_video_id:
+            keep = np.array(
+                [
+                    (not kinds or item["kind"] in kinds) and item["video_id"] != exclude_video_id
+                    for item in self.items
+                ],
+                dtype=bool,
+            )
+            candidates = candidates[keep]
+        if not len(candidates):
+            return []
+
+        if len(candidates) > EXACT_SEARCH_LIMIT:
+            query_signature = _signatures(query[None, :])[0]
+            distances = _POPCOUNT[self.row_signatures[self.rows[candidates]] ^ query_signature].sum(axis=1, dtype=np.int32)
+            shortlist = min(max(ANN_CANDIDATES, k * 10), len(candidates))
+            candidates = candidates[np.argpartition(distances, shortlist - 1)[:shortlist]]
+
+        scores = np.asarray(self.vectors[self.rows[candidates]]) @ query
+        best = np.argsort(-scores)[:k]
+        return [
+            {
+                **{key: value for key, value in self.items[candidates[i]].items() if key not in ("row", "fingerprint")},
+                "score": round(float(scores[i]), 4),
+            }
+            for i in best
+        ]
+
+
+class VectorIndexStore:
+    """
+    Keeps per-user vector indexes in GCS (vector_indexes/<user_id>/) with a local,
+    memory-mapped copy on each worker. New items are appended to the GCS blobs
+    with compose, guarded by generation preconditions, and to the local files, so
+    an update rarely rewrites the whole index: only when a blob nears the
+    composite component limit is it rewritten in one piece, with tombstoned
+    records dropped. Local copies are re-downloaded only when another worker
+    has written since.
+    """
+
+    FILES = ("items.jsonl", "vectors.f32")
+
+    def __init__(self, bucket_name: str):
+        self.bucket_name = bucket_name
+        self.storage_client = storage.Client()
+        # user_id -> ((items generation, vectors generation), index)
+        self._indexes: Dict[str, tuple] = {}
+        # user_id -> largest component count of its index blobs, as of the cached generations
+        self._components: Dict[str, int] = {}
+        self._locks: DefaultDict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    def _path(self, user_id: str, name: str) -> str:
+        return f"vector_indexes/{user_id}/{name}"
+
+    def _download(self, user_id: str, blobs: list) -> VectorIndex:
+        directory = os.path.join(VECTOR_INDEX_DIR, user_id)
+        os.makedirs(directory, exist_ok=True)
+        for name, blob in zip(self.FILES, blobs):
+            local_path = os.path.join(directory, name)
+            if blob is None:
+                if os.path.exists(local_path):
+                    os.remove(local_path)
+                continue
+            # Replace rather than overwrite, so indexes still mapping the old file keep working.
+            partial_path = f"{local_path}.{uuid.uuid4().hex}"
+            blob.download_to_filename(partial_path)
+            os.replace(partial_path, local_path)
+        return VectorIndex(directory)
+
+    async def load(self, user_id: str) -> VectorIndex:
+        bucket = self.storage_client.bucket(self.bucket_name)
+        blobs = await asyncio.gather(
+            *(asyncio.to_thread(bucket.get_blob, self._path(user_id, name)) for name in self.FILES)
+        )
+        generations = tuple(blob.generation if blob else None for blob in blobs)
+        self._components[user_id] = max((blob.component_count or 1) if blob else 0 for blob in blobs)
+        cached = self._indexes.get(user_id)
+        if cached and cached[0] == generations:
+            return cached[1]
+
+        index = await asyncio.to_thread(self._download, user_id, blobs)
+        self._indexes[user_id] = (generations, index)
+        return index
+
+    def _append_blob(self, user_id: str, name: str, data: bytes, generation: Optional[int], content_type: str) -> int:
+        bucket = self.storage_client.bucket(self.bucket_name)
+        target = bucket.blob(self._path(user_id, name))
+        if not generation:
+            target.upload_from_string(data, content_type, if_generation_match=0)
+            return target.generation
+
+        part = bucket.blob(f"{target.name}.{uuid.uuid4().hex}.part")
+        part.upload_from_string(data, content_type)
+        try:
+            target.content_type = content_type
+            target.compose([target, part], if_generation_match=generation)
+        finally:
+            part.delete()
+        return target.generation
+
+    def _rewrite_blob(self, user_id: str, name: str, data: bytes, generation: Optional[int], content_type: str) -> int:
+        target = self.storage_client.bucket(self.bucket_name).blob(self._path(user_id, name))
+        target.upload_from_string(data, content_type, if_generation_match=generation or 0)
+        return target.generation
+
+    def _compact(self, user_id: str, index: VectorIndex, video_id: str, records: List[dict], vector_bytes: bytes, generations: tuple):
+        """
+        Rewrites both blobs as plain objects holding the live items plus the new
+        ones. Vector rows keep their numbers, so the vectors file (written first)
+        stays valid for the old items file if the items rewrite loses a race;
+        rows of removed items are left in place.
+        """
+        items_generation, vectors_generation = generations
+        vectors_data = b""
+        if os.path.exists(index.vectors_path):
+            with open(index.vectors_path, "rb") as f:
+                vectors_data = f.read()
+        vectors_data += vector_bytes
+        live = [item for item in index.items if item["video_id"] != video_id] + [record for record in records if "deleted" not in record]
+        lines = "".join(json.dumps(record) + "\n" for record in live).encode("utf-8")
+        self._rewrite_blob(user_id, "vectors.f32", vectors_data, vectors_generation, "application/octet-stream")
+        self._rewrite_blob(user_id, "items.jsonl", lines, items_generation, "application/x-ndjson")
+        print(f"   🧹 Compacted the vector index of user {user_id} ({len(live)} items).")
+
+    async def add_video(self, user_id: str, video_id: str, items: List[dict], vectors: np.ndarray, fingerprint: str, attempts: int = 3):
+        """Replaces a video's items in the user's index with `items` and their `vectors`."""
+        async with self._locks[user_id]:
+            for attempt in range(attempts):
+                index = await self.load(user_id)
+                items_generation, vectors_generation = self._indexes[user_id][0]
+                # Rows are numbered from the end of the vector file; rows left by an
+                # interrupted append are simply never referenced.
+                records = [{"deleted": video_id}] + [
+                    {**item, "video_id": video_id, "row": index.row_count + i, "fingerprint": fingerprint}
+                    for i, item in enumerate(items)
+                ]
+                vector_bytes = np.ascontiguousarray(vectors, dtype=np.float32).tobytes()
+                lines = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+                try:
+                    if self._components.get(user_id, 0) >= COMPACT_COMPONENTS:
+                        await asyncio.to_thread(
+                            self._compact, user_id, index, video_id, records, vector_bytes, (items_generation, vectors_generation)
+                        )
+                        # The next load downloads the compacted files.
+                        self._indexes.pop(user_id, None)
+                        return
+                    vectors_generation = await asyncio.to_thread(
+                        self._append_blob, user_id, "vectors.f32", vector_bytes, vectors_generation, "application/octet-stream"
+                    )
+                    items_generation = await asyncio.to_thread(
+                        self._append_blob, user_id, "items.jsonl", lines, items_generation, "application/x-ndjson"
+                    )
+                except PreconditionFailed:
+                    self._indexes.pop(user_id, None)
+                    if attempt == attempts - 1:
+                        raise
+                    continue
+                await asyncio.to_thread(index.append, vector_bytes, records)
+                self._indexes[user_id] = ((items_generation, vectors_generation), index)
+                self._components[user_id] = self._components.get(user_id, 0) + 1
+                return
+
+    async def remove_video(self, user_id: str, video_id: str):
+        """Hides a video's items from search."""
+        await self.add_video(user_id, video_id, [], np.empty((0, EMBEDDING_DIMENSIONS), dtype=np.float32), "")
+
+    async def fingerprint(self, user_id: str, video_id: str) -> Optional[str]:
+        """Returns the fingerprint of the content a video was last indexed with, if any."""
+        return (await self.load(user_id)).fingerprints.get(video_id)
+
+    async def search(self, user_id: str, query: np.ndarray, k: int = 10, **filters) -> List[dict]:
+        index = await self.load(user_id)
+        return await asyncio.to_thread(index.search, query, k, **filters)
+
+
+# Global instance of the VectorIndexStore
+vector_index_store = VectorIndexStore(os.getenv("GCS_BUCKET_NAME"))
@@ -1,4 +1,5 @@
 import subprocess
+import tempfile
 import ffmpeg
 import os
 
@@ -56,4 +57,38 @@ def create_vertical_clip(input_path: str, output_path: str, start_time: float, e
         raise e
     except Exception as e:
         print('An error occurred:', str(e))
-        raise e 
\ No newline at end of file
+        raise e 
+
+
+def extract_audio(video_bytes: bytes, sample_rate: int = 16000, ffmpeg_path: str = None):
+    """
+    Decodes the audio track of a video into mono float32 samples in [-1, 1].
+
+    Args:
+        video_bytes: The video file contents.
+        sample_rate: The sample rate to resample the audio to.
+        ffmpeg_path: The ffmpeg binary, or the directory containing it. Defaults to 'ffmpeg' on PATH.
+    """
+    import numpy as np
+
+    ffmpeg_binary = ffmpeg_path or 'ffmpeg'
+    if os.path.isdir(ffmpeg_binary):
+        ffmpeg_binary = os.path.join(ffmpeg_binary, 'ffmpeg')
+
+    # Containers like MP4 need a seekable input, so the bytes go through a temp file.
+    with tempfile.NamedTemporaryFile(suffix='.video') as video_file:
+        video_file.write(video_bytes)
+        video_file.flush()
+        cmd = [
+            ffmpeg_binary,
+            '-nostdin',
+            '-loglevel', 'error',
+            '-i', video_file.name,
+            '-vn',
+            '-ac', '1',
+            '-ar', str(sample_rate),
+            '-f', 's16le',
+            'pipe:1'
+        ]
+        result = subprocess.run(cmd, check=True, capture_output=True)
+    return np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32) / 32768.0
@@ -0,0 +1,75 @@
+import asyncio
+import inspect
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+STARTING = "starting"
+READY = "ready"
+# Warm-up finished, but some components failed to initialize.
+DEGRADED = "degraded"
+
+# A named step: a blocking callable (run in a thread) or a coroutine function.
+Component = Tuple[str, Callable]
+
+
+class WarmUp:
+    """
+    Initializes the agents and models at startup and tracks readiness for
+    /health. Groups of components are built concurrently, each blocking step
+    in its own thread; the components within a group are built in order,
+    because handlers of the same event run in the order they subscribed.
+    """
+
+    def __init__(self):
+        self.state = STARTING
+        self.started_at = time.monotonic()
+        self.total_seconds: Optional[float] = None
+        self.components: Dict[str, dict] = {}
+        self.results: Dict[str, object] = {}
+
+    async def _build(self, name: str, fn: Callable) -> bool:
+        started = time.monotonic()
+        try:
+            if inspect.iscoroutinefunction(fn):
+                self.results[name] = await fn()
+            else:
+                self.results[name] = await asyncio.to_thread(fn)
+            self.components[name] = {"ok": True, "seconds": round(time.monotonic() - started, 3)}
+            print(f"   ✅ {name} initialized in {time.monotonic() - started:.2f}s")
+            return True
+        except Exception as e:
+            self.components[name] = {"ok": False, "seconds": round(time.monotonic() - started, 3), "error": str(e)}
+            print(f"   🚨 {name} failed to initialize after {time.monotonic() - started:.2f}s: {e}")
+            return False
+
+    def fail(self, name: str, error: str):
+        """Records a component that cannot be built, e.g. for missing configuration."""
+        self.components[name] = {"ok": False, "seconds": 0.0, "error": error}
+
+    async def _build_group(self, group: List[Component]):
+        for name, fn in group:
+            await self._build(name, fn)
+
+    async def run(self, groups: List[List[Component]]):
+        """Builds every group concurrently and returns once all components are done (or failed)."""
+        await asyncio.gather(*(self._build_group(group) for group in groups))
+
+    def finish(self):
+        self.total_seconds = round(time.monotonic() - self.started_at, 3)
+        self.state = READY if all(component["ok"] for component in self.components.values()) else DEGRADED
+        print(f"⚪️ Warm-up {self.state} in {self.total_seconds:.2f}s.")
+
+    @property
+    def finished(self) -> bool:
+        return self.state != STARTING
+
+    def status(self) -> dict:
+        return {
+            "status": self.state,
+            "seconds": self.total_seconds if self.finished else round(time.monotonic() - self.started_at, 3),
+            "components": self.components,
+        }
+
+
+# Global instance of the WarmUp
+warm_up = WarmUp()
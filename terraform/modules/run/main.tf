@@ -17,6 +17,16 @@ resource "google_cloud_run_service" "default" {
       service_account_name = google_service_account.run.email
       containers {
         image = "us-docker.pkg.dev/cloudrun/container/hello" # Placeholder image
+
+        # /health answers 503 until the agents have warmed up, so no traffic is sent before then.
+        startup_probe {
+          http_get {
+            path = "/health"
+          }
+          period_seconds    = 5
+          timeout_seconds   = 3
+          failure_threshold = 48
+        }
       }
     }
   }